@@ -1,12 +1,16 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
 from django.urls import path
 from django.shortcuts import render
 from django import forms
-from django.http import HttpResponseRedirect
+from django.db.models import Count
 from django.urls import reverse
-from .models import CustomUser, Wallet, Account, Transaction
+from django.utils.html import format_html
+from .conversions import check_conversion, convert_transactions
+from .exceptions import CurrencyConversionException
+from .models import CustomUser, Wallet, Account, Transaction, ExchangeRate, CurrencyConversionJob, ArchivedTransaction
 from django.contrib.auth.admin import UserAdmin
-from .utils import convert_currency
 
 class CustomUserAdmin(UserAdmin):
     fieldsets = (
@@ -27,47 +31,119 @@ class CustomUserAdmin(UserAdmin):
 
 class WalletAdmin(admin.ModelAdmin):
     list_display = ('owner', 'balance', 'date_opened', 'date_closed', 'is_closed')
+    list_select_related = ('owner',)
     search_fields = ('owner__username', 'owner__email')
     readonly_fields = ('date_opened', 'date_closed')
 
 class AccountAdmin(admin.ModelAdmin):
     list_display = ('owner', 'account_type', 'date_created', 'currency', 'tier', 'accountant')
+    list_select_related = ('owner', 'accountant')
     search_fields = ('owner__username', 'owner__email')
     readonly_fields = ('date_created',)
 
 class CurrencyConversionForm(forms.Form):
-    amount = forms.DecimalField(max_digits=10, decimal_places=2)
-    from_currency = forms.CharField(max_length=10)
     to_currency = forms.CharField(max_length=10)
 
+    def clean_to_currency(self):
+        return self.cleaned_data['to_currency'].upper()
+
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ('performed_by', 'transaction_type', 'currency', 'category', 'date_created', 'amount', 'transaction_id')
+    list_select_related = ('performed_by',)
     search_fields = ('performed_by__username', 'performed_by__email', 'transaction_id')
     readonly_fields = ('date_created',)
     actions = ['convert_currency']
 
     def convert_currency(self, request, queryset):
-        if 'apply' in request.POST:
-            form = CurrencyConversionForm(request.POST)
-            if form.is_valid():
-                amount = form.cleaned_data['amount']
-                from_currency = form.cleaned_data['from_currency']
-                to_currency = form.cleaned_data['to_currency']
-                converted_amount = convert_currency(amount, from_currency, to_currency)
-                self.message_user(request, f"Converted {amount} {from_currency} to {converted_amount} {to_currency}")
-                return HttpResponseRedirect(request.get_full_path())
-        else:
-            form = CurrencyConversionForm(initial={
-                'amount': queryset[0].amount,
-                'from_currency': queryset[0].currency,
-                'to_currency': 'USD',  # Default target currency, change as needed
-            })
-        
-        return render(request, 'admin/currency_conversion.html', {'form': form, 'transactions': queryset})
-
-    convert_currency.short_description = "Convert selected transactions"
+        form = CurrencyConversionForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            to_currency = form.cleaned_data['to_currency']
+            transaction_ids = list(queryset.exclude(currency=to_currency).order_by('pk').values_list('pk', flat=True))
+            try:
+                check_conversion(transaction_ids, to_currency)
+            except CurrencyConversionException as e:
+                self.message_user(request, f"Nothing was converted: {e.detail}", messages.ERROR)
+                return None
+            if len(transaction_ids) > settings.CONVERSION_SYNC_LIMIT:
+                job = CurrencyConversionJob.objects.create(
+                    to_currency=to_currency, transaction_ids=transaction_ids, total=len(transaction_ids),
+                    created_by=request.user,
+                )
+                url = reverse('admin:API_currencyconversionjob_change', args=[job.pk])
+                self.message_user(request, format_html(
+                    'Queued <a href="{}">conversion job {}</a> for {} transactions to {}.',
+                    url, job.pk, len(transaction_ids), to_currency,
+                ))
+                return None
+            try:
+                converted = convert_transactions(transaction_ids, to_currency)
+            except CurrencyConversionException as e:
+                self.message_user(request, str(e.detail), messages.ERROR)
+                return None
+            self.message_user(request, f"Converted {converted} transactions to {to_currency}.")
+            return None
+
+        return render(request, 'admin/currency_conversion.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Convert selected transactions',
+            'opts': self.model._meta,
+            'form': form,
+            'currencies': queryset.order_by('currency').values('currency').annotate(count=Count('pk')),
+            'select_across': request.POST.get('select_across') == '1',
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
+
+    convert_currency.short_description = "Convert selected transactions (into their holders' account currency only)"
+
+@admin.register(CurrencyConversionJob)
+class CurrencyConversionJobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'to_currency', 'status', 'progress', 'converted', 'created_by', 'date_created', 'date_finished')
+    list_filter = ('status',)
+    list_select_related = ('created_by',)
+    exclude = ('transaction_ids',)
+    actions = ['requeue']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Progress')
+    def progress(self, job):
+        percent = job.processed * 100 // job.total if job.total else 100
+        return f'{job.processed}/{job.total} ({percent}%)'
+
+    @admin.action(description='Re-run selected failed jobs')
+    def requeue(self, request, queryset):
+        requeued = queryset.filter(status='failed').update(status='pending', date_finished=None)
+        self.message_user(request, f"Requeued {requeued} jobs.")
+
+@admin.register(ArchivedTransaction)
+class ArchivedTransactionAdmin(admin.ModelAdmin):
+    list_display = ('performed_by', 'transaction_type', 'currency', 'category', 'date_created', 'amount', 'transaction_id')
+    list_select_related = ('performed_by',)
+    date_hierarchy = 'month'
+    search_fields = ('performed_by__username', 'performed_by__email', 'transaction_id')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # Deleting here would bypass the ledger.
+        return False
 
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(Wallet, WalletAdmin)
 admin.site.register(Account, AccountAdmin)
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ('base', 'quote', 'rate', 'fetched_at')
+    list_filter = ('base',)
+    search_fields = ('quote',)
@@ -0,0 +1,75 @@
+import datetime
+
+from django.conf import settings
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from .conditional import bump_versions
+from .filters import parse_bound
+from .ledger import take_snapshots
+from .models import ArchivedTransaction, ArchiveWatermark, Transaction, Wallet
+
+WATERMARK_NAME = 'transaction_archive'
+ARCHIVED_FIELDS = ('performed_by_id', 'transaction_type', 'currency', 'category', 'date_created', 'amount',
+                   'transaction_id')
+
+def archive_cutoff():
+    """Transactions created before this may be archived; None until the first archive run."""
+    return ArchiveWatermark.objects.filter(name=WATERMARK_NAME).values_list('cutoff', flat=True).first()
+
+def reaches_archive(params):
+    """
+    Whether a listing filtered by the date_from/date_to query parameters
+    needs archived rows. Undated listings read the hot table only.
+    """
+    if not params.get('date_from') and not params.get('date_to'):
+        return False
+    cutoff = archive_cutoff()
+    if cutoff is None:
+        return False
+    return not params.get('date_from') or parse_bound(params['date_from'], 'date_from') < cutoff
+
+def month_of(when):
+    return when.astimezone(datetime.timezone.utc).date().replace(day=1)
+
+def archive_transactions(horizon_days=None, chunk_size=None, progress=None):
+    """
+    Move transactions older than ``horizon_days`` into ArchivedTransaction,
+    oldest first, one chunk per database transaction, so an interrupted run
+    resumes where it stopped. Rollups read archived rows too, so they need
+    no catching up first. Wallets get a fresh balance snapshot first so
+    reconciliation never needs archived rows. ``progress(moved)`` is
+    called after each chunk. Returns the number of transactions moved.
+    """
+    config = settings.TRANSACTION_ARCHIVE
+    horizon_days = config['HORIZON_DAYS'] if horizon_days is None else horizon_days
+    chunk_size = chunk_size or config['CHUNK_SIZE']
+    with atomic():
+        watermark, _ = ArchiveWatermark.objects.select_for_update().get_or_create(name=WATERMARK_NAME)
+        cutoff = timezone.now() - datetime.timedelta(days=horizon_days)
+        # The cutoff only moves forward: rows below an earlier one may already be archived.
+        if watermark.cutoff is None or cutoff > watermark.cutoff:
+            watermark.cutoff = cutoff
+            watermark.save(update_fields=['cutoff'])
+        cutoff = watermark.cutoff
+    take_snapshots(Wallet.objects.exclude(balance_snapshots__taken_at__gte=cutoff))
+
+    moved = 0
+    while True:
+        with atomic():
+            rows = list(Transaction.objects.select_for_update().filter(date_created__lt=cutoff)
+                        .order_by('date_created', 'pk').values('pk', *ARCHIVED_FIELDS)[:chunk_size])
+            if not rows:
+                break
+            ids = [row.pop('pk') for row in rows]
+            ArchivedTransaction.objects.bulk_create([
+                ArchivedTransaction(id=pk, month=month_of(row['date_created']), **row) for pk, row in zip(ids, rows)
+            ])
+            # QuerySet.delete() would send post_delete for every row, reversing each out of the ledger;
+            # archived rows still count towards balances, they just live in the other table now.
+            Transaction.objects.filter(pk__in=ids)._raw_delete(Transaction.objects.db)
+            bump_versions('transaction')
+        moved += len(rows)
+        if progress is not None:
+            progress(moved)
+    return moved
@@ -0,0 +1,142 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import CustomUser
+from .principal import get_principal
+
+STATELESS_CLAIMS = ('user_type', 'tier', 'currency')
+# Access tokens carry the jti of the refresh token they were issued from, so revoking one revokes both.
+REFRESH_JTI_CLAIM = 'refresh_jti'
+
+def claims_changed_key(user_id):
+    return f'jwt:claims-changed:{user_id}'
+
+def revoked_key(jti):
+    return f'jwt:revoked:{jti}'
+
+def revocation_cache():
+    return caches[settings.JWT_REVOCATION_CACHE]
+
+def revoke_token(token):
+    """Deny ``token`` and the refresh token it was issued from until they would have expired anyway."""
+    cache = revocation_cache()
+    cache.set(revoked_key(token[api_settings.JTI_CLAIM]), True, max(int(token['exp'] - time.time()), 1))
+    refresh_jti = token.get(REFRESH_JTI_CLAIM)
+    if refresh_jti and refresh_jti != token[api_settings.JTI_CLAIM]:
+        cache.set(revoked_key(refresh_jti), True, int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()))
+
+def mark_claims_changed(user_id):
+    """
+    Stop trusting the claims of tokens issued to ``user_id`` before now. Kept
+    as long as a refresh token lives, since access tokens refreshed from an
+    older one would otherwise carry its claims again.
+    """
+    lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+    revocation_cache().set(claims_changed_key(user_id), time.time(), lifetime.total_seconds())
+
+def check_token(validated_token):
+    """
+    Raise AuthenticationFailed if ``validated_token`` or its refresh token
+    was revoked. Returns when the user's claims last changed (0 if not
+    recently), read in the same cache round trip.
+    """
+    jtis = {validated_token.get(api_settings.JTI_CLAIM), validated_token.get(REFRESH_JTI_CLAIM)} - {None}
+    changed_key = claims_changed_key(validated_token.get(api_settings.USER_ID_CLAIM))
+    state = revocation_cache().get_many([changed_key, *(revoked_key(jti) for jti in jtis)])
+    if any(state.get(revoked_key(jti)) for jti in jtis):
+        raise AuthenticationFailed(_("Token has been revoked."), code="token_revoked")
+    return state.get(changed_key, 0)
+
+class PrincipalJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that loads the user together with their primary
+    account in one query, so the rest of the request reads them from memory.
+    Revoked tokens are rejected.
+    """
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        self.claims_changed_at = check_token(validated_token)
+        return validated_token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = get_principal(user_id).user
+        except CustomUser.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+class PreauthenticatedJWTAuthentication(PrincipalJWTAuthentication):
+    """
+    PrincipalJWTAuthentication that takes the (user, token) already stored
+    on the request as ``jwt_auth``, so a view the request is handed on to
+    doesn't decode the token and load the principal a second time.
+    """
+
+    def authenticate(self, request):
+        return getattr(request._request, 'jwt_auth', None) or super().authenticate(request)
+
+class ClaimsUser(TokenUser):
+    """Token-backed user exposing the user_type, tier and currency claims."""
+
+    @cached_property
+    def user_type(self):
+        return self.token['user_type']
+
+    @cached_property
+    def tier(self):
+        return self.token['tier']
+
+    @cached_property
+    def currency(self):
+        return self.token['currency']
+
+class StatelessJWTAuthentication(PrincipalJWTAuthentication):
+    """
+    Opt-in alternative to PrincipalJWTAuthentication: authorizes safe (read)
+    requests straight from the token's claims without loading the user.
+    Writes, tokens issued without the claims and tokens whose claims predate
+    the user's last account change take the database path. Revoked tokens
+    are rejected either way.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        claims_current = validated_token.get('claims_at', 0) >= self.claims_changed_at
+        if request.method in SAFE_METHODS and claims_current and all(claim in validated_token for claim in STATELESS_CLAIMS):
+            if user_id is None:
+                raise InvalidToken(_("Token contained no recognizable user identification"))
+            return ClaimsUser(validated_token), validated_token
+        return self.get_user(validated_token), validated_token
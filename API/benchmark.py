@@ -0,0 +1,223 @@
+import itertools
+import json
+import math
+import statistics
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, reset_queries
+from django.db.transaction import atomic
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .ingest import bulk_insert
+from .models import CustomUser, Wallet, Account, Transaction, TransactionDailyRollup
+from .rollups import refresh_rollups
+from .serializers import ClaimsTokenObtainPairSerializer
+
+MEMORY_SAMPLES = 5
+CURRENCIES = ('USD', 'EUR', 'ZAR', 'GBP')
+USER_TYPES = [user_type for user_type, _ in CustomUser.USER_TYPES]
+TIERS = [tier for tier, _ in Account.TIERS]
+ACCOUNT_TYPES = [account_type for account_type, _ in Account.ACCOUNT_TYPES]
+TRANSACTION_TYPES = [transaction_type for transaction_type, _ in Transaction.TRANSACTION_TYPES]
+CATEGORIES = [category for category, _ in Transaction.CATEGORIES]
+
+# Stub upstream quotes, {base: {quote: rate}}, so no request leaves the process.
+FX_FIXTURE_RATES = {
+    'USD': {'USD': '1', 'EUR': '0.92', 'ZAR': '18.5', 'GBP': '0.79'},
+}
+
+def fx_settings(latency=0):
+    return {
+        'BACKEND': 'API.rate_clients.FixtureBackend',
+        'BACKEND_OPTIONS': {'rates': FX_FIXTURE_RATES, 'latency': latency},
+        'UPSTREAM': 'API.rate_clients.FixtureBackend',
+        'UPSTREAM_OPTIONS': {'rates': FX_FIXTURE_RATES, 'latency': latency},
+        'SHARED_CACHE': None,
+    }
+
+def throttle_settings():
+    """THROTTLING with every bucket large enough never to refuse, so runs still pay for the token bookkeeping."""
+    return {
+        **settings.THROTTLING,
+        'RATES': {scope: {plan: rate and '1000000/s' for plan, rate in rates.items()}
+                  for scope, rates in settings.THROTTLING['RATES'].items()},
+    }
+
+def seed(users, transactions, batch_size=5000):
+    """
+    Create ``users`` users cycling through every user_type, each with a wallet
+    and an account across tiers and currencies, plus ``transactions``
+    transactions spread over them in their account currency. Wallets and
+    transactions go through the same write path as the API (opening
+    snapshots, ledger postings, dirty rollup days), then the rollups are built.
+    """
+    password = make_password(None)
+    CustomUser.objects.bulk_create([
+        CustomUser(username=f'bench-{i}', password=password, user_type=USER_TYPES[i % len(USER_TYPES)])
+        for i in range(users)
+    ], batch_size=batch_size)
+    user_ids = list(CustomUser.objects.filter(username__startswith='bench-').order_by('pk').values_list('pk', flat=True))
+    accountant_id = CustomUser.objects.filter(username__startswith='bench-', user_type='accountant').values_list('pk', flat=True).first()
+    # Currency steps once per round of user types so every type gets every currency.
+    currencies = [CURRENCIES[i // len(USER_TYPES) % len(CURRENCIES)] for i in range(len(user_ids))]
+    Account.objects.bulk_create([
+        Account(owner_id=user_id, account_type=ACCOUNT_TYPES[i % len(ACCOUNT_TYPES)], currency=currencies[i],
+                tier=TIERS[i % len(TIERS)], accountant_id=accountant_id)
+        for i, user_id in enumerate(user_ids)
+    ], batch_size=batch_size)
+    with atomic():
+        for user_id in user_ids:
+            Wallet.objects.create(owner_id=user_id, balance=Decimal('1000.00'))
+    rows = (
+        Transaction(
+            performed_by_id=user_ids[i % len(user_ids)],
+            transaction_type=TRANSACTION_TYPES[i % len(TRANSACTION_TYPES)],
+            currency=currencies[i % len(user_ids)],
+            category=CATEGORIES[i % len(CATEGORIES)],
+            amount=Decimal(i % 100000) / 100,
+            transaction_id=f'bench-{i}',
+        )
+        for i in range(transactions)
+    )
+    while batch := list(itertools.islice(rows, batch_size)):
+        bulk_insert(batch, batch_size)
+    refresh_rollups()
+
+def calibrate(rounds=5):
+    """
+    Best time in milliseconds of a fixed CPU-bound workload, stored with the
+    results so timings from a different machine can be scaled to this one.
+    """
+    best = math.inf
+    for _ in range(rounds):
+        start = time.perf_counter()
+        json.dumps([{'id': i, 'amount': f'{Decimal(i) / 100:f}'} for i in range(20000)])
+        best = min(best, time.perf_counter() - start)
+    return round(best * 1000, 3)
+
+def client_for(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsTokenObtainPairSerializer.get_token(user).access_token}')
+    return client
+
+def scenarios(request_count):
+    """
+    Yield (name, send) pairs; ``send()`` makes one request and returns the
+    response. Create scenarios use a fresh actor or payload on every call.
+    """
+    reader = CustomUser.objects.filter(username__startswith='bench-', user_type='paid', account__tier='tier3',
+                                       account__currency='USD').first()
+    accountant = CustomUser.objects.filter(username__startswith='bench-', user_type='accountant').first()
+    reader_client = client_for(reader)
+    accountant_client = client_for(accountant)
+    wallet = Wallet.objects.filter(owner=reader).first()
+    account = Account.objects.filter(owner=reader).first()
+    transaction = Transaction.objects.filter(performed_by=reader).first()
+    rollup = TransactionDailyRollup.objects.first()
+    counter = itertools.count()
+
+    # One wallet per user, so every wallet create needs a user without one.
+    password = make_password(None)
+    walletless = CustomUser.objects.bulk_create([
+        CustomUser(username=f'bench-walletless-{i}', password=password, user_type='paid')
+        for i in range(request_count + MEMORY_SAMPLES)
+    ])
+    walletless_clients = iter([(user.pk, client_for(user)) for user in walletless])
+
+    def create_wallet():
+        # WalletSerializer requires owner even though perform_create sets it.
+        owner_id, client = next(walletless_clients)
+        return client.post('/api/wallets/', {'owner': owner_id, 'balance': '0.00'}, format='json')
+
+    def create_transaction(currency):
+        return reader_client.post('/api/transactions/', {
+            'transaction_type': 'debit', 'currency': currency, 'category': 'payments', 'amount': '10.00',
+            'transaction_id': f'bench-create-{next(counter)}', 'performed_by': reader.pk,
+        }, format='json')
+
+    for resource, obj in (('wallets', wallet), ('accounts', account), ('transactions', transaction),
+                          ('rollups', rollup)):
+        yield f'{resource}.list', lambda resource=resource: reader_client.get(f'/api/{resource}/')
+        yield f'{resource}.retrieve', lambda resource=resource, obj=obj: reader_client.get(f'/api/{resource}/{obj.pk}/')
+    yield 'wallets.create', create_wallet
+    yield 'accounts.create', lambda: accountant_client.post('/api/accounts/', {
+        'owner': reader.pk, 'account_type': 'savings', 'currency': 'USD', 'tier': 'tier2',
+    }, format='json')
+    yield 'transactions.create', lambda: create_transaction('USD')
+    yield 'transactions.create_converted', lambda: create_transaction('EUR')
+    yield 'conversion', lambda: reader_client.post('/currency-conversion/', {
+        'amount': '100.00', 'from_currency': 'EUR', 'to_currency': 'ZAR',
+    })
+    yield 'conversion.async', lambda: reader_client.post('/async/currency-conversion/', {
+        'amount': '100.00', 'from_currency': 'EUR', 'to_currency': 'ZAR',
+    })
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+def measure(send, request_count):
+    """Latency percentiles, queries per request and peak traced memory for ``request_count`` calls of ``send``."""
+    timings = []
+    queries = []
+    for _ in range(request_count):
+        # CaptureQueriesContext counts nothing once the bounded query log is full.
+        reset_queries()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = send()
+            timings.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            raise AssertionError(f'{response.status_code}: {response.content[:500]!r}')
+        queries.append(len(captured.captured_queries))
+    # tracemalloc slows allocation down, so memory is sampled apart from the timings.
+    peak = 0
+    for _ in range(MEMORY_SAMPLES):
+        tracemalloc.start()
+        send()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {
+        'requests': request_count,
+        'mean_ms': round(statistics.fmean(timings) * 1000, 3),
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 3),
+        'p90_ms': round(percentile(timings, 0.90) * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+        'queries': max(queries),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+def compare(results, baseline, tolerance, min_delta_ms=1.0, min_delta_kb=16.0):
+    """
+    List regressions of ``results`` against ``baseline``: p50/p90 latency up
+    by more than ``tolerance`` (a fraction) and ``min_delta_ms``, memory up by
+    more than ``tolerance`` and ``min_delta_kb``, or any extra query. Baseline
+    latencies are first scaled by the ratio of the two runs' calibration
+    times, when both have one. p99 rests on a handful of samples per run, so
+    it is reported but not compared.
+    """
+    scale = 1
+    if results.get('calibration_ms') and baseline.get('calibration_ms'):
+        scale = results['calibration_ms'] / baseline['calibration_ms']
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        for metric, factor, slack in (('p50_ms', scale, min_delta_ms), ('p90_ms', scale, min_delta_ms),
+                                      ('peak_memory_kb', 1, min_delta_kb)):
+            expected = previous[metric] * factor
+            if current[metric] > max(expected * (1 + tolerance), expected + slack):
+                regressions.append(f'{name} {metric}: {current[metric]} vs baseline {round(expected, 3)}')
+        if current['queries'] > previous['queries']:
+            regressions.append(f"{name} queries: {current['queries']} vs baseline {previous['queries']}")
+    return regressions
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+
+
+@register(Tags.caches, deploy=True)
+def check_throttle_cache(app_configs, **kwargs):
+    """Token buckets in a local memory cache only throttle the worker that holds them."""
+    alias = settings.THROTTLING['CACHE']
+    if isinstance(caches[alias], LocMemCache):
+        return [Error(
+            f"THROTTLING['CACHE'] is the local memory cache {alias!r}, so every worker process keeps its own buckets.",
+            hint="Point it at a cache shared by all workers, e.g. 'shared' with CACHE_REDIS_URL set.",
+            id='API.E001',
+        )]
+    return []
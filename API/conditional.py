@@ -0,0 +1,101 @@
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.transaction import on_commit
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+def conditional_cache():
+    return caches[settings.CONDITIONAL_CACHE['ALIAS']]
+
+def version_key(resource):
+    return f'version:{resource}'
+
+def scoped(resource, owner_id):
+    """The resource name whose version covers only ``owner_id``'s rows."""
+    return f'{resource}:{owner_id}'
+
+def detail(resource):
+    """
+    For ``conditional``: ``resource`` scoped to the object a detail view
+    looks up, keyed on the pk in its URL so answering from cache needs no
+    query. Malformed pks are left for the view to answer 404.
+    """
+
+    def resolve(view):
+        return scoped(resource, view.kwargs[view.lookup_url_kwarg or view.lookup_field])
+    return resolve
+
+def bump_versions(*resources):
+    """
+    Move ``resources`` to a new version once the current database transaction
+    commits, so a reader can't cache pre-commit data under the new version.
+    """
+    on_commit(lambda: conditional_cache().set_many(
+        {version_key(resource): time.time() for resource in resources}, timeout=None,
+    ))
+
+def get_versions(resources):
+    cache = conditional_cache()
+    keys = [version_key(resource) for resource in resources]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+def conditional(*resources):
+    """
+    Serve a GET view from the cached payload for (user, request, versions of
+    the user and of ``resources``), with ETag and Last-Modified headers. A
+    matching If-None-Match gets 304 without running the view at all. A
+    resource may also be a callable taking the view, such as ``detail``.
+    """
+
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            # What the caller may see changes with their user type or accounts (and so their tier).
+            versions = get_versions([scoped('principal', request.user.pk)] + [
+                resource(self) if callable(resource) else resource for resource in resources
+            ])
+            variant = (f"{request.user.pk}:{request.user.user_type}:{request.get_full_path()}:"
+                       f"{request.META.get('HTTP_ACCEPT', '')}:{versions}")
+            etag = quote_etag(hashlib.sha1(variant.encode()).hexdigest())
+            headers = {'ETag': etag}
+            if versions:
+                headers['Last-Modified'] = http_date(max(versions))
+
+            if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+            if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+            else:
+                cache = conditional_cache()
+                cache_key = f'conditional:{etag}'
+                cached = cache.get(cache_key)
+                if cached is not None and 'data' in cached:
+                    response = Response(cached['data'], headers=headers)
+                elif cached is not None:
+                    response = HttpResponse(cached['content'], content_type=cached['content_type'], headers=headers)
+                else:
+                    response = view_method(self, request, *args, **kwargs)
+                    if response.status_code != status.HTTP_200_OK:
+                        return response
+                    if isinstance(response, Response):
+                        cached = {'data': response.data}
+                    else:
+                        cached = {'content': response.content, 'content_type': response['Content-Type']}
+                    cache.set(cache_key, cached, settings.CONDITIONAL_CACHE['TTL'])
+                    for header, value in headers.items():
+                        response[header] = value
+            patch_vary_headers(response, ('Accept', 'Authorization'))
+            return response
+        return wrapper
+    return decorator
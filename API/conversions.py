@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from .conditional import bump_versions
+from .exceptions import CurrencyConversionException
+from .ledger import account_currencies, post_amount_changes
+from .models import CurrencyConversionJob, Transaction
+from .rates import get_rate_provider
+from .rollups import mark_days_dirty
+from .utils import MAX_AMOUNT, quantize_money
+
+def check_conversion(transaction_ids, to_currency, chunk_size=None):
+    """
+    Raise CurrencyConversionException, before anything is written, naming
+    the transactions whose holder's account currency isn't ``to_currency``:
+    wallets only take amounts in the account currency (see
+    ledger.check_currencies), so those rows can't be converted.
+    """
+    chunk_size = chunk_size or settings.CONVERSION_CHUNK_SIZE
+    refused = []
+    for start in range(0, len(transaction_ids), chunk_size):
+        rows = list(Transaction.objects.filter(pk__in=transaction_ids[start:start + chunk_size])
+                    .exclude(currency=to_currency).values_list('transaction_id', 'performed_by_id'))
+        currencies = account_currencies({user_id for _, user_id in rows})
+        refused += [(transaction_id, currencies[user_id]) for transaction_id, user_id in rows
+                    if currencies.get(user_id, to_currency) != to_currency]
+    if refused:
+        listed = ', '.join(f'{transaction_id} ({currency})' for transaction_id, currency in refused[:20])
+        more = f' and {len(refused) - 20} more' if len(refused) > 20 else ''
+        raise CurrencyConversionException(
+            detail=f"{len(refused)} transactions belong to accounts not kept in {to_currency}: {listed}{more}.")
+
+def convert_transactions(transaction_ids, to_currency, chunk_size=None, progress=None):
+    """
+    Re-denominate transactions into ``to_currency`` in chunks, each committed
+    on its own with the matching wallet and snapshot corrections. The whole
+    selection is checked with ``check_conversion`` first, so a refused row
+    stops the run before any chunk is written. Each source currency costs one
+    rate lookup. Rows already in ``to_currency`` are skipped, so an
+    interrupted run can simply be repeated. ``progress`` is called as
+    progress(processed, converted) after every chunk. Returns the number of
+    transactions converted.
+    """
+    chunk_size = chunk_size or settings.CONVERSION_CHUNK_SIZE
+    check_conversion(transaction_ids, to_currency, chunk_size)
+    provider = get_rate_provider()
+    rates = {}
+    converted = 0
+    for start in range(0, len(transaction_ids), chunk_size):
+        pending = Transaction.objects.filter(pk__in=transaction_ids[start:start + chunk_size]) \
+            .exclude(currency=to_currency)
+        # Look rates up before locking the rows, so a slow upstream doesn't hold the locks.
+        for currency in set(pending.order_by().values_list('currency', flat=True).distinct()) - rates.keys():
+            rates[currency] = provider.get_rate(currency, to_currency)
+        with atomic():
+            rows = list(pending.select_for_update().only(
+                'performed_by', 'transaction_type', 'currency', 'amount', 'date_created'))
+            changes = []
+            for txn in rows:
+                if txn.currency not in rates:
+                    rates[txn.currency] = provider.get_rate(txn.currency, to_currency)
+                old_amount = txn.amount
+                txn.amount = quantize_money(old_amount * rates[txn.currency])
+                if abs(txn.amount) > MAX_AMOUNT:
+                    raise CurrencyConversionException(
+                        detail=f"Transaction {txn.pk} is too large to convert to {to_currency}.")
+                txn.currency = to_currency
+                changes.append((txn, old_amount))
+            Transaction.objects.bulk_update(rows, ['amount', 'currency'])
+            post_amount_changes(changes)
+            mark_days_dirty(txn.date_created for txn in rows)
+            # Queryset updates send no signals.
+            bump_versions('transaction')
+        converted += len(rows)
+        if progress is not None:
+            progress(min(start + chunk_size, len(transaction_ids)), converted)
+    return converted
+
+def claim_job():
+    """Mark the oldest pending conversion job running and return it, or None if there is none."""
+    while True:
+        job = CurrencyConversionJob.objects.filter(status='pending').order_by('date_created', 'pk').first()
+        if job is None:
+            return None
+        # Another worker may have claimed it between the read and the update.
+        if CurrencyConversionJob.objects.filter(pk=job.pk, status='pending') \
+                .update(status='running', processed=0, converted=0, error=''):
+            job.status = 'running'
+            return job
+
+def run_job(job):
+    """Run a claimed job, recording its progress as each chunk commits. Returns the final status."""
+    jobs = CurrencyConversionJob.objects.filter(pk=job.pk)
+    try:
+        convert_transactions(job.transaction_ids, job.to_currency,
+                             progress=lambda processed, converted: jobs.update(processed=processed, converted=converted))
+    except Exception as e:
+        jobs.update(status='failed', error=str(e), date_finished=timezone.now())
+        return 'failed'
+    jobs.update(status='done', date_finished=timezone.now())
+    return 'done'
@@ -0,0 +1,6 @@
+from rest_framework.exceptions import APIException
+
+class CurrencyConversionException(APIException):
+    status_code = 400
+    default_detail = 'Currency conversion failed.'
+    default_code = 'currency_conversion_failed'
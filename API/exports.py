@@ -0,0 +1,42 @@
+import csv
+import json
+from decimal import Decimal
+
+from django.conf import settings
+
+TRANSACTION_EXPORT_FIELDS = (
+    'id', 'performed_by', 'transaction_type', 'currency', 'category', 'date_created', 'amount', 'transaction_id',
+)
+
+class Echo:
+    """File-like object whose write() just returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+def export_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+def iter_rows(queryset, fields):
+    for row in queryset.values_list(*fields).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        yield [export_value(value) for value in row]
+
+def stream_ndjson(queryset, fields=TRANSACTION_EXPORT_FIELDS):
+    encoder = json.JSONEncoder(separators=(',', ':'))
+    for row in iter_rows(queryset, fields):
+        yield encoder.encode(dict(zip(fields, row))) + '\n'
+
+def stream_csv(queryset, fields=TRANSACTION_EXPORT_FIELDS):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in iter_rows(queryset, fields):
+        yield writer.writerow(row)
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', stream_ndjson),
+    'csv': ('text/csv', stream_csv),
+}
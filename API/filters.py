@@ -0,0 +1,61 @@
+import datetime
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend
+
+TRANSACTION_FILTER_FIELDS = ('performed_by', 'transaction_type', 'category', 'currency')
+
+def parse_bound(value, name, end=False):
+    """
+    Parse an ISO date or datetime query parameter into an aware datetime.
+    A bare date used as an upper bound covers the whole day.
+    """
+    try:
+        # Dates first: parse_datetime also accepts a bare date, as midnight.
+        day = parse_date(value)
+        if day is not None:
+            parsed = datetime.datetime.combine(day + datetime.timedelta(days=1) if end else day, datetime.time.min)
+        else:
+            parsed = parse_datetime(value)
+            if parsed is None:
+                raise ValueError
+    except ValueError:
+        raise serializers.ValidationError({name: [f"Invalid date: {value}"]})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+def filter_by_params(queryset, params, fields=(), date_field=None):
+    """
+    Filter on exact matches for ``fields`` and on a date_from/date_to range
+    over ``date_field``, taking values from query parameters.
+    """
+    if date_field and params.get('date_from'):
+        queryset = queryset.filter(**{f'{date_field}__gte': parse_bound(params['date_from'], 'date_from')})
+    if date_field and params.get('date_to'):
+        date_to = params['date_to']
+        lookup = 'lt' if parse_date(date_to) is not None else 'lte'
+        queryset = queryset.filter(**{f'{date_field}__{lookup}': parse_bound(date_to, 'date_to', end=True)})
+    for field in fields:
+        value = params.get(field)
+        if not value:
+            continue
+        try:
+            queryset = queryset.filter(**{field: value})
+        except (ValueError, DjangoValidationError):
+            raise serializers.ValidationError({field: [f"Invalid value: {value}"]})
+    return queryset
+
+class QueryParamFilterBackend(BaseFilterBackend):
+    """Filters on the view's ``filter_fields`` and ``date_filter_field``."""
+
+    def filter_queryset(self, request, queryset, view):
+        return filter_by_params(
+            queryset,
+            request.query_params,
+            getattr(view, 'filter_fields', ()),
+            getattr(view, 'date_filter_field', None),
+        )
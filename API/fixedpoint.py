@@ -0,0 +1,120 @@
+"""
+Fixed-point currency conversion over whole columns of amounts, for bulk
+revaluation such as month-end reporting in a single currency.
+
+Amounts are integer minor units (cents: every amount in this project has two
+decimal places). Results agree exactly with convert_currency row by row:
+``quantize_money(amount * rate)`` with the provider's rate, rounded half-even
+to the cent; see convert_minor_units_decimal.
+
+Rates become integers in units of 10**-RATE_PLACES, the precision
+ExchangeRate stores, rounded half-even, and each amount is first converted as
+
+    round_half_even(amount * fixed_rate / 10**RATE_PLACES)
+
+exactly in integers. Rounding the rate moves the product by at most
+|amount| / 2 of those units, which can only change the result when the
+product lies that close to a half cent (say an exact tie under a
+triangulated rate such as 18.5 / 0.92). Rows within twice that distance
+are recomputed with Decimal exactly as convert_currency does, so ties and
+near-ties round the same way; for amounts of ordinary size that is a tiny
+fraction of rows.
+
+With NumPy installed the conversion is a vectorized int64 pass; without it,
+the same arithmetic runs on Python ints. The int64 path needs |amount| below
+MAX_MINOR_UNITS and rates below MAX_RATE.
+"""
+from decimal import Decimal, ROUND_HALF_EVEN
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .exceptions import CurrencyConversionException
+from .rates import get_rate_provider
+from .utils import convert_currency, quantize_money
+
+RATE_PLACES = 12
+RATE_SCALE = 10 ** RATE_PLACES
+MAX_MINOR_UNITS = 10 ** 12
+MAX_RATE = 10 ** 6
+# Amounts and rates are split into base-10**6 limbs so that no partial product exceeds 2**63.
+LIMB = 10 ** 6
+
+def fixed_rate(rate):
+    """``rate`` as an integer count of 10**-RATE_PLACES, rounded half-even."""
+    fixed = int(Decimal(rate).scaleb(RATE_PLACES).to_integral_value(ROUND_HALF_EVEN))
+    if not 0 <= fixed < MAX_RATE * RATE_SCALE:
+        raise CurrencyConversionException(detail=f"Rate {rate} is out of range for fixed-point conversion.")
+    return fixed
+
+def resolve_rates(currencies, to_currency):
+    """{currency: rate into ``to_currency``}, with one rate lookup per distinct currency."""
+    rates = get_rate_provider().get_rates((currency, to_currency) for currency in set(currencies))
+    return {base: rate for (base, _), rate in rates.items()}
+
+def near_half_cent(remainder, magnitude):
+    """Whether a product this close to a half cent may round differently with the unrounded rate."""
+    return abs(2 * remainder - RATE_SCALE) <= 2 * magnitude
+
+def convert_exactly(amount, rate):
+    """One amount in minor units, converted the way convert_currency does it."""
+    return int(quantize_money(Decimal(int(amount)).scaleb(-2) * rate).scaleb(2))
+
+def convert_minor_units(amounts, currencies, to_currency):
+    """
+    Convert ``amounts`` (integer minor units), each in the matching entry of
+    ``currencies``, into ``to_currency`` minor units. Returns an int64 array
+    when NumPy is installed, else a list of ints.
+    """
+    if np is None:
+        return _convert_python(list(amounts), list(currencies), to_currency)
+    return _convert_numpy(np.asarray(amounts, dtype=np.int64), np.asarray(currencies), to_currency)
+
+def _convert_numpy(amounts, currencies, to_currency):
+    if amounts.shape != currencies.shape:
+        raise ValueError('amounts and currencies must have the same length.')
+    codes, index = np.unique(currencies, return_inverse=True)
+    index = index.reshape(-1)
+    exact = resolve_rates(codes.tolist(), to_currency)
+    rates = np.array([fixed_rate(exact[code]) for code in codes.tolist()], dtype=np.int64)[index]
+    magnitude = np.abs(amounts)
+    if magnitude.size and magnitude.max() >= MAX_MINOR_UNITS:
+        raise ValueError(f'Amounts must be below {MAX_MINOR_UNITS} minor units.')
+    # amount * rate = a1*r1*LIMB**2 + (a1*r0 + a0*r1)*LIMB + a0*r0, and LIMB**2 == RATE_SCALE.
+    a1, a0 = np.divmod(magnitude, LIMB)
+    r1, r0 = np.divmod(rates, LIMB)
+    middle_high, middle_low = np.divmod(a1 * r0 + a0 * r1, LIMB)
+    carry, remainder = np.divmod(middle_low * LIMB + a0 * r0, RATE_SCALE)
+    quotient = a1 * r1 + middle_high + carry
+    # Round half to even.
+    quotient += (2 * remainder > RATE_SCALE) | ((2 * remainder == RATE_SCALE) & (quotient % 2 == 1))
+    converted = np.where(amounts < 0, -quotient, quotient)
+    code_list = codes.tolist()
+    for row in np.flatnonzero(near_half_cent(remainder, magnitude)).tolist():
+        converted[row] = convert_exactly(amounts[row], exact[code_list[index[row]]])
+    return converted
+
+def _convert_python(amounts, currencies, to_currency):
+    if len(amounts) != len(currencies):
+        raise ValueError('amounts and currencies must have the same length.')
+    exact = resolve_rates(currencies, to_currency)
+    fixed = {currency: fixed_rate(rate) for currency, rate in exact.items()}
+    converted = []
+    for amount, currency in zip(amounts, currencies):
+        if abs(amount) >= MAX_MINOR_UNITS:
+            raise ValueError(f'Amounts must be below {MAX_MINOR_UNITS} minor units.')
+        quotient, remainder = divmod(abs(amount) * fixed[currency], RATE_SCALE)
+        if near_half_cent(remainder, abs(amount)):
+            converted.append(convert_exactly(amount, exact[currency]))
+            continue
+        if 2 * remainder > RATE_SCALE or (2 * remainder == RATE_SCALE and quotient % 2):
+            quotient += 1
+        converted.append(-quotient if amount < 0 else quotient)
+    return converted
+
+def convert_minor_units_decimal(amounts, currencies, to_currency):
+    """convert_currency row by row, in minor units: the reference convert_minor_units agrees with."""
+    return [int(convert_currency(Decimal(int(amount)).scaleb(-2), currency, to_currency).scaleb(2))
+            for amount, currency in zip(amounts, currencies)]
@@ -2,9 +2,10 @@ from django import forms
 from .models import Wallet, Account, Transaction
 
 class WalletForm(forms.ModelForm):
+    # Wallets open empty; the ledger owns the balance.
     class Meta:
         model = Wallet
-        fields = ['balance']
+        fields = []
 
 class AccountForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,77 @@
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+
+def request_fingerprint(request):
+    payload = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def replayable(response):
+    """
+    Successful responses, and 4xx responses the same request would get
+    again. Views mark 4xx responses caused by failed rate lookups or other
+    upstream errors with ``response.transient = True``.
+    """
+    if status.is_success(response.status_code):
+        return True
+    return status.is_client_error(response.status_code) and not getattr(response, 'transient', False)
+
+def idempotent(view_method):
+    """
+    Replay the stored response for a repeated Idempotency-Key header instead
+    of running ``view_method`` again. Keys are scoped to the user and path.
+    Only replayable responses and ValidationErrors are stored, so a request
+    that failed on a currency conversion can be retried under the same key.
+    A concurrent request holding the same key gets 409 until the first one
+    finishes; reusing a key with a different body gets 422.
+    """
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.META.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+
+        config = settings.IDEMPOTENCY
+        cache = caches[config['CACHE']]
+        cache_key = f'idempotency:{request.user.pk}:{request.path}:{key}'
+        fingerprint = request_fingerprint(request)
+
+        stored = cache.get(cache_key)
+        if stored is None:
+            # cache.add is insert-if-absent, so only one request per key proceeds.
+            if not cache.add(f'{cache_key}:lock', True, config['LOCK_TIMEOUT']):
+                return Response({'detail': 'A request with this Idempotency-Key is already in progress.'},
+                                status=status.HTTP_409_CONFLICT)
+            try:
+                stored = cache.get(cache_key)
+                if stored is None:
+                    def store(status_code, data):
+                        cache.set(cache_key, {'fingerprint': fingerprint, 'status': status_code, 'data': data},
+                                  config['TTL'])
+
+                    try:
+                        response = view_method(self, request, *args, **kwargs)
+                    except ValidationError as exc:
+                        store(exc.status_code, exc.detail)
+                        raise
+                    if replayable(response):
+                        store(response.status_code, response.data)
+                    return response
+            finally:
+                cache.delete(f'{cache_key}:lock')
+
+        if stored['fingerprint'] != fingerprint:
+            return Response({'detail': 'Idempotency-Key was already used with a different request body.'},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        return Response(stored['data'], status=stored['status'], headers={'Idempotent-Replayed': 'true'})
+
+    return wrapper
@@ -0,0 +1,206 @@
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.db.transaction import atomic
+from django.utils import timezone
+from rest_framework import serializers
+
+from .conditional import bump_versions
+from .exceptions import CurrencyConversionException
+from .ingest import TIER1_TRANSACTION_LIMIT, resolve_rates
+from .ledger import post_backdated, signed_amount
+from .models import Account, AllTransaction, ImportCheckpoint, Transaction
+from .rollups import mark_days_dirty
+from .serializers import TransactionBulkItemSerializer
+from .utils import MAX_AMOUNT, quantize_money
+
+FORMATS = ('csv', 'ndjson')
+
+def read_records(path, format=None):
+    """
+    Stream the records of a CSV file with a header row, as dicts, or of an
+    NDJSON file, as raw lines left for the workers to parse.
+    """
+    format = format or ('csv' if str(path).lower().endswith('.csv') else 'ndjson')
+    with open(path, newline='', encoding='utf-8') as f:
+        if format == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            yield from (line for line in f if line.strip())
+
+def chunked(records, size, start):
+    """Yield (number of the first record, records) chunks, numbering records from ``start``."""
+    while chunk := list(itertools.islice(records, size)):
+        yield start, chunk
+        start += len(chunk)
+
+def validate_chunk(start, records):
+    """
+    Validate records with the bulk API's rules, plus performed_by and an
+    optional date_created. Runs in worker processes, so it never touches the
+    database. Returns ([(number, attrs)], [(number, errors)]).
+    """
+    serializer = TransactionBulkItemSerializer()
+    performed_by = serializers.IntegerField(min_value=1)
+    date_created = serializers.DateTimeField(allow_null=True)
+    valid = []
+    errors = []
+    for number, record in enumerate(records, start=start):
+        if isinstance(record, str):
+            try:
+                record = json.loads(record)
+            except ValueError as exc:
+                errors.append((number, {'non_field_errors': [f'Invalid JSON: {exc}']}))
+                continue
+        if not isinstance(record, dict):
+            errors.append((number, {'non_field_errors': ['Expected an object.']}))
+            continue
+        attrs = {}
+        record_errors = {}
+        try:
+            attrs = serializer.run_validation(record)
+        except serializers.ValidationError as exc:
+            record_errors.update(exc.detail)
+        for name, field, value in (('performed_by_id', performed_by, record.get('performed_by')),
+                                   ('date_created', date_created, record.get('date_created') or None)):
+            try:
+                attrs[name] = field.run_validation(value)
+            except serializers.ValidationError as exc:
+                record_errors[name.removesuffix('_id')] = exc.detail
+        if record_errors:
+            errors.append((number, record_errors))
+        else:
+            valid.append((number, attrs))
+    return valid, errors
+
+def validated_chunks(chunks, workers):
+    """Yield (record count, validate_chunk result) in input order, validating up to 2 * workers chunks ahead."""
+    if workers <= 1:
+        for start, records in chunks:
+            yield len(records), validate_chunk(start, records)
+        return
+    # Spawned rather than forked, so workers never inherit the parent's database connections. They
+    # start from a fresh interpreter and set Django up before importing this module.
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=django.setup) as executor:
+        pending = deque()
+        for start, records in chunks:
+            pending.append((len(records), executor.submit(validate_chunk, start, records)))
+            if len(pending) >= 2 * workers:
+                count, future = pending.popleft()
+                yield count, future.result()
+        while pending:
+            count, future = pending.popleft()
+            yield count, future.result()
+
+def load_accounts(user_ids, accounts):
+    """Add {user_id: (currency, tier)} of each user's primary account to ``accounts``; None for users without one."""
+    missing = set(user_ids) - accounts.keys()
+    accounts.update(dict.fromkeys(missing))
+    # Newest first, so the primary (first opened) account is written last.
+    for owner_id, currency, tier in Account.objects.filter(owner_id__in=missing) \
+            .order_by('owner_id', '-date_created', '-id').values_list('owner_id', 'currency', 'tier'):
+        accounts[owner_id] = (currency, tier)
+
+def prepare_chunk(valid, accounts):
+    """
+    Build unsaved Transactions from validated rows the way the bulk API does:
+    converted into the performer's account currency, rounded to cents and
+    checked against the largest storable amount, the tier1 limit and existing transaction ids. Returns ([(Transaction,
+    date_created)], [(number, errors)]).
+    """
+    load_accounts({attrs['performed_by_id'] for _, attrs in valid}, accounts)
+    rates = resolve_rates(
+        (attrs['currency'], accounts[attrs['performed_by_id']][0])
+        for _, attrs in valid if accounts[attrs['performed_by_id']] is not None
+    )
+    existing = set(AllTransaction.objects.filter(transaction_id__in=[attrs['transaction_id'] for _, attrs in valid])
+                   .values_list('transaction_id', flat=True))
+    prepared = []
+    errors = []
+    for number, attrs in valid:
+        account = accounts[attrs['performed_by_id']]
+        if account is None:
+            errors.append((number, {'performed_by': ["User has no account to post transactions to."]}))
+            continue
+        currency, tier = account
+        rate = rates[(attrs['currency'], currency)]
+        if isinstance(rate, CurrencyConversionException):
+            errors.append((number, {'currency': [str(rate.detail)]}))
+            continue
+        amount = quantize_money(attrs['amount'] * rate)
+        if abs(amount) > MAX_AMOUNT:
+            errors.append((number, {'amount': [f"Amount is too large once converted to {currency}."]}))
+            continue
+        if tier == 'tier1' and amount > TIER1_TRANSACTION_LIMIT:
+            errors.append((number, {'amount': ["Tier1 users can't make transactions more than 10000."]}))
+            continue
+        if attrs['transaction_id'] in existing:
+            errors.append((number, {'transaction_id': ['transaction with this transaction id already exists.']}))
+            continue
+        existing.add(attrs['transaction_id'])
+        txn = Transaction(
+            performed_by_id=attrs['performed_by_id'], transaction_type=attrs['transaction_type'], currency=currency,
+            category=attrs['category'], amount=amount, transaction_id=attrs['transaction_id'],
+        )
+        if attrs['date_created'] is not None:
+            txn.date_created = attrs['date_created']
+        prepared.append((txn, attrs['date_created']))
+    return prepared, errors
+
+def write_chunk(prepared, checkpoint, count, rejected):
+    """Insert a chunk, post it to the ledger and advance the checkpoint, all in one database transaction."""
+    with atomic():
+        created = Transaction.objects.bulk_create([txn for txn, _ in prepared],
+                                                  batch_size=settings.BULK_CREATE_BATCH_SIZE)
+        post_backdated((txn.performed_by_id, txn.date_created, signed_amount(txn.transaction_type, txn.amount))
+                       for txn in created)
+        mark_days_dirty(txn.date_created for txn in created)
+        bump_versions('transaction')
+        dates = [date_created for _, date_created in prepared if date_created is not None]
+        if dates:
+            checkpoint.first_date = min(dates + [checkpoint.first_date or dates[0]])
+            checkpoint.last_date = max(dates + [checkpoint.last_date or dates[0]])
+        checkpoint.rows_read += count
+        checkpoint.imported += len(created)
+        checkpoint.rejected += rejected
+        checkpoint.save()
+
+def import_transactions(path, name=None, format=None, workers=None, chunk_size=None, restart=False, report=None):
+    """
+    Import transactions from a CSV or NDJSON file in the export format,
+    validating chunks of ``chunk_size`` records in ``workers`` processes.
+    Progress is checkpointed under ``name`` (the file's absolute path by
+    default) with every chunk, so running it again resumes after the last
+    committed chunk. ``report(checkpoint, count, errors)`` is called after
+    each chunk of ``count`` records with the [(record number, errors)] it
+    rejected. Returns the checkpoint.
+    """
+    name = name or os.path.abspath(path)
+    workers = os.cpu_count() if workers is None else workers
+    chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+    if restart:
+        ImportCheckpoint.objects.filter(name=name).delete()
+    checkpoint, _ = ImportCheckpoint.objects.get_or_create(name=name)
+    if checkpoint.date_finished is not None:
+        return checkpoint
+
+    records = itertools.islice(read_records(path, format), checkpoint.rows_read, None)
+    accounts = {}
+    for count, (valid, errors) in validated_chunks(chunked(records, chunk_size, checkpoint.rows_read + 1), workers):
+        prepared, rejected = prepare_chunk(valid, accounts)
+        errors = sorted(errors + rejected, key=lambda error: error[0])
+        write_chunk(prepared, checkpoint, count, len(errors))
+        if report is not None:
+            report(checkpoint, count, errors)
+
+    checkpoint.date_finished = timezone.now()
+    checkpoint.save(update_fields=['date_finished'])
+    return checkpoint
@@ -0,0 +1,96 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.transaction import atomic
+
+from .conditional import bump_versions
+from .exceptions import CurrencyConversionException
+from .ledger import post_transactions
+from .models import AllTransaction, Transaction
+from .rates import get_rate_provider
+from .rollups import mark_days_dirty
+from .utils import MAX_AMOUNT, quantize_money
+
+TIER1_TRANSACTION_LIMIT = Decimal('10000.00')
+
+def resolve_rates(pairs):
+    """Look up each distinct (from, to) pair once. Pairs that fail map to their exception."""
+    provider = get_rate_provider()
+    rates = {}
+    for pair in set(pairs):
+        try:
+            rates[pair] = provider.get_rate(*pair)
+        except CurrencyConversionException as e:
+            rates[pair] = e
+    return rates
+
+def prepare_transactions(items, user, account):
+    """
+    Build unsaved Transactions from validated (index, attrs) rows, converted
+    into the account currency and rounded to cents. Returns ([(index,
+    Transaction)], {index: errors}).
+    """
+    target = account.currency
+    rates = resolve_rates((attrs['currency'], target) for _, attrs in items)
+    prepared = []
+    errors = {}
+    for index, attrs in items:
+        rate = rates[(attrs['currency'], target)]
+        if isinstance(rate, CurrencyConversionException):
+            errors[index] = {'currency': [rate.detail]}
+            continue
+        amount = quantize_money(attrs['amount'] * rate)
+        if abs(amount) > MAX_AMOUNT:
+            errors[index] = {'amount': [f"Amount is too large once converted to {target}."]}
+            continue
+        prepared.append((index, Transaction(**{
+            **attrs,
+            'performed_by': user,
+            'amount': amount,
+            'currency': target,
+        })))
+
+    if account.tier == 'tier1':
+        over_limit = {index for index, txn in prepared if txn.amount > TIER1_TRANSACTION_LIMIT}
+        for index in over_limit:
+            errors[index] = {'amount': ["Tier1 users can't make transactions more than 10000."]}
+        prepared = [(index, txn) for index, txn in prepared if index not in over_limit]
+    return prepared, errors
+
+def bulk_insert(transactions, batch_size=None):
+    """
+    Insert transactions in chunks of ``batch_size`` and post them to the
+    wallet ledger, all inside one database transaction.
+    """
+    batch_size = batch_size or settings.BULK_CREATE_BATCH_SIZE
+    with atomic():
+        created = Transaction.objects.bulk_create(transactions, batch_size=batch_size)
+        post_transactions(created)
+        mark_days_dirty(txn.date_created for txn in created)
+        bump_versions('transaction')
+    return created
+
+def insert_prepared(prepared, errors, batch_size=None):
+    """
+    bulk_insert the (index, Transaction) rows from prepare_transactions.
+    Rows whose transaction_id another request took after they were validated
+    are moved to ``errors`` and the rest inserted again. Returns [(index,
+    Transaction)] for the rows created.
+    """
+    while prepared:
+        try:
+            return list(zip([index for index, _ in prepared], bulk_insert([txn for _, txn in prepared], batch_size)))
+        except IntegrityError:
+            taken = set(AllTransaction.objects.filter(
+                transaction_id__in=[txn.transaction_id for _, txn in prepared]
+            ).values_list('transaction_id', flat=True))
+            if not taken:
+                raise
+            for index, txn in prepared:
+                if txn.transaction_id in taken:
+                    errors[index] = {'transaction_id': ['transaction with this transaction id already exists.']}
+                # Batches inserted before the failure were rolled back.
+                txn.pk, txn._state.adding = None, True
+            prepared = [(index, txn) for index, txn in prepared if txn.transaction_id not in taken]
+    return []
@@ -0,0 +1,284 @@
+import contextvars
+import heapq
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INSTRUMENTATION = {
+    'ENABLED': True,
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    'SLOW_REQUEST_SECONDS': None,
+    'SLOW_REQUEST_SAMPLE_RATE': 1.0,
+    'SLOW_REQUEST_TOP_QUERIES': 5,
+    'METRICS_TOKEN': None,
+}
+
+# Spans recorded in request handling; each is a histogram of seconds per request.
+SPANS = ('db', 'http', 'fx', 'serializer')
+
+def get_instrumentation_settings():
+    return {**DEFAULT_INSTRUMENTATION, **getattr(settings, 'INSTRUMENTATION', {})}
+
+class RequestSpans:
+    """Time and count per span for one request, plus its slowest queries when ``top_queries`` is set."""
+
+    def __init__(self, top_queries=0):
+        self.times = dict.fromkeys(SPANS, 0.0)
+        self.counts = dict.fromkeys(SPANS, 0)
+        self.top_queries = top_queries
+        self.queries = []
+
+    def record(self, span, duration):
+        self.times[span] += duration
+        self.counts[span] += 1
+
+    def record_query(self, sql, duration):
+        self.record('db', duration)
+        if self.top_queries:
+            # Min-heap of the slowest queries; the counter breaks ties without comparing SQL.
+            entry = (duration, self.counts['db'], sql)
+            if len(self.queries) < self.top_queries:
+                heapq.heappush(self.queries, entry)
+            else:
+                heapq.heappushpop(self.queries, entry)
+
+current_spans = contextvars.ContextVar('current_spans', default=None)
+# Time spent in spans nested inside the innermost open one, as a one-item list.
+nested_time = contextvars.ContextVar('nested_time', default=None)
+
+@contextmanager
+def timed():
+    """
+    Yield a callable returning the block's own time so far: its duration less
+    the time of the spans nested in it, which is counted there instead. That
+    keeps span totals from counting, say, the queries inside an fx lookup twice.
+    """
+    nested = [0.0]
+    token = nested_time.set(nested)
+    start = time.perf_counter()
+    try:
+        yield lambda: time.perf_counter() - start - nested[0]
+    finally:
+        nested_time.reset(token)
+        outer = nested_time.get()
+        if outer is not None:
+            outer[0] += time.perf_counter() - start
+
+@contextmanager
+def span(name):
+    """Add the time spent in the block, outside nested spans, to span ``name`` of the current request, if any."""
+    spans = current_spans.get()
+    if spans is None:
+        yield
+        return
+    with timed() as own_time:
+        try:
+            yield
+        finally:
+            spans.record(name, own_time())
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    spans = current_spans.get()
+    if spans is None:
+        return execute(sql, params, many, context)
+    with timed() as own_time:
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            spans.record_query(sql, own_time())
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+class MetricsRegistry:
+    """
+    In-process histograms and counters per URL name and HTTP method. Each
+    worker process keeps its own; Prometheus sums them across scrape targets.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, view, method, duration, spans):
+        labels = f'view="{escape_label(view)}",method="{escape_label(method)}"'
+        with self._lock:
+            self._histogram('api_request_duration_seconds', labels).observe(duration)
+            for name in SPANS:
+                self._histogram(f'api_{name}_duration_seconds', labels).observe(spans.times[name])
+                key = (f'api_{name}_calls_total', labels)
+                self.counters[key] = self.counters.get(key, 0) + spans.counts[name]
+
+    def _histogram(self, metric, labels):
+        histogram = self.histograms.get((metric, labels))
+        if histogram is None:
+            histogram = self.histograms[(metric, labels)] = Histogram(self.buckets)
+        return histogram
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        with self._lock:
+            lines = []
+            for metric in sorted({metric for metric, _ in self.histograms}):
+                lines.append(f'# TYPE {metric} histogram')
+                for (name, labels), histogram in sorted(self.histograms.items()):
+                    if name != metric:
+                        continue
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                    lines.append(f'{metric}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+            for metric in sorted({metric for metric, _ in self.counters}):
+                lines.append(f'# TYPE {metric} counter')
+                for (name, labels), value in sorted(self.counters.items()):
+                    if name == metric:
+                        lines.append(f'{metric}{{{labels}}} {value}')
+            return '\n'.join(lines) + '\n'
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry(get_instrumentation_settings()['BUCKETS'])
+    return _registry
+
+class InstrumentationMiddleware:
+    """
+    Times each request and breaks it down into DB, outbound HTTP, FX and
+    serializer spans, recorded into the histograms served by metrics_view.
+    Requests slower than SLOW_REQUEST_SECONDS are logged, sampled at
+    SLOW_REQUEST_SAMPLE_RATE, with their slowest queries.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = get_instrumentation_settings()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.config['ENABLED']:
+            return self.get_response(request)
+        spans = self.start_spans()
+        token = current_spans.set(spans)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_spans.reset(token)
+        return self.finish(request, response, start, spans)
+
+    async def __acall__(self, request):
+        if not self.config['ENABLED']:
+            return await self.get_response(request)
+        spans = self.start_spans()
+        # Queries run through sync_to_async are counted too: asgiref copies the context into the thread.
+        token = current_spans.set(spans)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_spans.reset(token)
+        return self.finish(request, response, start, spans)
+
+    def start_spans(self):
+        slow_seconds = self.config['SLOW_REQUEST_SECONDS']
+        return RequestSpans(self.config['SLOW_REQUEST_TOP_QUERIES'] if slow_seconds is not None else 0)
+
+    def finish(self, request, response, start, spans):
+        """Record the request now, or for a streaming response once its body has been consumed."""
+        if not response.streaming:
+            self.record(request, time.perf_counter() - start, spans)
+        elif response.is_async:
+            response.streaming_content = self.astream(request, response.streaming_content, start, spans)
+        else:
+            response.streaming_content = self.stream(request, response.streaming_content, start, spans)
+        return response
+
+    def stream(self, request, content, start, spans):
+        # Queries run while the server consumes the body count towards the request.
+        try:
+            while True:
+                token = current_spans.set(spans)
+                try:
+                    chunk = next(content)
+                except StopIteration:
+                    return
+                finally:
+                    current_spans.reset(token)
+                yield chunk
+        finally:
+            self.record(request, time.perf_counter() - start, spans)
+
+    async def astream(self, request, content, start, spans):
+        try:
+            while True:
+                token = current_spans.set(spans)
+                try:
+                    chunk = await anext(content)
+                except StopAsyncIteration:
+                    return
+                finally:
+                    current_spans.reset(token)
+                yield chunk
+        finally:
+            self.record(request, time.perf_counter() - start, spans)
+
+    def record(self, request, duration, spans):
+        slow_seconds = self.config['SLOW_REQUEST_SECONDS']
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        get_registry().observe(view, request.method, duration, spans)
+        if slow_seconds is not None and duration >= slow_seconds \
+                and random.random() < self.config['SLOW_REQUEST_SAMPLE_RATE']:
+            self.log_slow_request(request, view, duration, spans)
+
+    def log_slow_request(self, request, view, duration, spans):
+        breakdown = ', '.join(f'{name} {spans.times[name] * 1000:.1f} ms/{spans.counts[name]}' for name in SPANS)
+        queries = ''.join(f'\n  {seconds * 1000:.1f} ms: {sql}' for seconds, _, sql in sorted(spans.queries, reverse=True))
+        logger.warning('Slow request %s %s (%s) took %.1f ms: %s%s',
+                       request.method, request.path, view, duration * 1000, breakdown, queries)
+
+def metrics_view(request):
+    """The metrics, for staff users or scrapers sending METRICS_TOKEN; nobody else, even if no token is set."""
+    expected = get_instrumentation_settings()['METRICS_TOKEN']
+    token_ok = bool(expected) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {expected}')
+    if not token_ok and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(get_registry().render(), content_type='text/plain; version=0.0.4; charset=utf-8')
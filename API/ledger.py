@@ -0,0 +1,176 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from .conditional import bump_versions, scoped
+from .exceptions import CurrencyConversionException
+from .models import Account, AllTransaction, Wallet, WalletBalanceSnapshot, Transaction
+
+# A transaction's effect on its performer's wallet: credits add, debits subtract.
+SIGNED_AMOUNT = Case(
+    When(transaction_type='credit', then=F('amount')),
+    default=-F('amount'),
+    output_field=DecimalField(max_digits=10, decimal_places=2),
+)
+
+def signed_amount(transaction_type, amount):
+    return amount if transaction_type == 'credit' else -amount
+
+def account_currencies(user_ids):
+    """{user_id: currency} of each user's primary account; users without one are left out."""
+    if not user_ids:
+        return {}
+    # Ordered newest first so each user ends up with their primary (first opened) account.
+    return dict(Account.objects.filter(owner_id__in=user_ids).order_by('-date_created', '-id')
+                .values_list('owner_id', 'currency'))
+
+def check_currencies(transactions):
+    """
+    Refuse transactions that are not in their performer's account currency:
+    a wallet's balance is kept in that currency, so adding any other would
+    mix currencies. Users without an account aren't checked.
+    """
+    currencies = account_currencies({txn.performed_by_id for txn in transactions})
+    for txn in transactions:
+        currency = currencies.get(txn.performed_by_id)
+        if currency is not None and txn.currency != currency:
+            raise CurrencyConversionException(
+                detail=f"Transaction {txn.transaction_id or txn.pk} is in {txn.currency}, not the account currency {currency}.")
+
+def apply_deltas(deltas):
+    """Add {user_id: delta} to each user's wallet balance in one database transaction."""
+    changed = [user_id for user_id in deltas if deltas[user_id]]
+    if not changed:
+        return
+    with atomic():
+        wallets = dict(Wallet.objects.filter(owner_id__in=changed).values_list('owner_id', 'pk'))
+        # Update in a fixed order so concurrent writers can't deadlock on each other's rows.
+        for user_id in sorted(wallets):
+            Wallet.objects.filter(pk=wallets[user_id]).update(balance=F('balance') + deltas[user_id])
+        # Queryset updates send no signals.
+        bump_versions(*(scoped('wallet', wallet_id) for wallet_id in wallets.values()))
+
+def post_transactions(transactions, reverse=False, retroactive=False):
+    """
+    Apply (or with ``reverse`` undo) transactions on their performers' wallets.
+    ``retroactive`` also corrects snapshots taken after each transaction, for
+    edits and deletions of transactions that may predate the latest snapshot.
+    """
+    transactions = list(transactions)
+    if not reverse:
+        check_currencies(transactions)
+    deltas = defaultdict(Decimal)
+    with atomic():
+        for txn in transactions:
+            # What the database stored, not an unrounded amount still on the instance.
+            delta = signed_amount(txn.transaction_type, Transaction.stored_amount(txn.amount))
+            delta = -delta if reverse else delta
+            deltas[txn.performed_by_id] += delta
+            if retroactive:
+                WalletBalanceSnapshot.objects.filter(
+                    wallet__owner_id=txn.performed_by_id, taken_at__gte=txn.date_created,
+                ).update(balance=F('balance') + delta)
+        apply_deltas(deltas)
+
+def post_backdated(entries):
+    """
+    Apply (user_id, date, delta) entries to wallets and to the snapshots
+    taken at or after each date, for rows written with past dates.
+    """
+    deltas = defaultdict(Decimal)
+    adjustments = defaultdict(list)
+    for user_id, date, delta in entries:
+        if delta:
+            deltas[user_id] += delta
+            adjustments[user_id].append((date, delta))
+    if not deltas:
+        return
+    with atomic():
+        snapshots = WalletBalanceSnapshot.objects.filter(
+            wallet__owner_id__in=adjustments,
+            taken_at__gte=min(date for user_entries in adjustments.values() for date, _ in user_entries),
+        ).values_list('pk', 'wallet__owner_id', 'taken_at')
+        # One UPDATE per affected snapshot rather than per entry.
+        for snapshot_id, user_id, taken_at in snapshots:
+            delta = sum((delta for date, delta in adjustments[user_id] if date <= taken_at), Decimal(0))
+            if delta:
+                WalletBalanceSnapshot.objects.filter(pk=snapshot_id).update(balance=F('balance') + delta)
+        apply_deltas(deltas)
+
+def post_amount_changes(changes):
+    """
+    Apply in-place amount changes of existing transactions, given as
+    (transaction, old_amount) pairs, to wallets and the snapshots taken since.
+    """
+    check_currencies([txn for txn, _ in changes])
+    post_backdated(
+        (txn.performed_by_id, txn.date_created,
+         signed_amount(txn.transaction_type, txn.amount) - signed_amount(txn.transaction_type, old_amount))
+        for txn, old_amount in changes
+    )
+
+def take_snapshots(wallets=None, chunk_size=500):
+    """Record the current balance of every wallet, locking each chunk while it is read."""
+    wallets = Wallet.objects.all() if wallets is None else wallets
+    wallet_ids = list(wallets.order_by('pk').values_list('pk', flat=True))
+    taken = 0
+    for start in range(0, len(wallet_ids), chunk_size):
+        with atomic():
+            chunk = Wallet.objects.select_for_update().filter(pk__in=wallet_ids[start:start + chunk_size])
+            taken_at = timezone.now()
+            taken += len(WalletBalanceSnapshot.objects.bulk_create([
+                WalletBalanceSnapshot(wallet_id=wallet_id, balance=balance, taken_at=taken_at)
+                for wallet_id, balance in chunk.values_list('pk', 'balance')
+            ]))
+    return taken
+
+def transaction_delta(user_id, after, until=None):
+    # Reads archived transactions too, since ``after`` may predate the archive cutoff.
+    transactions = AllTransaction.objects.filter(performed_by_id=user_id, date_created__gt=after)
+    if until is not None:
+        transactions = transactions.filter(date_created__lte=until)
+    return transactions.aggregate(total=Coalesce(Sum(SIGNED_AMOUNT), Value(Decimal('0.00'))))['total']
+
+def balance_as_of(wallet, when):
+    """
+    Balance of ``wallet`` at ``when``: the latest snapshot taken by then plus
+    the transactions since. Returns None if no snapshot is that old.
+    """
+    snapshot = wallet.balance_snapshots.filter(taken_at__lte=when).order_by('-taken_at').first()
+    if snapshot is None:
+        return None
+    return snapshot.balance + transaction_delta(wallet.owner_id, snapshot.taken_at, when)
+
+def with_expected_balance(wallets):
+    """
+    Annotate wallets with ``expected_balance``: latest snapshot plus the
+    transactions since. Only hot transactions are read; archive_transactions
+    snapshots every wallet past the archive cutoff first.
+    """
+    latest = WalletBalanceSnapshot.objects.filter(wallet=OuterRef('pk')).order_by('-taken_at')
+    delta = Transaction.objects.filter(
+        performed_by=OuterRef('owner_id'), date_created__gt=OuterRef('snapshot_taken_at'),
+    ).order_by().values('performed_by').annotate(total=Sum(SIGNED_AMOUNT)).values('total')
+    return wallets.annotate(
+        snapshot_balance=Subquery(latest.values('balance')[:1]),
+        snapshot_taken_at=Subquery(latest.values('taken_at')[:1]),
+    ).annotate(
+        expected_balance=ExpressionWrapper(
+            F('snapshot_balance') + Coalesce(Subquery(delta), Value(Decimal('0.00'))),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ),
+    )
+
+def reconcile(wallets=None, chunk_size=500):
+    """Yield (wallet_id, balance, expected_balance) for every wallet whose balance disagrees."""
+    wallets = Wallet.objects.all() if wallets is None else wallets
+    wallet_ids = list(wallets.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(wallet_ids), chunk_size):
+        chunk = with_expected_balance(Wallet.objects.filter(pk__in=wallet_ids[start:start + chunk_size]))
+        for wallet_id, balance, expected in chunk.values_list('pk', 'balance', 'expected_balance'):
+            if expected is None or balance != expected:
+                yield wallet_id, balance, expected if expected is None else expected.quantize(Decimal('0.01'))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from API.archive import archive_cutoff, archive_transactions
+
+class Command(BaseCommand):
+    help = 'Move transactions older than the archive horizon into the archive table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon-days', type=int, default=None,
+                            help='Archive transactions older than this. Defaults to TRANSACTION_ARCHIVE["HORIZON_DAYS"].')
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Keep running and archive every INTERVAL seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            moved = archive_transactions(
+                horizon_days=options['horizon_days'], chunk_size=options['chunk_size'],
+                progress=lambda moved: self.stdout.write(f"Archived {moved} transactions..."),
+            )
+            self.stdout.write(f"Archived {moved} transactions created before {archive_cutoff().isoformat()}.")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
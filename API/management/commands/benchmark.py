@@ -0,0 +1,79 @@
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_databases, setup_test_environment, teardown_databases, \
+    teardown_test_environment
+
+from API import benchmark
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway test database and measure latency percentiles, queries per request and peak '
+            'memory for list, retrieve, create and conversion requests, with a local stub FX provider. '
+            'Results are written as JSON and compared against a stored baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=400)
+        parser.add_argument('--transactions', type=int, default=100000,
+                            help='Synthetic transactions to seed; use millions for a full run.')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario.')
+        parser.add_argument('--fx-latency', type=float, default=0, help='Seconds the stub FX provider waits per fetch.')
+        parser.add_argument('--only', action='append', help='Run only scenarios with this prefix (repeatable).')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--baseline', default=str(settings.BASE_DIR / 'benchmarks' / 'baseline.json'))
+        parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed latency and memory growth over the baseline, as a fraction.')
+        parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                            help='Latency growth below this many milliseconds is never a regression.')
+        parser.add_argument('--min-delta-kb', type=float, default=16.0,
+                            help='Peak memory growth below this many KiB is never a regression.')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs.')
+
+    def handle(self, *args, **options):
+        parameters = {key: options[key] for key in ('users', 'transactions', 'requests', 'fx_latency')}
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            with override_settings(FX_RATES=benchmark.fx_settings(options['fx_latency']),
+                                   THROTTLING=benchmark.throttle_settings()):
+                for cache in caches.all():
+                    cache.clear()
+                self.stderr.write(f"Seeding {options['users']} users and {options['transactions']} transactions...")
+                benchmark.seed(options['users'], options['transactions'])
+                results = {'parameters': parameters, 'calibration_ms': benchmark.calibrate(), 'scenarios': {}}
+                for name, send in benchmark.scenarios(options['requests']):
+                    if options['only'] and not any(name.startswith(prefix) for prefix in options['only']):
+                        continue
+                    results['scenarios'][name] = stats = benchmark.measure(send, options['requests'])
+                    self.stdout.write(
+                        f"{name:32} p50 {stats['p50_ms']:8.2f} ms  p90 {stats['p90_ms']:8.2f} ms  "
+                        f"p99 {stats['p99_ms']:8.2f} ms  {stats['queries']:3} queries  {stats['peak_memory_kb']:9.1f} KiB"
+                    )
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+        if options['save_baseline']:
+            with open(options['baseline'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Saved baseline to {options['baseline']}")
+            return
+        try:
+            baseline = benchmark.load_baseline(options['baseline'])
+        except FileNotFoundError:
+            self.stdout.write(f"No baseline at {options['baseline']}; run with --save-baseline to store one.")
+            return
+        if baseline['parameters'] != parameters:
+            self.stdout.write(f"Baseline was recorded with {baseline['parameters']}; comparison may not be meaningful.")
+        if 'calibration_ms' not in baseline:
+            self.stdout.write('Baseline has no calibration time; latencies are compared unscaled.')
+        regressions = benchmark.compare(results, baseline, options['tolerance'], options['min_delta_ms'],
+                                        options['min_delta_kb'])
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+        self.stdout.write('No regressions against the baseline.')
@@ -0,0 +1,57 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from API import fixedpoint
+from API.benchmark import CURRENCIES, fx_settings
+from API.rates import get_rate_provider
+
+class Command(BaseCommand):
+    help = 'Compare per-row Decimal conversion with the fixed-point column engine.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--to', dest='to_currency', default='USD')
+
+    def handle(self, *args, **options):
+        rows, to_currency = options['rows'], options['to_currency']
+        generator = random.Random(0)
+        amounts = [generator.randrange(-10 ** 8, 10 ** 8) for _ in range(rows)]
+        currencies = [generator.choice(CURRENCIES) for _ in range(rows)]
+
+        def per_row():
+            return fixedpoint.convert_minor_units_decimal(amounts, currencies, to_currency)
+
+        if fixedpoint.np is not None:
+            engine = 'numpy'
+            columns = (fixedpoint.np.array(amounts, dtype=fixedpoint.np.int64), fixedpoint.np.array(currencies))
+        else:
+            engine = 'python ints (NumPy is not installed)'
+            columns = (amounts, currencies)
+
+        with override_settings(FX_RATES=fx_settings()):
+            get_rate_provider().clear()
+            per_row_seconds, expected = self.time(per_row, options['repeat'])
+            fixed_seconds, converted = self.time(
+                lambda: fixedpoint.convert_minor_units(*columns, to_currency), options['repeat'])
+
+        mismatches = sum(int(a) != b for a, b in zip(converted, expected))
+        self.stdout.write(f"{rows} rows to {to_currency}, best of {options['repeat']}:")
+        self.stdout.write(f"  per-row convert_currency: {per_row_seconds * 1000:.1f} ms")
+        self.stdout.write(f"  fixed-point ({engine}): {fixed_seconds * 1000:.1f} ms, "
+                          f"{per_row_seconds / fixed_seconds:.1f}x faster")
+        self.stdout.write(f"  rows differing from convert_currency: {mismatches}")
+        if mismatches:
+            raise SystemExit(1)
+
+    def time(self, func, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
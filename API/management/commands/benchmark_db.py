@@ -0,0 +1,102 @@
+import statistics
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.db.models import F
+from django.db.transaction import atomic
+
+from API.benchmark import percentile
+from API.models import CustomUser, Transaction, Wallet
+from JonProject.databases import PROFILES, database_from_env
+
+class Command(BaseCommand):
+    help = ('Measure concurrent write throughput of each database profile: worker threads each insert '
+            'transactions and update their wallet, one database transaction per write, in a throwaway '
+            'test database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', action='append', dest='profiles', choices=PROFILES,
+                            help='Profile to measure (repeatable). Defaults to both SQLite profiles.')
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--writes', type=int, default=500, help='Writes per worker.')
+
+    def handle(self, *args, **options):
+        profiles = options['profiles'] or ['sqlite-default', 'sqlite']
+        with tempfile.TemporaryDirectory() as tmp:
+            for profile in profiles:
+                stats = self.run_profile(profile, Path(tmp), options['workers'], options['writes'])
+                self.stdout.write(
+                    f"{profile:15} {stats['writes_per_second']:9.0f} writes/s  p50 {stats['p50_ms']:7.2f} ms  "
+                    f"p99 {stats['p99_ms']:8.2f} ms  {stats['errors']} failed ({stats['locked']} database is locked)"
+                )
+
+    def run_profile(self, profile, tmp, workers, writes):
+        alias = f'benchmark_{profile.replace("-", "_")}'
+        database = database_from_env(tmp, profile=profile)
+        if database['ENGINE'].endswith('sqlite3'):
+            database['TEST'] = {'NAME': str(tmp / f'{alias}.sqlite3')}
+        # create_test_db() reads and updates settings.DATABASES for the alias too.
+        database = connections.configure_settings({'default': database})['default']
+        settings.DATABASES[alias] = connections.settings[alias] = database
+        connection = connections[alias]
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            users = CustomUser.objects.using(alias).bulk_create([
+                CustomUser(username=f'writer-{i}', password='!', user_type='paid') for i in range(workers)
+            ])
+            Wallet.objects.using(alias).bulk_create([Wallet(owner=user, balance=Decimal('0.00')) for user in users])
+            connection.close()
+            return self.write_concurrently(alias, users, writes)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            connection.close()
+            del connections[alias]
+            connections.settings.pop(alias, None)
+            settings.DATABASES.pop(alias, None)
+
+    def write_concurrently(self, alias, users, writes):
+        timings = []
+        errors = []
+        start_barrier = threading.Barrier(len(users))
+
+        def worker(user):
+            start_barrier.wait()
+            try:
+                for i in range(writes):
+                    started = time.perf_counter()
+                    try:
+                        # Same shape as a posted transaction: insert it and move the wallet balance.
+                        with atomic(using=alias):
+                            Transaction.objects.using(alias).bulk_create([Transaction(
+                                performed_by=user, transaction_type='credit', currency='USD', category='deposits',
+                                amount=Decimal('1.00'), transaction_id=f'{user.pk}-{i}',
+                            )])
+                            Wallet.objects.using(alias).filter(owner=user).update(balance=F('balance') + 1)
+                    except OperationalError as e:
+                        errors.append(str(e))
+                        continue
+                    timings.append(time.perf_counter() - started)
+            finally:
+                connections[alias].close()
+
+        threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return {
+            'writes_per_second': len(timings) / elapsed,
+            'p50_ms': percentile(timings, 0.50) * 1000 if timings else 0,
+            'p99_ms': percentile(timings, 0.99) * 1000 if timings else 0,
+            'mean_ms': statistics.fmean(timings) * 1000 if timings else 0,
+            'errors': len(errors),
+            'locked': sum('locked' in error for error in errors),
+        }
@@ -0,0 +1,60 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.transaction import atomic, set_rollback
+from rest_framework.renderers import JSONRenderer
+
+from API.models import CustomUser, Transaction
+from API.renderers import FastJSONRenderer
+from API.serializers import TransactionSerializer, ValuesSerializer
+
+class Command(BaseCommand):
+    help = ('Compare listing throughput of TransactionSerializer against the ValuesSerializer fast path '
+            'on synthetic rows. The rows are rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with atomic():
+            self.seed(options['rows'])
+            queryset = Transaction.objects.filter(transaction_id__startswith='bench-').order_by('-date_created', '-id')
+            model_time, model_output = self.measure(options['repeat'], lambda: JSONRenderer().render(
+                TransactionSerializer(queryset, many=True).data))
+            fast = ValuesSerializer.for_serializer(TransactionSerializer)
+            fast_time, fast_output = self.measure(options['repeat'], lambda: FastJSONRenderer().render(
+                fast.to_representation(fast.values(queryset))))
+            set_rollback(True)
+
+        if fast_output != model_output:
+            raise CommandError('ValuesSerializer output differs from TransactionSerializer output.')
+        rows = options['rows']
+        self.stdout.write(f"ModelSerializer:  {model_time * 1000:8.1f} ms  {rows / model_time:10.0f} rows/s")
+        self.stdout.write(f"ValuesSerializer: {fast_time * 1000:8.1f} ms  {rows / fast_time:10.0f} rows/s")
+        self.stdout.write(f"Speed-up: {model_time / fast_time:.1f}x, output identical ({len(fast_output)} bytes)")
+
+    def seed(self, rows):
+        user = CustomUser.objects.create(username='bench-serializers', user_type='paid')
+        Transaction.objects.bulk_create([
+            Transaction(
+                performed_by=user,
+                transaction_type=('debit', 'credit')[i % 2],
+                currency=('USD', 'EUR', 'ZAR')[i % 3],
+                category=('payments', 'withdrawals', 'deposits', 'giftcards')[i % 4],
+                amount=Decimal(i % 10000) / 100,
+                transaction_id=f'bench-{i}',
+            )
+            for i in range(rows)
+        ], batch_size=1000)
+
+    def measure(self, repeat, render):
+        # Best of ``repeat`` runs, each including the query.
+        best, output = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = render()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, output
@@ -0,0 +1,49 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from API.imports import FORMATS, import_transactions
+
+class Command(BaseCommand):
+    help = 'Import transactions from a CSV or NDJSON file in the export format, resuming interrupted imports.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, default=None,
+                            help='Defaults to csv for .csv files and ndjson otherwise.')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Validation processes. Defaults to the CPU count; 1 validates in-process.')
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--name', default=None,
+                            help='Checkpoint name. Defaults to the absolute path of the file.')
+        parser.add_argument('--restart', action='store_true', help='Discard the checkpoint and import from the start.')
+        parser.add_argument('--errors', default=None, help='Append rejected records as NDJSON to this file.')
+
+    def handle(self, *args, **options):
+        errors_file = open(options['errors'], 'a') if options['errors'] else None
+        start = time.perf_counter()
+        read = 0
+
+        def report(checkpoint, count, errors):
+            nonlocal read
+            read += count
+            if errors_file is not None:
+                for number, record_errors in errors:
+                    errors_file.write(json.dumps({'record': number, 'errors': record_errors}) + '\n')
+            self.stdout.write(f"{checkpoint.rows_read} read, {checkpoint.imported} imported, {checkpoint.rejected} "
+                              f"rejected ({read / (time.perf_counter() - start):.0f} rows/s)")
+
+        try:
+            checkpoint = import_transactions(
+                options['path'], name=options['name'], format=options['format'], workers=options['workers'],
+                chunk_size=options['chunk_size'], restart=options['restart'], report=report,
+            )
+        finally:
+            if errors_file is not None:
+                errors_file.close()
+        if not read and checkpoint.date_finished is not None:
+            self.stdout.write(f"{checkpoint.name} was already imported; pass --restart to import it again.")
+            return
+        self.stdout.write(f"Done: {checkpoint.imported} imported, {checkpoint.rejected} rejected out of "
+                          f"{checkpoint.rows_read} records in {time.perf_counter() - start:.1f}s.")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from API.ledger import reconcile
+
+class Command(BaseCommand):
+    help = 'Check wallet balances against their latest snapshot plus the transactions since.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        mismatches = 0
+        for wallet_id, balance, expected in reconcile(chunk_size=options['chunk_size']):
+            mismatches += 1
+            self.stdout.write(f"Wallet {wallet_id}: balance {balance}, expected {expected}")
+        if mismatches:
+            raise CommandError(f"{mismatches} wallet(s) do not reconcile.")
+        self.stdout.write("All wallets reconcile.")
@@ -0,0 +1,57 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from API.exceptions import CurrencyConversionException
+from API.models import ExchangeRate
+from API.rates import get_fx_settings, get_upstream_backend
+
+class Command(BaseCommand):
+    help = 'Fetch current FX rates from the upstream into the ExchangeRate snapshot table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base', action='append', dest='bases',
+                            help='Base currency to refresh (repeatable). Defaults to FX_RATES["REFRESH_BASES"].')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Keep running and refresh every INTERVAL seconds.')
+
+    def handle(self, *args, **options):
+        config = get_fx_settings()
+        bases = options['bases'] or config['REFRESH_BASES']
+        backend = get_upstream_backend(config)
+        interval = options['interval']
+
+        while True:
+            self.refresh(backend, bases)
+            if config['SNAPSHOT_RETENTION_DAYS'] is not None:
+                self.prune(config['SNAPSHOT_RETENTION_DAYS'])
+            if not interval:
+                break
+            time.sleep(interval)
+
+    def refresh(self, backend, bases):
+        # All bases in one run share a timestamp so they form a consistent batch.
+        fetched_at = timezone.now()
+        for base in bases:
+            try:
+                quotes = backend.fetch_quotes(base)
+            except CurrencyConversionException as e:
+                self.stderr.write(f"Failed to refresh {base}: {e.detail}")
+                continue
+            ExchangeRate.objects.bulk_create([
+                ExchangeRate(base=base, quote=quote, rate=rate, fetched_at=fetched_at)
+                for quote, rate in quotes.items()
+            ])
+            self.stdout.write(f"Stored {len(quotes)} {base} rates at {fetched_at.isoformat()}")
+
+    def prune(self, retention_days):
+        # Each base keeps its latest snapshot, however old, so a long upstream outage doesn't empty the table.
+        latest = ExchangeRate.objects.filter(base=OuterRef('base')).order_by('-fetched_at').values('fetched_at')[:1]
+        deleted, _ = ExchangeRate.objects.filter(
+            fetched_at__lt=timezone.now() - datetime.timedelta(days=retention_days),
+        ).exclude(fetched_at=Subquery(latest)).delete()
+        if deleted:
+            self.stdout.write(f"Deleted {deleted} rates older than {retention_days} days")
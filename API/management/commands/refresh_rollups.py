@@ -0,0 +1,28 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+
+from API.rollups import rebuild_rollups, refresh_rollups
+
+class Command(BaseCommand):
+    help = 'Recompute the daily rollups of days whose transactions changed, or rebuild a range of days.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Keep running and refresh every INTERVAL seconds.')
+        parser.add_argument('--rebuild', nargs=2, metavar=('DAY_FROM', 'DAY_TO'), type=datetime.date.fromisoformat,
+                            help='Recompute the rollups for an inclusive range of days.')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rebuild_rollups(*options['rebuild'])
+            self.stdout.write(f"Rebuilt rollups from {options['rebuild'][0]} to {options['rebuild'][1]}.")
+            return
+        while True:
+            refreshed = refresh_rollups(chunk_size=options['chunk_size'])
+            self.stdout.write(f"Refreshed the rollups of {refreshed} days.")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from API.conversions import claim_job, run_job
+
+class Command(BaseCommand):
+    help = 'Run queued admin currency conversion jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Keep running and poll for new jobs every INTERVAL seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            while (job := claim_job()) is not None:
+                status = run_job(job)
+                job.refresh_from_db()
+                if status == 'failed':
+                    self.stderr.write(f"Job {job.pk} failed after {job.processed}/{job.total} transactions: {job.error}")
+                else:
+                    self.stdout.write(f"Job {job.pk} converted {job.converted} of {job.total} transactions to {job.to_currency}.")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from API.ledger import take_snapshots
+
+class Command(BaseCommand):
+    help = 'Record the current balance of every wallet as a balance snapshot.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        taken = take_snapshots(chunk_size=options['chunk_size'])
+        self.stdout.write(f"Recorded {taken} wallet balance snapshots.")
@@ -0,0 +1,146 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .principal import get_principal
+from .routers import ReadRouting, current_read_routing, pin_to_primary
+
+def resolve_principal(request):
+    user = request.user
+    if not user.is_authenticated:
+        return None
+    principal = getattr(user, 'principal', None)
+    return principal if principal is not None else get_principal(user.pk)
+
+class PrincipalMiddleware:
+    """
+    Attaches ``request.principal``, loaded on first use. DRF copies the user
+    it authenticates onto the underlying request, so API views see the JWT
+    user here too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.principal = SimpleLazyObject(lambda: resolve_principal(request))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # Still loaded on first use, so async views read it through sync_to_async.
+        request.principal = SimpleLazyObject(lambda: resolve_principal(request))
+        return await self.get_response(request)
+
+def token_user_id(request):
+    """The user id in the request's access token, if it carries a valid one; no database access."""
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        return AccessToken(raw_token).get(api_settings.USER_ID_CLAIM)
+    except TokenError:
+        return None
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets API.routers.ReplicaRouter send a safe request's reads to a replica.
+    After a successful write the client is pinned to the primary for a
+    while: browsers through a short-lived cookie, token clients by user id.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        user_id = token_user_id(request)
+        if request.method in SAFE_METHODS:
+            routing = self.read_routing(request, user_id)
+            token = current_read_routing.set(routing)
+            try:
+                return self.routed(self.get_response(request), routing)
+            finally:
+                current_read_routing.reset(token)
+
+        response = self.get_response(request)
+        if self.pin_client(response) and user_id is not None:
+            pin_to_primary(user_id)
+        return response
+
+    async def __acall__(self, request):
+        user_id = token_user_id(request)
+        if request.method in SAFE_METHODS:
+            # Views run through sync_to_async see it too: asgiref copies the context into the thread.
+            routing = self.read_routing(request, user_id)
+            token = current_read_routing.set(routing)
+            try:
+                return self.routed(await self.get_response(request), routing)
+            finally:
+                current_read_routing.reset(token)
+
+        response = await self.get_response(request)
+        if self.pin_client(response) and user_id is not None:
+            await sync_to_async(pin_to_primary)(user_id)
+        return response
+
+    def routed(self, response, routing):
+        """Keep ``routing`` for the queries a streaming response runs while the server consumes its body."""
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self.astream(response.streaming_content, routing)
+            else:
+                response.streaming_content = self.stream(response.streaming_content, routing)
+        return response
+
+    def stream(self, content, routing):
+        while True:
+            token = current_read_routing.set(routing)
+            try:
+                chunk = next(content)
+            except StopIteration:
+                return
+            finally:
+                current_read_routing.reset(token)
+            yield chunk
+
+    async def astream(self, content, routing):
+        while True:
+            token = current_read_routing.set(routing)
+            try:
+                chunk = await anext(content)
+            except StopAsyncIteration:
+                return
+            finally:
+                current_read_routing.reset(token)
+            yield chunk
+
+    def read_routing(self, request, user_id):
+        pinned = settings.REPLICA_ROUTING['PIN_COOKIE'] in request.COOKIES
+        return ReadRouting(None if pinned else user_id, pinned=pinned)
+
+    def pin_client(self, response):
+        """Pin a browser after a successful write; returns whether the write succeeded."""
+        if response.status_code >= 400:
+            return False
+        config = settings.REPLICA_ROUTING
+        response.set_cookie(config['PIN_COOKIE'], '1', max_age=config['STICKY_SECONDS'],
+                            httponly=True, samesite='Lax')
+        return True
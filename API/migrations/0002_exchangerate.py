@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base', models.CharField(max_length=10)),
+                ('quote', models.CharField(max_length=10)),
+                ('rate', models.DecimalField(decimal_places=12, max_digits=24)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['base', '-fetched_at'], name='API_exchang_base_bb945f_idx')],
+                'constraints': [models.UniqueConstraint(fields=('base', 'quote', 'fetched_at'), name='unique_rate_per_snapshot')],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:31
+
+from uuid import uuid4
+
+import API.models
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_transaction_ids(apps, schema_editor):
+    Transaction = apps.get_model('API', 'Transaction')
+    db = schema_editor.connection.alias
+    # The HTML transaction form saved every row with a blank id; give each its own.
+    for pk in Transaction.objects.using(db).filter(transaction_id='').values_list('pk', flat=True).iterator():
+        Transaction.objects.using(db).filter(pk=pk).update(transaction_id=uuid4().hex)
+    duplicates = list(
+        Transaction.objects.using(db)
+        .values('transaction_id').annotate(n=Count('id')).filter(n__gt=1)
+        .values_list('transaction_id', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            'Cannot make Transaction.transaction_id unique; resolve these duplicated ids first: '
+            + ', '.join(duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0002_exchangerate'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_transaction_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='transaction',
+            name='transaction_id',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['-date_created', '-id'], name='txn_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=API.models.CoveringIndex(covering=('category', 'currency', 'amount'), fields=['performed_by', '-date_created', '-id'], name='txn_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['category', '-date_created'], name='txn_category_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['currency', '-date_created'], name='txn_currency_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['transaction_type', '-date_created'], name='txn_type_date_idx'),
+        ),
+    ]
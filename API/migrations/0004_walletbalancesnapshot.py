@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def snapshot_existing_wallets(apps, schema_editor):
+    # Transactions were never applied to existing balances, so the current
+    # balance becomes each wallet's opening snapshot.
+    Wallet = apps.get_model('API', 'Wallet')
+    WalletBalanceSnapshot = apps.get_model('API', 'WalletBalanceSnapshot')
+    db_alias = schema_editor.connection.alias
+    now = timezone.now()
+    WalletBalanceSnapshot.objects.using(db_alias).bulk_create([
+        WalletBalanceSnapshot(wallet_id=wallet_id, balance=balance, taken_at=now)
+        for wallet_id, balance in Wallet.objects.using(db_alias).values_list('id', 'balance').iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0003_transaction_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('taken_at', models.DateTimeField()),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='API.wallet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['wallet', '-taken_at'], name='snapshot_wallet_taken_idx')],
+            },
+        ),
+        migrations.RunPython(snapshot_existing_wallets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:34
+
+import datetime
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def mark_existing_days(apps, schema_editor):
+    # Every day that already has transactions is rolled up by the next refresh_rollups.
+    RollupDirtyDay = apps.get_model('API', 'RollupDirtyDay')
+    Transaction = apps.get_model('API', 'Transaction')
+    db = schema_editor.connection.alias
+    days = Transaction.objects.using(db).order_by().annotate(day=TruncDate('date_created', tzinfo=datetime.timezone.utc)) \
+        .values_list('day', flat=True).distinct()
+    RollupDirtyDay.objects.using(db).bulk_create([RollupDirtyDay(day=day) for day in days], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0004_walletbalancesnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupDirtyDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TransactionDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('category', models.CharField(choices=[('payments', 'Payments'), ('withdrawals', 'Withdrawals'), ('deposits', 'Deposits'), ('giftcards', 'Giftcards')], max_length=20)),
+                ('currency', models.CharField(max_length=10)),
+                ('credit_total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('debit_total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+                ('performed_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['performed_by', '-day'], name='rollup_user_day_idx'), models.Index(fields=['-day', '-id'], name='rollup_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'performed_by', 'category', 'currency'), name='unique_daily_rollup')],
+            },
+        ),
+        migrations.RunPython(mark_existing_days, migrations.RunPython.noop),
+    ]
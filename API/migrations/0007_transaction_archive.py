@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+COLUMNS = 'id, performed_by_id, transaction_type, currency, category, date_created, amount, transaction_id'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0006_currencyconversionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_type', models.CharField(choices=[('debit', 'Debit'), ('credit', 'Credit')], max_length=10)),
+                ('currency', models.CharField(max_length=10)),
+                ('category', models.CharField(choices=[('payments', 'Payments'), ('withdrawals', 'Withdrawals'), ('deposits', 'Deposits'), ('giftcards', 'Giftcards')], max_length=20)),
+                ('date_created', models.DateTimeField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('transaction_id', models.CharField(max_length=100)),
+            ],
+            options={
+                'db_table': 'API_alltransaction',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchiveWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('cutoff', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('month', models.DateField()),
+                ('transaction_type', models.CharField(choices=[('debit', 'Debit'), ('credit', 'Credit')], max_length=10)),
+                ('currency', models.CharField(max_length=10)),
+                ('category', models.CharField(choices=[('payments', 'Payments'), ('withdrawals', 'Withdrawals'), ('deposits', 'Deposits'), ('giftcards', 'Giftcards')], max_length=20)),
+                ('date_created', models.DateTimeField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('transaction_id', models.CharField(max_length=100, unique=True)),
+                ('performed_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month', 'id'], name='archived_txn_month_idx'), models.Index(fields=['-date_created', '-id'], name='archived_txn_date_idx'), models.Index(fields=['performed_by', '-date_created', '-id'], name='archived_txn_user_date_idx')],
+            },
+        ),
+        migrations.RunSQL(
+            f'CREATE VIEW "API_alltransaction" AS SELECT {COLUMNS} FROM "API_transaction" '
+            f'UNION ALL SELECT {COLUMNS} FROM "API_archivedtransaction"',
+            'DROP VIEW "API_alltransaction"',
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+COLUMNS = 'id, performed_by_id, transaction_type, currency, category, date_created, amount, transaction_id'
+CREATE_VIEW = (
+    f'CREATE VIEW "API_alltransaction" AS SELECT {COLUMNS} FROM "API_transaction" '
+    f'UNION ALL SELECT {COLUMNS} FROM "API_archivedtransaction"'
+)
+DROP_VIEW = 'DROP VIEW "API_alltransaction"'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0007_transaction_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('rows_read', models.BigIntegerField(default=0)),
+                ('imported', models.BigIntegerField(default=0)),
+                ('rejected', models.BigIntegerField(default=0)),
+                ('first_date', models.DateTimeField(null=True)),
+                ('last_date', models.DateTimeField(null=True)),
+                ('date_started', models.DateTimeField(auto_now_add=True)),
+                ('date_finished', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        # SQLite rebuilds the table for this change, which a view over it would block.
+        migrations.RunSQL(DROP_VIEW, CREATE_VIEW),
+        migrations.AlterField(
+            model_name='transaction',
+            name='date_created',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.RunSQL(CREATE_VIEW, DROP_VIEW),
+    ]
@@ -1,6 +1,33 @@
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.transaction import atomic
 from django.conf import settings
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .utils import quantize_money
+
+class CoveringIndex(models.Index):
+    """
+    Index that also stores ``covering`` as non-key (INCLUDE) columns where the
+    database supports them, and is a plain index elsewhere. Unlike
+    Index(include=...) it doesn't make SQLite warn (models.W040).
+    """
+
+    def __init__(self, *args, covering=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.covering = tuple(covering)
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        index = models.Index(fields=self.fields, name=self.name, include=self.covering,
+                             db_tablespace=self.db_tablespace, opclasses=self.opclasses, condition=self.condition)
+        return index.create_sql(model, schema_editor, using=using, **kwargs)
+
+    def deconstruct(self):
+        path, args, kwargs = super().deconstruct()
+        kwargs['covering'] = self.covering
+        return path, args, kwargs
 
 class CustomUser(AbstractUser):
     USER_TYPES = (
@@ -11,6 +38,11 @@ class CustomUser(AbstractUser):
     )
     user_type = models.CharField(max_length=20, choices=USER_TYPES, default='free')
 
+    @cached_property
+    def account(self):
+        # The user's primary (first opened) account.
+        return self.account_set.order_by('date_created', 'id').first()
+
 class Wallet(models.Model):
     owner = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     balance = models.DecimalField(max_digits=10, decimal_places=2)
@@ -50,6 +82,151 @@ class Transaction(models.Model):
     transaction_type = models.CharField(max_length=10, choices=TRANSACTION_TYPES)
     currency = models.CharField(max_length=10)
     category = models.CharField(max_length=20, choices=CATEGORIES)
+    # Not auto_now_add, so bulk imports can write historical dates; still read-only in forms and serializers.
+    date_created = models.DateTimeField(default=timezone.now, editable=False)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    transaction_id = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-date_created', '-id'], name='txn_date_idx'),
+            CoveringIndex(fields=['performed_by', '-date_created', '-id'], name='txn_user_date_idx',
+                          covering=['category', 'currency', 'amount']),
+            models.Index(fields=['category', '-date_created'], name='txn_category_date_idx'),
+            models.Index(fields=['currency', '-date_created'], name='txn_currency_date_idx'),
+            models.Index(fields=['transaction_type', '-date_created'], name='txn_type_date_idx'),
+        ]
+
+    @classmethod
+    def stored_amount(cls, amount):
+        """``amount`` as the database stores it: a Decimal rounded half-even to cents."""
+        return quantize_money(cls._meta.get_field('amount').to_python(amount))
+
+    def clean(self):
+        # Wallets hold their owner's account currency; the ledger refuses anything else.
+        account = self.performed_by.account if self.performed_by_id is not None else None
+        if account is not None and self.currency != account.currency:
+            raise ValidationError({'currency': f"Transactions must be in the account currency ({account.currency})."})
+
+    def save(self, *args, **kwargs):
+        # The ledger posts this instance's amount; make it the one that is stored.
+        self.amount = self.stored_amount(self.amount)
+        # The ledger is updated from post_save; keep it in the same database transaction.
+        with atomic():
+            super().save(*args, **kwargs)
+
+class WalletBalanceSnapshot(models.Model):
+    wallet = models.ForeignKey(Wallet, related_name='balance_snapshots', on_delete=models.CASCADE)
+    balance = models.DecimalField(max_digits=10, decimal_places=2)
+    taken_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=['wallet', '-taken_at'], name='snapshot_wallet_taken_idx')]
+
+class ExchangeRate(models.Model):
+    base = models.CharField(max_length=10)
+    quote = models.CharField(max_length=10)
+    rate = models.DecimalField(max_digits=24, decimal_places=12)
+    fetched_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=['base', '-fetched_at'])]
+        constraints = [
+            models.UniqueConstraint(fields=['base', 'quote', 'fetched_at'], name='unique_rate_per_snapshot'),
+        ]
+
+class TransactionDailyRollup(models.Model):
+    day = models.DateField()
+    performed_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    category = models.CharField(max_length=20, choices=Transaction.CATEGORIES)
+    currency = models.CharField(max_length=10)
+    credit_total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    debit_total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    transaction_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'performed_by', 'category', 'currency'], name='unique_daily_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['performed_by', '-day'], name='rollup_user_day_idx'),
+            models.Index(fields=['-day', '-id'], name='rollup_day_idx'),
+        ]
+
+class RollupDirtyDay(models.Model):
+    # A (UTC) day whose transactions changed since refresh_rollups last ran.
+    day = models.DateField(unique=True)
+
+class CurrencyConversionJob(models.Model):
+    STATUSES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    to_currency = models.CharField(max_length=10)
+    transaction_ids = models.JSONField()
+    total = models.PositiveIntegerField()
+    processed = models.PositiveIntegerField(default=0)
+    converted = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL)
     date_created = models.DateTimeField(auto_now_add=True)
+    date_finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'date_created'], name='conversion_job_status_idx')]
+
+class ArchivedTransaction(models.Model):
+    """A transaction moved out of the hot table by archive_transactions, keeping its id."""
+    id = models.BigIntegerField(primary_key=True)
+    month = models.DateField()
+    performed_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    currency = models.CharField(max_length=10)
+    category = models.CharField(max_length=20, choices=Transaction.CATEGORIES)
+    date_created = models.DateTimeField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    transaction_id = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['month', 'id'], name='archived_txn_month_idx'),
+            models.Index(fields=['-date_created', '-id'], name='archived_txn_date_idx'),
+            models.Index(fields=['performed_by', '-date_created', '-id'], name='archived_txn_user_date_idx'),
+        ]
+
+class ArchiveWatermark(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    cutoff = models.DateTimeField(null=True)
+
+class AllTransaction(models.Model):
+    """
+    Read-only database view over the hot and archived transactions
+    (UNION ALL), for queries that reach into the archive. SQLite migrations
+    that rebuild either table must drop and recreate the view around it.
+    """
+    performed_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, related_name='+',
+                                     db_constraint=False)
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    currency = models.CharField(max_length=10)
+    category = models.CharField(max_length=20, choices=Transaction.CATEGORIES)
+    date_created = models.DateTimeField()
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     transaction_id = models.CharField(max_length=100)
+
+    class Meta:
+        managed = False
+        db_table = 'API_alltransaction'
+
+class ImportCheckpoint(models.Model):
+    """Progress of an import_transactions run, committed with each chunk it writes."""
+    name = models.CharField(max_length=255, unique=True)
+    rows_read = models.BigIntegerField(default=0)
+    imported = models.BigIntegerField(default=0)
+    rejected = models.BigIntegerField(default=0)
+    first_date = models.DateTimeField(null=True)
+    last_date = models.DateTimeField(null=True)
+    date_started = models.DateTimeField(auto_now_add=True)
+    date_finished = models.DateTimeField(null=True, blank=True)
@@ -0,0 +1,117 @@
+import json
+import re
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+def approximate_count(queryset, cap=None):
+    """
+    Cheap row count for paginated listings. On PostgreSQL this is the
+    planner's estimate; elsewhere the count stops at ``cap``.
+    Returns (count, is_estimate).
+    """
+    queryset = queryset.order_by().values('pk')
+    if connections[queryset.db].vendor == 'postgresql':
+        match = re.search(r'rows=(\d+)', queryset.explain())
+        if match:
+            return int(match.group(1)), True
+    cap = cap or settings.APPROXIMATE_COUNT_CAP
+    count = queryset[:cap + 1].count()
+    return min(count, cap), count > cap
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination that seeks on the whole ordering key instead of using
+    OFFSET, so deep pages cost the same as the first. Views set a unique
+    ``cursor_ordering`` (ending in the id); cursors carry every field of it,
+    and rows sharing a timestamp are told apart by the later fields rather
+    than by DRF's offset.
+    """
+
+    ordering = ('-date_created', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        # Positions are unique, so a cursor never needs an offset.
+        return cursor._replace(offset=0) if cursor is not None else None
+
+    def _get_position_from_instance(self, instance, ordering):
+        fields = [order.lstrip('-') for order in ordering]
+        values = [instance[field] for field in fields] if isinstance(instance, dict) else \
+            [getattr(instance, field) for field in fields]
+        return json.dumps([str(value) for value in values])
+
+    def seek(self, queryset, position, reverse):
+        """Rows after ``position`` in (optionally reversed) ordering: (a < x) or (a = x and b < y) ..."""
+        try:
+            values = json.loads(position)
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError(position)
+            condition = Q()
+            equal = {}
+            for order, value in zip(self.ordering, values):
+                field = order.lstrip('-')
+                lookup = 'lt' if reverse != order.startswith('-') else 'gt'
+                condition |= Q(**equal, **{f'{field}__{lookup}': value})
+                equal[field] = value
+            return queryset.filter(condition)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count, self.count_is_estimate = approximate_count(queryset)
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse, current_position = (self.cursor.reverse, self.cursor.position) if self.cursor else (False, None)
+
+        ordering = tuple(order[1:] if order.startswith('-') else f'-{order}' for order in self.ordering) \
+            if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if current_position is not None:
+            queryset = self.seek(queryset, current_position, reverse)
+        # One extra row tells whether there is a following page.
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = self._get_position_from_instance(results[-1], self.ordering) \
+            if len(results) > self.page_size else None
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.next_position = current_position is not None, current_position
+            self.has_previous, self.previous_position = following_position is not None, following_position
+        else:
+            self.has_next, self.next_position = following_position is not None, following_position
+            self.has_previous, self.previous_position = current_position is not None, current_position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'count_is_estimate': self.count_is_estimate,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count'] = {'type': 'integer'}
+        response_schema['properties']['count_is_estimate'] = {'type': 'boolean'}
+        return response_schema
@@ -0,0 +1,61 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import CustomUser, Account
+
+# What throttling and token claims need to know about a user; the only part of a principal that is cached.
+PrincipalClaims = namedtuple('PrincipalClaims', ('user_id', 'user_type', 'account_id', 'tier', 'currency'))
+
+class Principal:
+    """The authenticated user with their primary account and tier."""
+
+    def __init__(self, user, account):
+        self.user = user
+        self.account = account
+        self.tier = account.tier if account else None
+        self.user_type = user.user_type
+        # Let user.account and user.principal resolve without further queries.
+        user.__dict__['account'] = account
+        user.principal = self
+
+    def claims(self):
+        return PrincipalClaims(self.user.pk, self.user_type, self.account.pk if self.account else None, self.tier,
+                               self.account.currency if self.account else None)
+
+def principal_cache():
+    alias = settings.PRINCIPAL_CACHE['ALIAS']
+    return caches[alias] if alias else None
+
+def principal_cache_key(user_id):
+    return f'principal:{user_id}'
+
+def get_principal(user_id):
+    """
+    Load the user with their primary account: one query when they have one.
+    Raises CustomUser.DoesNotExist.
+    """
+    account = Account.objects.select_related('owner').filter(owner_id=user_id).order_by('date_created', 'id').first()
+    user = account.owner if account is not None else CustomUser.objects.get(pk=user_id)
+    return Principal(user, account)
+
+def get_principal_claims(user_id):
+    """
+    PrincipalClaims for ``user_id``, from the shared cache when
+    PRINCIPAL_CACHE names one. Only these ids and values are cached, never
+    the user row. Raises CustomUser.DoesNotExist.
+    """
+    cache = principal_cache()
+    if cache is None:
+        return get_principal(user_id).claims()
+    claims = cache.get(principal_cache_key(user_id))
+    if claims is None:
+        claims = get_principal(user_id).claims()
+        cache.set(principal_cache_key(user_id), claims, settings.PRINCIPAL_CACHE['TTL'])
+    return claims
+
+def invalidate_principal(user_id):
+    cache = principal_cache()
+    if cache is not None:
+        cache.delete(principal_cache_key(user_id))
@@ -0,0 +1,346 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from bisect import bisect_right
+from decimal import Decimal, InvalidOperation
+
+import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from .exceptions import CurrencyConversionException
+from .instrumentation import span
+from .models import ExchangeRate
+from .rates import get_upstream_backend
+
+class RateBackend:
+    """
+    Source of FX quotes. ``fetch_quotes`` returns {quote: Decimal} for a base
+    currency; ``afetch_quotes`` is the coroutine variant, which by default
+    runs ``fetch_quotes`` in a worker thread. The ``_at`` variants also
+    return the Unix time the quotes were taken, now for live sources.
+    """
+
+    def fetch_quotes(self, base_currency):
+        raise NotImplementedError
+
+    async def afetch_quotes(self, base_currency):
+        return await sync_to_async(self.fetch_quotes, thread_sensitive=False)(base_currency)
+
+    def fetch_quotes_at(self, base_currency):
+        return self.fetch_quotes(base_currency), time.time()
+
+    async def afetch_quotes_at(self, base_currency):
+        return await self.afetch_quotes(base_currency), time.time()
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures and rejects calls
+    until ``reset_timeout`` seconds have passed, then lets one trial call through.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half-open: allow a single trial request.
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+class CurrencyAPIBackend(RateBackend):
+    """
+    currencyapi.com client using a pooled keep-alive session. The async
+    variant uses a pooled httpx.AsyncClient when httpx is installed.
+    """
+
+    url = 'https://api.currencyapi.com/v3/latest'
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(self, api_key='', pool_size=10, connect_timeout=3.05, read_timeout=5,
+                 max_retries=2, backoff_factor=0.2, max_backoff=2, failure_threshold=5,
+                 reset_timeout=30):
+        self.api_key = api_key
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # {event loop: (httpx client, the async generator that closes it)}
+        self._async_clients = {}
+        self._async_clients_lock = threading.Lock()
+
+    def check_configured(self):
+        if not self.api_key:
+            raise CurrencyConversionException(detail="Currency service is not configured (set CURRENCY_API_KEY).")
+
+    def fetch_quotes(self, base_currency):
+        self.check_configured()
+        if not self.breaker.allow_request():
+            raise CurrencyConversionException(detail="Currency service is temporarily unavailable.")
+        try:
+            data = self._get({'apikey': self.api_key, 'base_currency': base_currency})
+        except requests.exceptions.RequestException as e:
+            self.breaker.record_failure()
+            raise CurrencyConversionException(detail=f"Request failed: {e}")
+        self.breaker.record_success()
+        return self.parse(data)
+
+    def _get(self, params):
+        attempt = 0
+        while True:
+            try:
+                with span('http'):
+                    response = self.session.get(self.url, params=params, timeout=self.timeout)
+                if response.status_code not in self.retry_statuses or attempt >= self.max_retries:
+                    response.raise_for_status()  # Raise an error for bad status codes
+                    return response.json()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+            attempt += 1
+            time.sleep(self._backoff(attempt))
+
+    async def afetch_quotes(self, base_currency):
+        if httpx is None:
+            return await super().afetch_quotes(base_currency)
+        self.check_configured()
+        if not self.breaker.allow_request():
+            raise CurrencyConversionException(detail="Currency service is temporarily unavailable.")
+        try:
+            data = await self._aget({'apikey': self.api_key, 'base_currency': base_currency})
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            raise CurrencyConversionException(detail=f"Request failed: {e}")
+        self.breaker.record_success()
+        return self.parse(data)
+
+    async def get_async_client(self):
+        """
+        The httpx client of the running event loop; httpx clients are bound to
+        the loop they were first used on. Each is closed while its loop shuts
+        down, so the loops asgiref starts per request under WSGI don't leave
+        clients and their connections behind.
+        """
+        loop = asyncio.get_running_loop()
+        with self._async_clients_lock:
+            # Loops closed without finalizing their async generators; their clients can't be closed any more.
+            for closed in [other for other in self._async_clients if other.is_closed()]:
+                del self._async_clients[closed]
+            entry = self._async_clients.get(loop)
+        if entry is None:
+            keeper = self._keep_async_client(loop)
+            entry = (await keeper.__anext__(), keeper)
+            with self._async_clients_lock:
+                self._async_clients[loop] = entry
+        return entry[0]
+
+    async def _keep_async_client(self, loop):
+        # asyncio.run() and asgiref finalize pending async generators (shutdown_asyncgens)
+        # before closing their loop, which runs this finally clause while the loop still works.
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+        )
+        try:
+            yield client
+        finally:
+            with self._async_clients_lock:
+                self._async_clients.pop(loop, None)
+            await client.aclose()
+
+    async def _aget(self, params):
+        client = await self.get_async_client()
+        attempt = 0
+        while True:
+            try:
+                with span('http'):
+                    response = await client.get(self.url, params=params)
+                if response.status_code not in self.retry_statuses or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response.json()
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+            attempt += 1
+            await asyncio.sleep(self._backoff(attempt))
+
+    def _backoff(self, attempt):
+        # Exponential backoff with full jitter.
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+
+    @staticmethod
+    def parse(data):
+        try:
+            # Check if the response structure is as expected
+            if 'data' not in data:
+                raise ValueError(f"Unexpected response structure: {data}")
+            return {quote: Decimal(str(entry['value'])) for quote, entry in data['data'].items()}
+        except KeyError as e:
+            raise CurrencyConversionException(detail=f"Key error in response data: {e}")
+        except InvalidOperation as e:
+            raise CurrencyConversionException(detail=f"Decimal conversion error: {e}")
+        except ValueError as e:
+            raise CurrencyConversionException(detail=f"Value error: {e}")
+
+class FixtureBackend(RateBackend):
+    """
+    Serves quotes from a JSON file or dict of the form {base: {quote: rate}},
+    so the conversion path can run without the network.
+    """
+
+    def __init__(self, path=None, rates=None, latency=0):
+        if path is not None:
+            with open(path) as f:
+                rates = json.load(f)
+        self.rates = {
+            base: {quote: Decimal(str(rate)) for quote, rate in quotes.items()}
+            for base, quotes in (rates or {}).items()
+        }
+        self.latency = latency
+
+    def fetch_quotes(self, base_currency):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._quotes(base_currency)
+
+    async def afetch_quotes(self, base_currency):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._quotes(base_currency)
+
+    def _quotes(self, base_currency):
+        if base_currency not in self.rates:
+            raise CurrencyConversionException(detail=f"No fixture rates for {base_currency}.")
+        return dict(self.rates[base_currency])
+
+def load_snapshot(base_currency, as_of=None):
+    """
+    Return ({quote: rate}, fetched_at) for the latest stored snapshot of
+    ``base_currency``, or the latest one taken at or before ``as_of``.
+    """
+    snapshots = ExchangeRate.objects.filter(base=base_currency)
+    if as_of is not None:
+        snapshots = snapshots.filter(fetched_at__lte=as_of)
+    fetched_at = snapshots.order_by('-fetched_at').values_list('fetched_at', flat=True).first()
+    if fetched_at is None:
+        return {}, None
+    rows = snapshots.filter(fetched_at=fetched_at).values_list('quote', 'rate')
+    return dict(rows), fetched_at
+
+async def aload_snapshot(base_currency):
+    """Async variant of load_snapshot() for the latest snapshot."""
+    snapshots = ExchangeRate.objects.filter(base=base_currency)
+    fetched_at = await snapshots.order_by('-fetched_at').values_list('fetched_at', flat=True).afirst()
+    if fetched_at is None:
+        return {}, None
+    rows = snapshots.filter(fetched_at=fetched_at).values_list('quote', 'rate')
+    return {quote: rate async for quote, rate in rows}, fetched_at
+
+class SnapshotBackend(RateBackend):
+    """
+    Serves quotes from the ExchangeRate table kept current by the
+    ``refresh_rates`` command, so request handlers never wait on the upstream.
+    With ``fallback_to_upstream`` a base that has never been refreshed is
+    fetched from the configured upstream instead of failing.
+    """
+
+    def __init__(self, fallback_to_upstream=False):
+        self.fallback_to_upstream = fallback_to_upstream
+        self._upstream = None
+
+    def fetch_quotes(self, base_currency):
+        return self.fetch_quotes_at(base_currency)[0]
+
+    async def afetch_quotes(self, base_currency):
+        return (await self.afetch_quotes_at(base_currency))[0]
+
+    def fetch_quotes_at(self, base_currency):
+        # Stamped with the snapshot's time, so the provider stops serving it once refresh_rates falls behind.
+        quotes, fetched_at = load_snapshot(base_currency)
+        if fetched_at is not None:
+            return quotes, fetched_at.timestamp()
+        return self.upstream(base_currency).fetch_quotes_at(base_currency)
+
+    async def afetch_quotes_at(self, base_currency):
+        quotes, fetched_at = await aload_snapshot(base_currency)
+        if fetched_at is not None:
+            return quotes, fetched_at.timestamp()
+        return await self.upstream(base_currency).afetch_quotes_at(base_currency)
+
+    def upstream(self, base_currency):
+        if not self.fallback_to_upstream:
+            raise CurrencyConversionException(detail=f"No stored rates for {base_currency}.")
+        if self._upstream is None:
+            self._upstream = get_upstream_backend()
+        return self._upstream
+
+class SnapshotHistory:
+    """
+    Every stored snapshot of ``base_currency`` between ``start`` and ``end``,
+    loaded in one query, for point-in-time lookups in backfill and reporting
+    jobs. The latest snapshot taken before ``start`` is included so the
+    start of the range resolves too.
+    """
+
+    def __init__(self, base_currency, start=None, end=None):
+        snapshots = ExchangeRate.objects.filter(base=base_currency)
+        if start is not None:
+            first = snapshots.filter(fetched_at__lte=start).order_by('-fetched_at') \
+                .values_list('fetched_at', flat=True).first()
+            snapshots = snapshots.filter(fetched_at__gte=first or start)
+        if end is not None:
+            snapshots = snapshots.filter(fetched_at__lte=end)
+        self.base_currency = base_currency
+        self.times = []
+        self.quotes = []
+        for fetched_at, quote, rate in snapshots.order_by('fetched_at').values_list('fetched_at', 'quote', 'rate'):
+            if not self.times or self.times[-1] != fetched_at:
+                self.times.append(fetched_at)
+                self.quotes.append({})
+            self.quotes[-1][quote] = rate
+
+    def quotes_as_of(self, when):
+        index = bisect_right(self.times, when) - 1
+        if index < 0:
+            raise CurrencyConversionException(detail=f"No stored rates for {self.base_currency} as of {when}.")
+        return self.quotes[index]
+
+    def rate(self, quote, when):
+        if quote == self.base_currency:
+            return Decimal(1)
+        try:
+            return self.quotes_as_of(when)[quote]
+        except KeyError:
+            raise CurrencyConversionException(detail=f"No rate available for {self.base_currency} to {quote}.")
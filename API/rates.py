@@ -0,0 +1,311 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .exceptions import CurrencyConversionException
+
+DEFAULT_FX_RATES = {
+    'BACKEND': 'API.rate_clients.CurrencyAPIBackend',
+    'BACKEND_OPTIONS': {},
+    'UPSTREAM': 'API.rate_clients.CurrencyAPIBackend',
+    'UPSTREAM_OPTIONS': {},
+    'REFRESH_BASES': ['USD'],
+    'SNAPSHOT_RETENTION_DAYS': 90,
+    'TTL': 300,
+    'MAX_STALE': 3600,
+    'MAX_ENTRIES': 4096,
+    'PIVOT_CURRENCY': 'USD',
+    'SHARED_CACHE': None,
+}
+
+def get_fx_settings():
+    return {**DEFAULT_FX_RATES, **getattr(settings, 'FX_RATES', {})}
+
+def get_rate_backend(config=None):
+    config = config or get_fx_settings()
+    return import_string(config['BACKEND'])(**config['BACKEND_OPTIONS'])
+
+def get_upstream_backend(config=None):
+    config = config or get_fx_settings()
+    return import_string(config['UPSTREAM'])(**config['UPSTREAM_OPTIONS'])
+
+class RateTable:
+    """Thread-safe LRU table mapping (base, quote) to (rate, fetched_at)."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, base, quote):
+        with self._lock:
+            entry = self._entries.get((base, quote))
+            if entry is not None:
+                self._entries.move_to_end((base, quote))
+            return entry
+
+    def update(self, base, quotes, fetched_at):
+        with self._lock:
+            for quote, rate in quotes.items():
+                self._entries[(base, quote)] = (rate, fetched_at)
+                self._entries.move_to_end((base, quote))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class RateProvider:
+    """
+    Serves FX rates from memory, falling back to one upstream fetch per base
+    currency. Pairs that are not cached directly are triangulated through the
+    pivot currency, so a single pivot fetch covers every pair it quotes.
+    The ``a``-prefixed methods are the async variants; concurrent misses for
+    the same base share one fetch.
+
+    ``fetch(base)`` returns ({quote: rate}, fetched_at), the Unix time the
+    source took the quotes. Rates age from then, not from when they were
+    loaded, so quotes older than ``max_stale`` are refused however recently
+    they were read.
+    """
+
+    def __init__(self, fetch, ttl=300, max_stale=3600, max_entries=4096,
+                 pivot_currency='USD', shared_cache=None, afetch=None):
+        self.fetch = fetch
+        self.afetch = afetch
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.pivot_currency = pivot_currency
+        self.shared_cache = caches[shared_cache] if shared_cache else None
+        self.table = RateTable(max_entries)
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._loaded_at = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.fetches = 0
+
+    def get_rate(self, base, quote):
+        if base == quote:
+            return Decimal(1)
+        now = time.time()
+        rate = self._cached_rate(base, quote, now, self.ttl)
+        if rate is not None:
+            self._count('hits')
+            return rate
+        self._count('misses')
+        try:
+            return self._refresh_rate(base, quote)
+        except CurrencyConversionException as error:
+            return self._stale_rate(base, quote, now, error)
+
+    async def aget_rate(self, base, quote):
+        if base == quote:
+            return Decimal(1)
+        now = time.time()
+        rate = self._cached_rate(base, quote, now, self.ttl)
+        if rate is not None:
+            self._count('hits')
+            return rate
+        self._count('misses')
+        try:
+            return await self._arefresh_rate(base, quote)
+        except CurrencyConversionException as error:
+            return self._stale_rate(base, quote, now, error)
+
+    def get_rates(self, pairs):
+        """Resolve many (base, quote) pairs, fetching each base at most once."""
+        return {(base, quote): self.get_rate(base, quote) for base, quote in set(pairs)}
+
+    async def aget_rates(self, pairs):
+        """Resolve many (base, quote) pairs concurrently."""
+        pairs = list(set(pairs))
+        rates = await asyncio.gather(*(self.aget_rate(base, quote) for base, quote in pairs))
+        return dict(zip(pairs, rates))
+
+    def prefetch(self, base):
+        """Fetch all quotes for ``base`` and load them into the rate table."""
+        quotes, fetched_at = self._load_shared(base)
+        if quotes is None:
+            quotes, fetched_at = self.fetch(base)
+            self._count('fetches')
+            self._store_shared(base, quotes, fetched_at)
+        self._loaded(base, quotes, fetched_at)
+        return quotes
+
+    async def aprefetch(self, base):
+        loop = asyncio.get_running_loop()
+        task = self._inflight.get((loop, base))
+        if task is None:
+            task = loop.create_task(self._aprefetch(base))
+            self._inflight[(loop, base)] = task
+            task.add_done_callback(lambda _: self._inflight.pop((loop, base), None))
+        # Shield the shared fetch so one cancelled caller doesn't cancel it for the others.
+        return await asyncio.shield(task)
+
+    async def _aprefetch(self, base):
+        quotes, fetched_at = await self._aload_shared(base)
+        if quotes is None:
+            if self.afetch is not None:
+                quotes, fetched_at = await self.afetch(base)
+            else:
+                quotes, fetched_at = await asyncio.to_thread(self.fetch, base)
+            self._count('fetches')
+            await self._astore_shared(base, quotes, fetched_at)
+        self._loaded(base, quotes, fetched_at)
+        return quotes
+
+    def _loaded(self, base, quotes, fetched_at):
+        self.table.update(base, quotes, fetched_at)
+        self._loaded_at[base] = (quotes, time.time())
+
+    def _recent_quotes(self, base):
+        # Quotes loaded within the TTL, however old: the source had nothing newer then.
+        quotes, loaded_at = self._loaded_at.get(base, (None, 0))
+        return quotes if time.time() - loaded_at <= self.ttl else None
+
+    def _count(self, counter):
+        # Threaded servers share one provider; += on an attribute is not atomic.
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_hits': self.stale_hits,
+            'fetches': self.fetches,
+            'entries': len(self.table),
+        }
+
+    def clear(self):
+        self.table.clear()
+        self._loaded_at.clear()
+        self.hits = self.misses = self.stale_hits = self.fetches = 0
+
+    def _fresh(self, base, quote, now, max_age):
+        entry = self.table.get(base, quote)
+        if entry is not None and now - entry[1] <= max_age:
+            return entry[0]
+        return None
+
+    def _cached_rate(self, base, quote, now, max_age):
+        rate = self._fresh(base, quote, now, max_age)
+        if rate is not None:
+            return rate
+        return self._triangulate(base, quote, now, max_age)
+
+    def _triangulate(self, base, quote, now, max_age):
+        pivot = self.pivot_currency
+        pivot_to_base = Decimal(1) if base == pivot else self._fresh(pivot, base, now, max_age)
+        pivot_to_quote = Decimal(1) if quote == pivot else self._fresh(pivot, quote, now, max_age)
+        if not pivot_to_base or pivot_to_quote is None:
+            return None
+        return pivot_to_quote / pivot_to_base
+
+    def _stale_rate(self, base, quote, now, error):
+        rate = self._cached_rate(base, quote, now, self.max_stale)
+        if rate is None:
+            raise error
+        self._count('stale_hits')
+        return rate
+
+    def _pivot_rate(self, base, quote, pivot_quotes):
+        if (base == self.pivot_currency or base in pivot_quotes) and \
+                (quote == self.pivot_currency or quote in pivot_quotes):
+            return self._cached_rate(base, quote, time.time(), self.max_stale)
+        return None
+
+    def _direct_rate(self, base, quote, quotes):
+        if quote not in quotes:
+            raise CurrencyConversionException(detail=f"No rate available for {base} to {quote}.")
+        rate = self._fresh(base, quote, time.time(), self.max_stale)
+        if rate is None:
+            raise CurrencyConversionException(detail=f"Rates for {base} are out of date.")
+        return rate
+
+    def _refresh_rate(self, base, quote):
+        if self.pivot_currency:
+            pivot_quotes = self._recent_quotes(self.pivot_currency) or self.prefetch(self.pivot_currency)
+            rate = self._pivot_rate(base, quote, pivot_quotes)
+            if rate is not None:
+                return rate
+        return self._direct_rate(base, quote, self._recent_quotes(base) or self.prefetch(base))
+
+    async def _arefresh_rate(self, base, quote):
+        if self.pivot_currency:
+            pivot_quotes = self._recent_quotes(self.pivot_currency) or await self.aprefetch(self.pivot_currency)
+            rate = self._pivot_rate(base, quote, pivot_quotes)
+            if rate is not None:
+                return rate
+        return self._direct_rate(base, quote, self._recent_quotes(base) or await self.aprefetch(base))
+
+    def _shared_key(self, base):
+        return f'fx:quotes:{base}'
+
+    def _decode_shared(self, cached):
+        if not cached or time.time() - cached['fetched_at'] > self.ttl:
+            return None, None
+        return {quote: Decimal(rate) for quote, rate in cached['quotes'].items()}, cached['fetched_at']
+
+    def _encode_shared(self, quotes, fetched_at):
+        return {'quotes': {quote: str(rate) for quote, rate in quotes.items()}, 'fetched_at': fetched_at}
+
+    def _load_shared(self, base):
+        if self.shared_cache is None:
+            return None, None
+        return self._decode_shared(self.shared_cache.get(self._shared_key(base)))
+
+    async def _aload_shared(self, base):
+        if self.shared_cache is None:
+            return None, None
+        return self._decode_shared(await self.shared_cache.aget(self._shared_key(base)))
+
+    def _store_shared(self, base, quotes, fetched_at):
+        if self.shared_cache is not None:
+            self.shared_cache.set(self._shared_key(base), self._encode_shared(quotes, fetched_at), timeout=self.max_stale)
+
+    async def _astore_shared(self, base, quotes, fetched_at):
+        if self.shared_cache is not None:
+            await self.shared_cache.aset(self._shared_key(base), self._encode_shared(quotes, fetched_at),
+                                         timeout=self.max_stale)
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_rate_provider():
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                config = get_fx_settings()
+                backend = get_rate_backend(config)
+                _provider = RateProvider(
+                    backend.fetch_quotes_at,
+                    afetch=backend.afetch_quotes_at,
+                    ttl=config['TTL'],
+                    max_stale=config['MAX_STALE'],
+                    max_entries=config['MAX_ENTRIES'],
+                    pivot_currency=config['PIVOT_CURRENCY'],
+                    shared_cache=config['SHARED_CACHE'],
+                )
+    return _provider
+
+@receiver(setting_changed)
+def reset_rate_provider(*, setting=None, **kwargs):
+    global _provider
+    if setting in (None, 'FX_RATES', 'CACHES'):
+        _provider = None
@@ -0,0 +1,74 @@
+import datetime
+
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.db.transaction import atomic
+
+from .models import AllTransaction, RollupDirtyDay, TransactionDailyRollup
+
+ROLLUP_KEY = ('day', 'performed_by', 'category', 'currency')
+ROLLUP_TOTALS = ('credit_total', 'debit_total', 'transaction_count')
+
+def aggregate(transactions):
+    """Group transactions into per-day (UTC), per-user, per-category, per-currency totals."""
+    day = TruncDate('date_created', tzinfo=datetime.timezone.utc)
+    return transactions.order_by().annotate(day=day).values(*ROLLUP_KEY).annotate(
+        credit_total=Sum('amount', filter=Q(transaction_type='credit'), default=0),
+        debit_total=Sum('amount', filter=Q(transaction_type='debit'), default=0),
+        transaction_count=Count('id'),
+    )
+
+def utc_day(when):
+    return when.astimezone(datetime.timezone.utc).date()
+
+def mark_days_dirty(dates):
+    """
+    Queue the (UTC) days of ``dates`` for refresh_rollups. Call it in the
+    database transaction that writes those transactions, so the mark commits
+    exactly when the change does.
+    """
+    RollupDirtyDay.objects.bulk_create([RollupDirtyDay(day=day) for day in {utc_day(when) for when in dates}],
+                                       ignore_conflicts=True)
+
+def recompute(days):
+    """Replace the rollups of ``days`` with totals read from every transaction, archived ones included."""
+    TransactionDailyRollup.objects.filter(day__in=days).delete()
+    rollups = []
+    for day in days:
+        start = datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.timezone.utc)
+        groups = aggregate(AllTransaction.objects.filter(
+            date_created__gte=start, date_created__lt=start + datetime.timedelta(days=1)))
+        rollups.extend(
+            TransactionDailyRollup(
+                day=group['day'], performed_by_id=group['performed_by'], category=group['category'],
+                currency=group['currency'], **{field: group[field] for field in ROLLUP_TOTALS},
+            )
+            for group in groups
+        )
+    TransactionDailyRollup.objects.bulk_create(rollups, batch_size=500)
+
+def refresh_rollups(chunk_size=None):
+    """
+    Recompute the rollups of every day whose transactions were created,
+    edited or deleted since the last run, ``chunk_size`` days per database
+    transaction. Days are marked by the writers themselves, so late commits
+    and backdated rows are picked up like any other change. Returns the
+    number of days refreshed.
+    """
+    chunk_size = chunk_size or settings.ROLLUP_CHUNK_SIZE
+    refreshed = 0
+    while True:
+        with atomic():
+            dirty = list(RollupDirtyDay.objects.select_for_update().order_by('day')[:chunk_size])
+            if not dirty:
+                return refreshed
+            # A writer marking one of these days again after this point leaves a new mark for the next run.
+            RollupDirtyDay.objects.filter(pk__in=[mark.pk for mark in dirty]).delete()
+            recompute([mark.day for mark in dirty])
+        refreshed += len(dirty)
+
+def rebuild_rollups(day_from, day_to):
+    """Recompute the rollups for days in [day_from, day_to] from scratch, whether marked or not."""
+    with atomic():
+        recompute([day_from + datetime.timedelta(days=n) for n in range((day_to - day_from).days + 1)])
@@ -0,0 +1,69 @@
+import contextvars
+import random
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+def replica_settings():
+    return settings.REPLICA_ROUTING
+
+def pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+def pin_to_primary(user_id):
+    """Send ``user_id``'s reads to the primary for STICKY_SECONDS, so they see their own writes."""
+    config = replica_settings()
+    caches[config['CACHE']].set(pin_key(user_id), True, config['STICKY_SECONDS'])
+
+class ReadRouting:
+    """
+    Whether the current request may read from a replica. A ``user_id`` is
+    looked up in the pin cache on the request's first read.
+    """
+
+    def __init__(self, user_id=None, pinned=False):
+        self.user_id = user_id
+        self._use_replica = False if pinned else None
+
+    @property
+    def use_replica(self):
+        if self._use_replica is None:
+            config = replica_settings()
+            self._use_replica = self.user_id is None or \
+                not caches[config['CACHE']].get(pin_key(self.user_id))
+        return self._use_replica
+
+# Set by ReplicaRoutingMiddleware for safe requests; reads anywhere else use the primary.
+current_read_routing = contextvars.ContextVar('current_read_routing', default=None)
+
+class ReplicaRouter:
+    """
+    Sends reads made while handling safe (GET/HEAD/OPTIONS) requests to a
+    random replica from REPLICA_ROUTING['REPLICAS']. Writes, reads inside a
+    transaction, reads outside a request and reads by a user who wrote in
+    the last STICKY_SECONDS go to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = replica_settings()['REPLICAS']
+        routing = current_read_routing.get()
+        if not replicas or routing is None or connections[DEFAULT_DB_ALIAS].in_atomic_block \
+                or not routing.use_replica:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_settings()['REPLICAS']}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get their schema from the primary.
+        if db in replica_settings()['REPLICAS']:
+            return False
+        return None
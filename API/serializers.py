@@ -1,20 +1,208 @@
+import time
+from decimal import Decimal
+from functools import lru_cache
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Wallet, Account, Transaction
+from rest_framework.settings import ISO_8601, api_settings
+from rest_framework.validators import UniqueValidator
+from .models import Wallet, Account, Transaction, TransactionDailyRollup, AllTransaction
 from django.contrib.auth import get_user_model
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .principal import get_principal
+from .authentication import REFRESH_JTI_CLAIM, check_token
+from .instrumentation import span
 
 User = get_user_model()
 
-class WalletSerializer(serializers.ModelSerializer):
+class TimedModelSerializer(serializers.ModelSerializer):
+    """Counts to_representation towards the request's serializer span."""
+
+    def to_representation(self, instance):
+        with span('serializer'):
+            return super().to_representation(instance)
+
+class WalletSerializer(TimedModelSerializer):
     class Meta:
         model = Wallet
         fields = '__all__'
+        # Balances only move through the ledger.
+        read_only_fields = ('balance',)
 
-class AccountSerializer(serializers.ModelSerializer):
+class AccountSerializer(TimedModelSerializer):
     class Meta:
         model = Account
         fields = '__all__'
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(TimedModelSerializer):
     class Meta:
         model = Transaction
         fields = '__all__'
+        # Archived transactions keep their ids reserved.
+        extra_kwargs = {'transaction_id': {'validators': [UniqueValidator(
+            queryset=AllTransaction.objects.all(), message='transaction with this transaction id already exists.',
+        )]}}
+
+class ValuesSerializer:
+    """
+    Read-only fast path for listing with a plain ModelSerializer: rows come
+    from ``.values()`` and each field goes through a converter picked once
+    per serializer class, producing the same output as ``to_representation``.
+    """
+
+    def __init__(self, serializer_class):
+        self.fields = [
+            (name, '__'.join(field.source_attrs), field)
+            for name, field in serializer_class().fields.items() if not field.write_only
+        ]
+        self.columns = [column for _, column, _ in self.fields]
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def for_serializer(cls, serializer_class):
+        return cls(serializer_class)
+
+    def values(self, queryset):
+        return queryset.values(*self.columns)
+
+    def converter(self, field):
+        if isinstance(field, serializers.DecimalField) and field.decimal_places is not None \
+                and not field.localize and not field.normalize_output \
+                and getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING):
+            exponent = -field.decimal_places
+            # Stored decimals already have the field's places; anything else takes the slow path.
+            return lambda value: f'{value:f}' if value.as_tuple().exponent == exponent else field.to_representation(value)
+        if isinstance(field, serializers.DateTimeField) and getattr(field, 'format', api_settings.DATETIME_FORMAT) == ISO_8601:
+            tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+            if tz is None:
+                return field.to_representation
+
+            def datetime_representation(value):
+                if timezone.is_naive(value):
+                    return field.to_representation(value)
+                value = value.astimezone(tz).isoformat()
+                return value[:-6] + 'Z' if value.endswith('+00:00') else value
+            return datetime_representation
+        if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+            return None
+        if isinstance(field, (serializers.CharField, serializers.IntegerField, serializers.BooleanField)) \
+                or type(field) is serializers.ChoiceField:
+            return None
+        return field.to_representation
+
+    def to_representation(self, rows):
+        # Converters depend on the active timezone, so they're built per call.
+        converters = [(name, column, self.converter(field)) for name, column, field in self.fields]
+        # Like Serializer.to_representation, None is output as-is without calling the field.
+        with span('serializer'):
+            return [
+                {name: row[column] if convert is None or row[column] is None else convert(row[column])
+                 for name, column, convert in converters}
+                for row in rows
+            ]
+
+class TransactionBulkItemSerializer(TransactionSerializer):
+    class Meta(TransactionSerializer.Meta):
+        read_only_fields = ('performed_by',)
+        # Uniqueness is checked for the whole batch at once by TransactionBulkSerializer.
+        extra_kwargs = {'transaction_id': {'validators': []}}
+
+class TransactionBulkSerializer(serializers.ListSerializer):
+    """
+    Validates a batch of transactions, keeping the valid rows and collecting
+    per-item errors instead of rejecting the whole batch.
+    validated_data is a list of (index, attrs) pairs; item_errors maps index to errors.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('child', TransactionBulkItemSerializer())
+        super().__init__(*args, **kwargs)
+        self.item_errors = {}
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            raise serializers.ValidationError({'non_field_errors': ['Expected a list of transactions.']})
+        if self.max_length is not None and len(data) > self.max_length:
+            raise serializers.ValidationError({'non_field_errors': [f'Ensure this field has no more than {self.max_length} elements.']})
+        valid = []
+        for index, item in enumerate(data):
+            try:
+                valid.append((index, self.child.run_validation(item)))
+            except serializers.ValidationError as exc:
+                self.item_errors[index] = exc.detail
+        return self.exclude_duplicate_ids(valid)
+
+    def exclude_duplicate_ids(self, valid):
+        ids = [attrs['transaction_id'] for _, attrs in valid]
+        existing = set()
+        for start in range(0, len(ids), 500):
+            existing.update(AllTransaction.objects.filter(transaction_id__in=ids[start:start + 500])
+                            .values_list('transaction_id', flat=True))
+        unique = []
+        for index, attrs in valid:
+            if attrs['transaction_id'] in existing:
+                self.item_errors[index] = {'transaction_id': ['transaction with this transaction id already exists.']}
+            else:
+                existing.add(attrs['transaction_id'])
+                unique.append((index, attrs))
+        return unique
+
+class TransactionDailyRollupSerializer(TimedModelSerializer):
+    """
+    Daily totals. With ``normalize_to`` and ``rates`` ({(from, to): rate}) in
+    the context, the totals are also given converted into that currency.
+    """
+
+    class Meta:
+        model = TransactionDailyRollup
+        fields = '__all__'
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        target = self.context.get('normalize_to')
+        if target:
+            rate = self.context['rates'][(instance.currency, target)]
+            data['normalized_currency'] = target
+            data['normalized_credit_total'] = str((instance.credit_total * rate).quantize(Decimal('0.01')))
+            data['normalized_debit_total'] = str((instance.debit_total * rate).quantize(Decimal('0.01')))
+        return data
+
+def add_claims(token):
+    """
+    Embed user_type and the primary account's tier and currency, read from
+    the database, and the refresh token's own jti for revocation.
+    """
+    principal = get_principal(token[jwt_settings.USER_ID_CLAIM])
+    token['user_type'] = principal.user_type
+    token['tier'] = principal.tier
+    token['currency'] = principal.account.currency if principal.account else None
+    token['claims_at'] = time.time()
+    token[REFRESH_JTI_CLAIM] = token[jwt_settings.JTI_CLAIM]
+    return token
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Embeds user_type and the primary account's tier and currency as token claims."""
+
+    @classmethod
+    def get_token(cls, user):
+        return add_claims(super().get_token(user))
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refreshes with the claims re-read from the database rather than copied
+    from the refresh token, and refuses refresh tokens that were revoked.
+    """
+
+    def validate(self, attrs):
+        check_token(self.token_class(attrs['refresh']))
+        try:
+            data = super().validate(attrs)
+            # With ROTATE_REFRESH_TOKENS the rotated refresh token is returned instead.
+            refresh = add_claims(self.token_class(data.get('refresh', attrs['refresh'])))
+        except User.DoesNotExist:
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        data['access'] = str(refresh.access_token)
+        if 'refresh' in data:
+            data['refresh'] = str(refresh)
+        return data
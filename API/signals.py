@@ -0,0 +1,68 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import ledger
+from .models import CustomUser, Wallet, Account, WalletBalanceSnapshot, Transaction
+from .principal import invalidate_principal
+from .authentication import mark_claims_changed
+from .conditional import bump_versions, scoped
+from .rollups import mark_days_dirty
+from .instrumentation import db_execute_wrapper
+
+@receiver(post_save, sender=Wallet)
+def snapshot_opening_balance(sender, instance, created, **kwargs):
+    if created:
+        WalletBalanceSnapshot.objects.create(wallet=instance, balance=instance.balance, taken_at=instance.date_opened)
+
+@receiver(pre_save, sender=Transaction)
+def remember_posted_transaction(sender, instance, **kwargs):
+    instance._posted = None
+    if not instance._state.adding and instance.pk is not None:
+        instance._posted = Transaction.objects.filter(pk=instance.pk) \
+            .only('performed_by', 'transaction_type', 'amount', 'date_created').first()
+
+@receiver(post_save, sender=Transaction)
+def post_transaction(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    posted = getattr(instance, '_posted', None)
+    if posted is not None:
+        ledger.post_transactions([posted], reverse=True, retroactive=True)
+    ledger.post_transactions([instance], retroactive=posted is not None)
+
+@receiver(post_delete, sender=Transaction)
+def reverse_transaction(sender, instance, **kwargs):
+    ledger.post_transactions([instance], reverse=True, retroactive=True)
+
+@receiver([post_save, post_delete], sender=Transaction)
+def mark_rollup_day(sender, instance, raw=False, **kwargs):
+    if not raw:
+        mark_days_dirty([instance.date_created])
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def invalidate_user_principal(sender, instance, **kwargs):
+    invalidate_principal(instance.pk)
+    mark_claims_changed(instance.pk)
+    bump_versions(scoped('principal', instance.pk))
+
+@receiver([post_save, post_delete], sender=Account)
+def invalidate_owner_principal(sender, instance, **kwargs):
+    invalidate_principal(instance.owner_id)
+    mark_claims_changed(instance.owner_id)
+    bump_versions(scoped('principal', instance.owner_id))
+
+@receiver([post_save, post_delete], sender=Wallet)
+def bump_wallet_version(sender, instance, **kwargs):
+    bump_versions(scoped('wallet', instance.pk))
+
+@receiver([post_save, post_delete], sender=Account)
+@receiver([post_save, post_delete], sender=Transaction)
+def bump_resource_version(sender, **kwargs):
+    bump_versions(sender._meta.model_name)
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Installed per connection so queries made from sync_to_async threads are timed too.
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_execute_wrapper)
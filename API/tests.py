@@ -1,3 +1,1641 @@
-from django.test import TestCase
+import datetime
+import importlib
+import csv
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from decimal import Decimal
+from unittest import mock, skipIf
 
-# Create your tests here.
+import requests
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.utils import load_backend
+from django.db.models import Sum
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from JonProject.databases import database_from_env, replicas_from_env
+
+from . import benchmark, fixedpoint, rate_clients
+from .archive import archive_transactions
+from .authentication import StatelessJWTAuthentication, check_token
+from .checks import check_throttle_cache
+from .pagination import approximate_count
+from .imports import import_transactions
+from .instrumentation import InstrumentationMiddleware, RequestSpans, current_spans, get_registry, span
+from .middleware import PrincipalMiddleware, ReplicaRoutingMiddleware
+from .principal import get_principal, get_principal_claims, principal_cache_key
+from .benchmark import fx_settings
+from .conversions import convert_transactions, run_job
+from .ledger import reconcile, take_snapshots
+from .models import CustomUser, Wallet, Account, Transaction, ExchangeRate, CurrencyConversionJob, ArchivedTransaction, TransactionDailyRollup, \
+    ImportCheckpoint, WalletBalanceSnapshot
+from .exceptions import CurrencyConversionException
+from .forms import TransactionForm, WalletForm
+from .rate_clients import CircuitBreaker, CurrencyAPIBackend, SnapshotBackend
+from .rates import RateProvider, RateTable, get_rate_provider
+from .routers import ReadRouting, current_read_routing, pin_key
+from .rollups import rebuild_rollups, refresh_rollups
+from .serializers import AccountSerializer, ClaimsTokenObtainPairSerializer, TransactionSerializer, ValuesSerializer, \
+    WalletSerializer
+from .utils import convert_currency
+
+
+class QueryPlanAssertions:
+    """Runs EXPLAIN on captured queries and fails on full table scans or whole-table sorts."""
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                return '\n'.join(row[-1] for row in cursor.fetchall())
+            cursor.execute(f'EXPLAIN {sql}')
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def full_scans(self, plan, table):
+        if connection.vendor == 'sqlite':
+            return [
+                line for line in plan.splitlines()
+                if re.search(rf'\bSCAN {table}\b(?! USING)', line) or 'USE TEMP B-TREE FOR ORDER BY' in line
+            ]
+        return [line for line in plan.splitlines() if f'Seq Scan on {table.lower()}' in line.lower()]
+
+    def assertUsesIndexes(self, func, table):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+        with CaptureQueriesContext(connection) as captured:
+            func()
+        queries = [query['sql'] for query in captured.captured_queries if f'"{table}"' in query['sql']]
+        self.assertTrue(queries, f'No queries against {table} were run.')
+        for sql in queries:
+            plan = self.explain(sql)
+            self.assertFalse(self.full_scans(plan, table), f'Full scan in plan for:\n{sql}\n{plan}')
+
+
+class TransactionQueryPlanTests(QueryPlanAssertions, TestCase):
+    table = 'API_transaction'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='planner', user_type='paid')
+        Account.objects.create(owner=cls.user, account_type='savings', currency='USD', tier='tier2')
+        Transaction.objects.bulk_create([
+            Transaction(
+                performed_by=cls.user,
+                transaction_type='debit' if i % 2 else 'credit',
+                currency=('USD', 'EUR', 'ZAR')[i % 3],
+                category=('payments', 'withdrawals', 'deposits', 'giftcards')[i % 4],
+                amount=Decimal('10.00'),
+                transaction_id=f'plan-{i}',
+            )
+            for i in range(50)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertEndpointUsesIndexes(self, url):
+        def request():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertUsesIndexes(request, self.table)
+
+    def test_list(self):
+        self.assertEndpointUsesIndexes('/api/transactions/')
+
+    def test_list_by_user(self):
+        self.assertEndpointUsesIndexes(f'/api/transactions/?performed_by={self.user.pk}')
+
+    def test_list_by_category(self):
+        self.assertEndpointUsesIndexes('/api/transactions/?category=payments')
+
+    def test_list_by_currency(self):
+        self.assertEndpointUsesIndexes('/api/transactions/?currency=EUR')
+
+    def test_list_by_transaction_type(self):
+        self.assertEndpointUsesIndexes('/api/transactions/?transaction_type=debit')
+
+    def test_list_by_date_range(self):
+        self.assertEndpointUsesIndexes('/api/transactions/?date_from=2020-01-01&date_to=2100-01-01')
+
+    def test_export(self):
+        self.assertEndpointUsesIndexes('/api/transactions/export/?category=deposits')
+
+    def test_transaction_id_lookup(self):
+        self.assertUsesIndexes(lambda: Transaction.objects.filter(transaction_id='plan-7').first(), self.table)
+
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Each page must run at most its budgeted number of queries, and the same
+    number whatever the number of rows it lists.
+    """
+
+    budgets = {
+        '/wallet/': 1,
+        '/account/': 1,
+        '/transaction/': 1,
+        '/admin/API/wallet/': 5,
+        '/admin/API/account/': 5,
+        '/admin/API/transaction/': 5,
+        '/api/wallets/': 2,
+        '/api/accounts/': 2,
+        '/api/transactions/': 2,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(username='root', password='pw', user_type='admin')
+
+    def seed(self, count):
+        start = CustomUser.objects.count()
+        for i in range(start, start + count):
+            user = CustomUser.objects.create(username=f'user-{i}', user_type='paid')
+            Wallet.objects.create(owner=user, balance=Decimal('1.00'))
+            Account.objects.create(owner=user, account_type='savings', currency='USD', tier='tier2', accountant=self.admin)
+            Transaction.objects.create(performed_by=user, transaction_type='debit', currency='USD',
+                                       category='payments', amount=Decimal('1.00'), transaction_id=f'budget-{i}')
+
+    def count_queries(self, url):
+        # Budgets are for rendering the page, not for replaying a cached response.
+        cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(captured.captured_queries)
+
+    def test_query_budgets(self):
+        self.client = APIClient()
+        self.client.force_login(self.admin)
+        self.client.force_authenticate(self.admin)
+        self.seed(2)
+        small = {url: self.count_queries(url) for url in self.budgets}
+        self.seed(10)
+        for url, budget in self.budgets.items():
+            with self.subTest(url=url):
+                queries = self.count_queries(url)
+                self.assertLessEqual(queries, budget, f'{url} ran {queries} queries, budget is {budget}.')
+                self.assertEqual(queries, small[url], f'{url} query count grows with the number of rows.')
+
+
+@override_settings(FX_RATES=fx_settings(), CONVERSION_CHUNK_SIZE=2)
+class AdminCurrencyConversionTests(TestCase):
+    """The admin action converts every selected transaction and keeps wallets and snapshots reconciled."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(username='root', password='pw', user_type='admin')
+        Wallet.objects.create(owner=cls.admin, balance=Decimal('0.00'))
+        for i, (currency, transaction_type, amount) in enumerate([
+            ('EUR', 'credit', '92.00'), ('EUR', 'debit', '9.20'), ('ZAR', 'credit', '185.00'), ('USD', 'credit', '5.00'),
+        ]):
+            Transaction.objects.create(performed_by=cls.admin, transaction_type=transaction_type, currency=currency,
+                                       category='deposits', amount=Decimal(amount), transaction_id=f'convert-{i}')
+        take_snapshots()
+
+    def convert(self):
+        self.client.force_login(self.admin)
+        return self.client.post('/admin/API/transaction/', {
+            'action': 'convert_currency', 'select_across': '1', '_selected_action': [Transaction.objects.first().pk],
+            'apply': '1', 'to_currency': 'usd',
+        })
+
+    def assertConverted(self):
+        self.assertEqual(
+            sorted(Transaction.objects.values_list('currency', 'amount')),
+            [('USD', Decimal('5.00')), ('USD', Decimal('10.00')), ('USD', Decimal('10.00')), ('USD', Decimal('100.00'))],
+        )
+        self.assertEqual(Wallet.objects.get(owner=self.admin).balance, Decimal('105.00'))
+        self.assertEqual(list(reconcile()), [])
+
+    def test_converts_selection(self):
+        get_rate_provider().clear()
+        self.assertEqual(self.convert().status_code, 302)
+        self.assertConverted()
+        self.assertEqual(get_rate_provider().fetches, 1)
+
+    def test_selection_with_other_account_currencies_is_refused_whole(self):
+        holder = CustomUser.objects.create(username='eur-holder', user_type='paid')
+        Wallet.objects.create(owner=holder, balance=Decimal('0.00'))
+        Account.objects.create(owner=holder, account_type='savings', currency='EUR', tier='tier2')
+        Transaction.objects.create(performed_by=holder, transaction_type='credit', currency='EUR', category='deposits',
+                                   amount=Decimal('1.00'), transaction_id='x0')
+        before = sorted(Transaction.objects.values_list('transaction_id', 'currency', 'amount'))
+        response = self.convert()
+        self.assertEqual(sorted(Transaction.objects.values_list('transaction_id', 'currency', 'amount')), before)
+        self.assertEqual([str(message) for message in get_messages(response.wsgi_request)],
+                         ['Nothing was converted: 1 transactions belong to accounts not kept in USD: x0 (EUR).'])
+        self.assertEqual(list(reconcile()), [])
+
+        # Queued jobs are checked the same way and fail before writing anything.
+        job = CurrencyConversionJob.objects.create(to_currency='USD', total=4,
+                                                   transaction_ids=list(Transaction.objects.values_list('pk', flat=True)))
+        self.assertEqual(run_job(job), 'failed')
+        self.assertEqual(sorted(Transaction.objects.values_list('transaction_id', 'currency', 'amount')), before)
+
+    @override_settings(CONVERSION_SYNC_LIMIT=1)
+    def test_large_selection_runs_as_job(self):
+        self.convert()
+        job = CurrencyConversionJob.objects.get()
+        self.assertEqual((job.status, job.total), ('pending', 3))
+        call_command('run_conversion_jobs', stdout=open('/dev/null', 'w'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.converted), ('done', 3, 3))
+        self.assertConverted()
+
+
+@override_settings(FX_RATES=fx_settings())
+class FixedPointConversionTests(TestCase):
+    """The fixed-point engine matches convert_currency to the cent, ties and signs included."""
+
+    def setUp(self):
+        get_rate_provider().clear()
+        generator = random.Random(0)
+        self.amounts = [generator.randrange(-10 ** 11, 10 ** 11) for _ in range(5000)] + [0, 1, -1, 5, -5, 50, -50]
+        self.currencies = [generator.choice(['USD', 'EUR', 'ZAR', 'GBP']) for _ in self.amounts]
+        # Exact half-cent ties under triangulated rates, e.g. 0.23 EUR is 0.23 * 18.5 / 0.92 = 4.625 ZAR.
+        ties = [(23, 'EUR'), (-23, 'EUR'), (115, 'EUR'), (138, 'EUR'), (2775, 'ZAR'), (-6475, 'ZAR')]
+        self.amounts += [amount for amount, _ in ties]
+        self.currencies += [currency for _, currency in ties]
+
+    def test_ties_round_like_convert_currency(self):
+        self.assertEqual([int(amount) for amount in fixedpoint.convert_minor_units([23, -23, 115], ['EUR'] * 3, 'ZAR')],
+                         [462, -462, 2312])
+        self.assertEqual(convert_currency(Decimal('0.23'), 'EUR', 'ZAR'), Decimal('4.62'))
+
+    def assertMatchesDecimal(self):
+        for to_currency in ('USD', 'EUR', 'ZAR', 'GBP'):
+            with self.subTest(to_currency=to_currency):
+                converted = fixedpoint.convert_minor_units(self.amounts, self.currencies, to_currency)
+                self.assertEqual(list(map(int, converted)),
+                                 fixedpoint.convert_minor_units_decimal(self.amounts, self.currencies, to_currency))
+
+    @skipIf(fixedpoint.np is None, 'NumPy is not installed.')
+    def test_vectorized(self):
+        self.assertMatchesDecimal()
+
+    def test_without_numpy(self):
+        with mock.patch.object(fixedpoint, 'np', None):
+            self.assertMatchesDecimal()
+
+
+class TransactionArchiveTests(TestCase):
+    """Old transactions move to the archive; only listings dated before the cutoff read it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='archiver', user_type='paid')
+        wallet = Wallet.objects.create(owner=cls.user, balance=Decimal('0.00'))
+        Account.objects.create(owner=cls.user, account_type='savings', currency='USD', tier='tier2')
+        long_ago = timezone.now() - datetime.timedelta(days=400)
+        wallet.balance_snapshots.update(taken_at=long_ago - datetime.timedelta(days=1))
+        for i in range(3):
+            Transaction.objects.create(performed_by=cls.user, transaction_type='credit', currency='USD',
+                                       category='deposits', amount=Decimal('10.00'), transaction_id=f'archive-{i}')
+        Transaction.objects.filter(transaction_id__in=['archive-0', 'archive-1']).update(date_created=long_ago)
+        refresh_rollups()
+        cls.long_ago = long_ago
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def list_ids(self, **params):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/transactions/', params)
+        self.assertEqual(response.status_code, 200)
+        read_archive = any('API_alltransaction' in query['sql'] for query in captured.captured_queries)
+        return sorted(row['transaction_id'] for row in response.json()['results']), read_archive
+
+    def test_archive(self):
+        self.assertEqual(archive_transactions(chunk_size=1), 2)
+        self.assertEqual(archive_transactions(), 0)
+        self.assertEqual(list(Transaction.objects.values_list('transaction_id', flat=True)), ['archive-2'])
+        self.assertEqual(ArchivedTransaction.objects.count(), 2)
+        self.assertEqual(Wallet.objects.get(owner=self.user).balance, Decimal('30.00'))
+        self.assertEqual(list(reconcile()), [])
+
+        self.assertEqual(self.list_ids(), (['archive-2'], False))
+        recent = (timezone.now() - datetime.timedelta(days=1)).isoformat()
+        self.assertEqual(self.list_ids(date_from=recent), (['archive-2'], False))
+        old = (self.long_ago - datetime.timedelta(days=1)).isoformat()
+        self.assertEqual(self.list_ids(date_from=old), (['archive-0', 'archive-1', 'archive-2'], True))
+
+        day = self.long_ago.astimezone(datetime.timezone.utc).date()
+        rebuild_rollups(day, day)
+        self.assertEqual(TransactionDailyRollup.objects.get(day=day).transaction_count, 2)
+
+        response = self.client.post('/api/transactions/', {
+            'transaction_type': 'credit', 'currency': 'USD', 'category': 'deposits', 'amount': '1.00',
+            'transaction_id': 'archive-0', 'performed_by': self.user.pk,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('transaction_id', response.json())
+
+
+@override_settings(FX_RATES=fx_settings())
+class ImportTransactionsTests(TestCase):
+    """import_transactions applies the bulk API's rules, keeps historical dates and resumes from its checkpoint."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='importer', user_type='paid')
+        cls.walletless = CustomUser.objects.create(username='no-account', user_type='paid')
+        Wallet.objects.create(owner=cls.user, balance=Decimal('0.00'))
+        Account.objects.create(owner=cls.user, account_type='savings', currency='USD', tier='tier2')
+        Wallet.objects.get(owner=cls.user).balance_snapshots.update(taken_at=timezone.now() - datetime.timedelta(days=30))
+        Transaction.objects.create(performed_by=cls.user, transaction_type='credit', currency='USD',
+                                   category='deposits', amount=Decimal('1.00'), transaction_id='existing')
+        refresh_rollups()
+
+    def write(self, suffix, text):
+        f = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False)
+        self.addCleanup(os.unlink, f.name)
+        with f:
+            f.write(text)
+        return f.name
+
+    def record(self, transaction_id, **fields):
+        return {'performed_by': self.user.pk, 'transaction_type': 'credit', 'currency': 'USD', 'category': 'deposits',
+                'amount': '10.00', 'transaction_id': transaction_id,
+                'date_created': '2026-01-15T10:00:00Z', **fields}
+
+    def test_import_ndjson(self):
+        lines = [json.dumps(record) for record in [
+            self.record('import-0'), self.record('import-1', currency='EUR', amount='9.20'),
+            self.record('existing'), self.record('import-2', performed_by=self.walletless.pk),
+            self.record('import-3', transaction_type='refund'), self.record('import-1'),
+        ]] + ['{not json', json.dumps(self.record('import-4', transaction_type='debit', amount='5.00'))]
+        path = self.write('.ndjson', '\n'.join(lines) + '\n')
+
+        def interrupt(checkpoint, count, errors):
+            raise KeyboardInterrupt
+        with self.assertRaises(KeyboardInterrupt):
+            import_transactions(path, workers=1, chunk_size=3, report=interrupt)
+        self.assertEqual(ImportCheckpoint.objects.get().rows_read, 3)
+
+        rejected = []
+        checkpoint = import_transactions(path, workers=1, chunk_size=3,
+                                         report=lambda checkpoint, count, errors: rejected.extend(errors))
+        self.assertEqual((checkpoint.rows_read, checkpoint.imported, checkpoint.rejected), (8, 3, 5))
+        self.assertEqual(sorted(dict(rejected)), [4, 5, 6, 7])
+        self.assertEqual(
+            sorted(Transaction.objects.filter(transaction_id__startswith='import-')
+                   .values_list('transaction_id', 'currency', 'amount', 'date_created')),
+            [(f'import-{i}', 'USD', Decimal(amount), datetime.datetime(2026, 1, 15, 10, tzinfo=datetime.timezone.utc))
+             for i, amount in ((0, '10.00'), (1, '10.00'), (4, '5.00'))],
+        )
+        self.assertEqual(Wallet.objects.get(owner=self.user).balance, Decimal('16.00'))
+        self.assertEqual(list(reconcile()), [])
+        self.assertEqual(refresh_rollups(), 1)
+        self.assertEqual(TransactionDailyRollup.objects.get(day=datetime.date(2026, 1, 15)).transaction_count, 3)
+        self.assertEqual(import_transactions(path, workers=1).imported, 3)
+
+    def test_converted_amounts_are_rounded_and_bounded(self):
+        path = self.write('.ndjson', '\n'.join(json.dumps(record) for record in [
+            self.record('round-0', currency='EUR', amount='0.01'),
+            self.record('round-1', currency='ZAR', amount='99999999.99'),
+            self.record('round-2', currency='EUR', amount='99999999.99'),
+        ]) + '\n')
+        rejected = []
+        checkpoint = import_transactions(path, workers=1,
+                                         report=lambda checkpoint, count, errors: rejected.extend(errors))
+        self.assertEqual((checkpoint.imported, checkpoint.rejected), (2, 1))
+        self.assertEqual([number for number, _ in rejected], [3])
+        self.assertIn('too large', str(rejected[0][1]['amount'][0]))
+        amounts = dict(Transaction.objects.filter(transaction_id__startswith='round-')
+                       .values_list('transaction_id', 'amount'))
+        self.assertEqual(amounts['round-0'], Decimal('0.01'))
+        self.assertEqual(amounts['round-1'], convert_currency(Decimal('99999999.99'), 'ZAR', 'USD'))
+
+    def test_import_csv_in_worker_processes(self):
+        header = 'id,performed_by,transaction_type,currency,category,date_created,amount,transaction_id\n'
+        rows = ''.join(f',{self.user.pk},credit,USD,deposits,,1.00,csv-{i}\n' for i in range(10))
+        checkpoint = import_transactions(self.write('.csv', header + rows), workers=2, chunk_size=4)
+        self.assertEqual((checkpoint.rows_read, checkpoint.imported, checkpoint.rejected), (10, 10, 0))
+        self.assertEqual(Wallet.objects.get(owner=self.user).balance, Decimal('11.00'))
+
+
+@override_settings(FX_RATES=fx_settings(), THROTTLING={
+    'CACHE': 'default',
+    'RATES': {
+        'api': {'free': '2/min', 'paid': '4/min', 'admin': None},
+        'conversion': {'anon': '1/min'},
+        'export': {'free': '1/min'},
+    },
+    'TIER_MULTIPLIERS': {'tier1': 1, 'tier2': 2},
+})
+class ThrottlingTests(TestCase):
+    """Token buckets by user type and tier, with separate buckets for expensive endpoints."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {}
+        for username, user_type, tier in (('free-1', 'free', 'tier1'), ('free-2', 'free', 'tier2'),
+                                          ('paid-1', 'paid', 'tier1'), ('root', 'admin', 'tier1')):
+            user = CustomUser.objects.create(username=username, user_type=user_type)
+            Wallet.objects.create(owner=user, balance=Decimal('0.00'))
+            Account.objects.create(owner=user, account_type='savings', currency='USD', tier=tier)
+            cls.users[username] = user
+
+    def setUp(self):
+        cache.clear()
+
+    def client_for(self, username):
+        client = APIClient()
+        token = ClaimsTokenObtainPairSerializer.get_token(self.users[username]).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def statuses(self, client, url, count):
+        return [client.get(url).status_code for _ in range(count)]
+
+    def test_buckets_scale_with_tier_and_refill(self):
+        client = self.client_for('free-1')
+        self.assertEqual(self.statuses(client, '/api/wallets/', 3), [200, 200, 429])
+        response = client.get('/api/wallets/')
+        self.assertEqual(response['Retry-After'], '30')
+
+        self.assertEqual(self.statuses(self.client_for('free-2'), '/api/wallets/', 5), [200, 200, 200, 200, 429])
+        self.assertEqual(set(self.statuses(self.client_for('root'), '/api/wallets/', 10)), {200})
+
+        # The database path (writes, or users loaded from the database) lands in the same bucket.
+        user_client = APIClient()
+        user_client.force_authenticate(self.users['free-1'])
+        self.assertEqual(user_client.get('/api/wallets/').status_code, 429)
+
+        later = timezone.now() + datetime.timedelta(seconds=31)
+        with mock.patch('API.throttling.time.time_ns', return_value=int(later.timestamp() * 1e9)):
+            self.assertEqual(self.statuses(client, '/api/wallets/', 2), [200, 429])
+
+    @mock.patch.object(APIView, 'authentication_classes', [StatelessJWTAuthentication])
+    def test_demoted_user_loses_paid_rates_on_refresh(self):
+        refresh = ClaimsTokenObtainPairSerializer.get_token(self.users['paid-1'])
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        self.assertEqual(self.statuses(client, '/api/wallets/', 5), [200, 200, 200, 200, 429])
+
+        self.users['paid-1'].user_type = 'free'
+        self.users['paid-1'].save()
+        response = self.client.post('/api/token/refresh/', {'refresh': str(refresh)})
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+        later = timezone.now() + datetime.timedelta(seconds=61)
+        with mock.patch('API.throttling.time.time_ns', return_value=int(later.timestamp() * 1e9)):
+            self.assertEqual(self.statuses(client, '/api/wallets/', 3), [200, 200, 429])
+
+    def test_deploy_check_rejects_a_local_memory_cache(self):
+        self.assertEqual([error.id for error in check_throttle_cache(None)], ['API.E001'])
+        dummy = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+        with override_settings(CACHES={**settings.CACHES, 'default': dummy}):
+            self.assertEqual(check_throttle_cache(None), [])
+
+    def test_expensive_endpoints_have_their_own_buckets(self):
+        client = self.client_for('free-2')
+        self.assertEqual(self.statuses(client, '/api/transactions/export/', 3), [200, 200, 429])
+        self.assertEqual(client.get('/api/transactions/').status_code, 200)
+
+        data = {'amount': '10.00', 'from_currency': 'USD', 'to_currency': 'EUR'}
+        self.assertEqual(self.client.post('/currency-conversion/', data).status_code, 302)
+        response = self.client.post('/currency-conversion/', data)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(self.client.post('/async/currency-conversion/', data).status_code, 429)
+        self.assertEqual(self.client.get('/currency-conversion/').status_code, 200)
+
+
+class RateProviderTests(SimpleTestCase):
+    """Rates are served from memory for TTL seconds, triangulated through the pivot and served stale on failure."""
+
+    def setUp(self):
+        self.quotes = {'USD': {'EUR': Decimal('0.92'), 'ZAR': Decimal('18.5')}}
+        self.failing = False
+        self.provider = RateProvider(self.fetch, ttl=300, max_stale=3600)
+
+    def fetch(self, base):
+        if self.failing:
+            raise CurrencyConversionException(detail='Upstream is down.')
+        return self.quotes[base], time.time()
+
+    def get_rate(self, base, quote, at):
+        with mock.patch('API.rates.time.time', return_value=at):
+            return self.provider.get_rate(base, quote)
+
+    def test_ttl_and_triangulation(self):
+        self.assertEqual(self.get_rate('USD', 'EUR', 1000), Decimal('0.92'))
+        self.assertEqual(self.get_rate('EUR', 'ZAR', 1100), Decimal('18.5') / Decimal('0.92'))
+        self.assertEqual(self.get_rate('ZAR', 'USD', 1200), 1 / Decimal('18.5'))
+        self.assertEqual(self.provider.fetches, 1)
+        self.quotes['USD']['EUR'] = Decimal('0.95')
+        self.assertEqual(self.get_rate('USD', 'EUR', 1301), Decimal('0.95'))
+        self.assertEqual(self.provider.fetches, 2)
+
+    def test_stale_fallback(self):
+        self.get_rate('USD', 'EUR', 1000)
+        self.failing = True
+        self.assertEqual(self.get_rate('USD', 'EUR', 2000), Decimal('0.92'))
+        self.assertEqual(self.provider.stale_hits, 1)
+        with self.assertRaises(CurrencyConversionException):
+            self.get_rate('USD', 'EUR', 1000 + 3601)
+
+    def test_unknown_currency(self):
+        with self.assertRaises(CurrencyConversionException):
+            self.get_rate('USD', 'XYZ', 1000)
+
+    def test_counters_are_thread_safe(self):
+        self.get_rate('USD', 'EUR', 1000)
+        with mock.patch('API.rates.time.time', return_value=1000), ThreadPoolExecutor(8) as executor:
+            list(executor.map(lambda _: self.provider.get_rate('USD', 'EUR'), range(4000)))
+        self.assertEqual((self.provider.hits, self.provider.misses), (4000, 1))
+
+    def test_rate_table_evicts_least_recently_used(self):
+        table = RateTable(max_entries=2)
+        table.update('USD', {'EUR': Decimal('0.92'), 'ZAR': Decimal('18.5')}, 1000)
+        table.get('USD', 'EUR')
+        table.update('EUR', {'GBP': Decimal('0.86')}, 1000)
+        self.assertIsNone(table.get('USD', 'ZAR'))
+        self.assertEqual(table.get('USD', 'EUR'), (Decimal('0.92'), 1000))
+        self.assertEqual(len(table), 2)
+
+    @override_settings(FX_RATES=fx_settings())
+    def test_convert_currency_rounds_to_cents(self):
+        get_rate_provider().clear()
+        converted = convert_currency(Decimal('10.00'), 'EUR', 'ZAR')
+        self.assertEqual(converted, Decimal('201.09'))
+        self.assertEqual(converted.as_tuple().exponent, -2)
+        self.assertEqual(convert_currency(Decimal('0.125'), 'USD', 'USD'), Decimal('0.12'))
+
+
+class CurrencyAPIBackendTests(SimpleTestCase):
+    """Transient upstream failures are retried with backoff; repeated failures open the circuit breaker."""
+
+    def setUp(self):
+        self.backend = CurrencyAPIBackend(api_key='test', max_retries=2, failure_threshold=2, reset_timeout=30)
+        sleep = mock.patch('API.rate_clients.time.sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def response(self, status_code, data=None):
+        response = requests.Response()
+        response.status_code = status_code
+        response.url = self.backend.url
+        response._content = json.dumps(data or {}).encode()
+        return response
+
+    def quotes(self):
+        return self.response(200, {'data': {'EUR': {'code': 'EUR', 'value': 0.92}}})
+
+    def test_retries_transient_failures(self):
+        with mock.patch.object(self.backend.session, 'get', side_effect=[
+            self.response(503), requests.exceptions.ConnectionError(), self.quotes(),
+        ]) as get:
+            self.assertEqual(self.backend.fetch_quotes('USD'), {'EUR': Decimal('0.92')})
+        self.assertEqual(get.call_count, 3)
+        self.assertEqual(self.sleep.call_count, 2)
+        for (delay,), _ in self.sleep.call_args_list:
+            self.assertLessEqual(delay, self.backend.max_backoff)
+
+    def test_gives_up_after_max_retries(self):
+        with mock.patch.object(self.backend.session, 'get', return_value=self.response(503)) as get:
+            with self.assertRaises(CurrencyConversionException):
+                self.backend.fetch_quotes('USD')
+        self.assertEqual(get.call_count, 3)
+
+    def test_client_errors_are_not_retried(self):
+        with mock.patch.object(self.backend.session, 'get', return_value=self.response(401)) as get:
+            with self.assertRaises(CurrencyConversionException):
+                self.backend.fetch_quotes('USD')
+        self.assertEqual(get.call_count, 1)
+
+    def test_circuit_breaker(self):
+        with mock.patch.object(self.backend.session, 'get', return_value=self.response(503)) as get:
+            for _ in range(2):
+                with self.assertRaises(CurrencyConversionException):
+                    self.backend.fetch_quotes('USD')
+            get.reset_mock()
+            with self.assertRaisesMessage(CurrencyConversionException, 'temporarily unavailable'):
+                self.backend.fetch_quotes('USD')
+            get.assert_not_called()
+
+        # After reset_timeout one trial call goes through; its success closes the breaker.
+        later = time.monotonic() + 31
+        with mock.patch('API.rate_clients.time.monotonic', return_value=later), \
+                mock.patch.object(self.backend.session, 'get', return_value=self.quotes()):
+            self.assertEqual(self.backend.fetch_quotes('USD'), {'EUR': Decimal('0.92')})
+        self.assertIsNone(self.backend.breaker.opened_at)
+
+    @skipIf(rate_clients.httpx is None, 'httpx is not installed')
+    def test_async_client_per_event_loop(self):
+        async def clients():
+            return await self.backend.get_async_client(), await self.backend.get_async_client()
+
+        # async_to_sync runs each call on a new event loop, as async views do under WSGI.
+        first, again = async_to_sync(clients)()
+        self.assertIs(first, again)
+        second, _ = async_to_sync(clients)()
+        self.assertIsNot(first, second)
+        self.assertTrue(first.is_closed and second.is_closed)
+        self.assertEqual(self.backend._async_clients, {})
+
+    def test_half_open_breaker_allows_one_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow_request())
+        with mock.patch('API.rate_clients.time.monotonic', return_value=time.monotonic() + 31):
+            self.assertTrue(breaker.allow_request())
+            self.assertFalse(breaker.allow_request())
+
+    def test_missing_api_key(self):
+        backend = CurrencyAPIBackend(api_key='')
+        with mock.patch.object(backend.session, 'get') as get:
+            with self.assertRaisesMessage(CurrencyConversionException, 'CURRENCY_API_KEY'):
+                backend.fetch_quotes('USD')
+        get.assert_not_called()
+
+
+class RateSnapshotTests(TestCase):
+    """Stored snapshots age from when they were fetched and are pruned by refresh_rates."""
+
+    def store(self, base, rates, age):
+        fetched_at = timezone.now() - datetime.timedelta(seconds=age)
+        ExchangeRate.objects.bulk_create([
+            ExchangeRate(base=base, quote=quote, rate=Decimal(rate), fetched_at=fetched_at)
+            for quote, rate in rates.items()
+        ])
+
+    def provider(self):
+        return RateProvider(SnapshotBackend().fetch_quotes_at, ttl=300, max_stale=3600)
+
+    def test_snapshot_age_is_kept(self):
+        self.store('USD', {'EUR': '0.92'}, age=2000)
+        provider = self.provider()
+        self.assertEqual(provider.get_rate('USD', 'EUR'), Decimal('0.92'))
+        # Loaded within the TTL: served without rereading the table, although older than the TTL.
+        with self.assertNumQueries(0):
+            self.assertEqual(provider.get_rate('EUR', 'USD'), 1 / Decimal('0.92'))
+
+        ExchangeRate.objects.update(fetched_at=timezone.now() - datetime.timedelta(seconds=4000))
+        with self.assertRaisesMessage(CurrencyConversionException, 'out of date'):
+            self.provider().get_rate('USD', 'EUR')
+
+    @override_settings(FX_RATES={**fx_settings(), 'REFRESH_BASES': ['USD'], 'SNAPSHOT_RETENTION_DAYS': 30})
+    def test_refresh_prunes_old_snapshots(self):
+        day = 24 * 60 * 60
+        self.store('USD', {'EUR': '0.90'}, age=40 * day)
+        self.store('USD', {'EUR': '0.91'}, age=10 * day)
+        self.store('GBP', {'EUR': '1.16'}, age=40 * day)
+        call_command('refresh_rates', stdout=open('/dev/null', 'w'))
+        self.assertEqual(
+            sorted(ExchangeRate.objects.filter(quote='EUR').values_list('base', 'rate')),
+            [('GBP', Decimal('1.16')), ('USD', Decimal('0.91')), ('USD', Decimal('0.92'))],
+        )
+
+
+@override_settings(FX_RATES=fx_settings())
+class BulkTransactionTests(TestCase):
+    """POST /api/transactions/bulk/ keeps the valid items of a batch and reports the others by index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='bulk', user_type='paid')
+        Wallet.objects.create(owner=cls.user, balance=Decimal('0.00'))
+        cls.account = Account.objects.create(owner=cls.user, account_type='savings', currency='ZAR', tier='tier1')
+        cls.walletless = CustomUser.objects.create(username='no-account', user_type='paid')
+
+    def setUp(self):
+        cache.clear()
+        get_rate_provider().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def item(self, transaction_id, amount='10.00', currency='EUR'):
+        return {'transaction_type': 'credit', 'currency': currency, 'category': 'deposits', 'amount': amount,
+                'transaction_id': transaction_id}
+
+    def test_json_batch(self):
+        Transaction.objects.create(performed_by=self.user, transaction_type='credit', currency='ZAR',
+                                   category='deposits', amount=Decimal('1.00'), transaction_id='bulk-existing')
+        response = self.client.post('/api/transactions/bulk/', [
+            self.item('bulk-0'),
+            self.item('bulk-1', amount='not money'),
+            self.item('bulk-existing'),
+            self.item('bulk-0'),
+            self.item('bulk-2', amount='600.00'),
+            self.item('bulk-3', currency='XYZ'),
+            self.item('bulk-4'),
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual([created['index'] for created in body['created']], [0, 6])
+        self.assertEqual({error['index']: sorted(error['errors']) for error in body['errors']}, {
+            1: ['amount'], 2: ['transaction_id'], 3: ['transaction_id'], 4: ['amount'], 5: ['currency'],
+        })
+        # 10 EUR is 201.09 ZAR once rounded; the wallet gets exactly what is stored.
+        self.assertEqual(sorted(Transaction.objects.filter(transaction_id__in=['bulk-0', 'bulk-4'])
+                                .values_list('amount', flat=True)), [Decimal('201.09')] * 2)
+        self.assertEqual(Wallet.objects.get(owner=self.user).balance, Decimal('403.18'))
+        self.assertEqual(list(reconcile()), [])
+
+    def test_ndjson_batch(self):
+        body = '\n'.join(json.dumps(self.item(f'nd-{i}', currency='ZAR')) for i in range(3)) + '\n\n'
+        response = self.client.post('/api/transactions/bulk/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['created']), 3)
+        self.assertEqual(Wallet.objects.get(owner=self.user).balance, Decimal('30.00'))
+
+        response = self.client.post('/api/transactions/bulk/', '{"transaction_id": \n', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('line 1', response.json()['detail'])
+
+    def test_nothing_valid(self):
+        response = self.client.post('/api/transactions/bulk/', [self.item('bad', amount='-')], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['created'], [])
+
+    def test_user_without_account(self):
+        self.client.force_authenticate(self.walletless)
+        for url, data in (('/api/transactions/bulk/', [self.item('orphan-0')]),
+                          ('/api/transactions/', {**self.item('orphan-1'), 'performed_by': self.walletless.pk})):
+            with self.subTest(url=url):
+                response = self.client.post(url, data, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('User has no account to post transactions to.', json.dumps(response.json()))
+
+    @override_settings(BULK_CREATE_BATCH_SIZE=1)
+    def test_id_taken_after_validation(self):
+        # Another request inserts 'race-1' between this batch's duplicate check and its insert.
+        Transaction.objects.create(performed_by=self.user, transaction_type='credit', currency='ZAR',
+                                   category='deposits', amount=Decimal('1.00'), transaction_id='race-1')
+        with mock.patch('API.serializers.TransactionBulkSerializer.exclude_duplicate_ids', lambda self, valid: valid):
+            response = self.client.post('/api/transactions/bulk/', [
+                self.item('race-0', currency='ZAR'), self.item('race-1', currency='ZAR'), self.item('race-2', currency='ZAR'),
+            ], format='json')
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual([created['index'] for created in body['created']], [0, 2])
+        self.assertEqual(body['errors'], [{'index': 1, 'errors': {
+            'transaction_id': ['transaction with this transaction id already exists.']}}])
+        self.assertEqual(Wallet.objects.get(owner=self.user).balance, Decimal('21.00'))
+        self.assertEqual(list(reconcile()), [])
+
+
+class ExportTests(TestCase):
+    """Exports stream every matching row, oldest first, in the requested format."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='exporter', user_type='paid')
+        Wallet.objects.create(owner=cls.user, balance=Decimal('0.00'))
+        Account.objects.create(owner=cls.user, account_type='savings', currency='USD', tier='tier2')
+        for i in range(5):
+            Transaction.objects.create(performed_by=cls.user, transaction_type='credit', currency='USD',
+                                       category='payments' if i % 2 else 'deposits', amount=Decimal(f'{i}.50'),
+                                       transaction_id=f'export-{i}')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, **params):
+        response = self.client.get('/api/transactions/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_ndjson(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['transaction_id'] for row in rows], [f'export-{i}' for i in range(5)])
+        first = Transaction.objects.get(transaction_id='export-0')
+        self.assertEqual(rows[0], {
+            'id': first.pk, 'performed_by': self.user.pk, 'transaction_type': 'credit', 'currency': 'USD',
+            'category': 'deposits', 'date_created': first.date_created.isoformat(), 'amount': '0.50',
+            'transaction_id': 'export-0',
+        })
+
+    def test_csv_with_filters(self):
+        response, content = self.export(output='csv', category='payments')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('transactions.csv', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0], ['id', 'performed_by', 'transaction_type', 'currency', 'category', 'date_created',
+                                   'amount', 'transaction_id'])
+        self.assertEqual([(row[6], row[7]) for row in rows[1:]], [('1.50', 'export-1'), ('3.50', 'export-3')])
+
+    def test_unknown_format(self):
+        response = self.client.get('/api/transactions/export/', {'output': 'xml'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('output', response.json())
+
+    def test_approximate_count(self):
+        transactions = Transaction.objects.all()
+        self.assertEqual(approximate_count(transactions, cap=10), (5, False))
+        self.assertEqual(approximate_count(transactions, cap=5), (5, False))
+        self.assertEqual(approximate_count(transactions, cap=3), (3, True))
+        with self.settings(APPROXIMATE_COUNT_CAP=3):
+            body = self.client.get('/api/transactions/').json()
+        self.assertEqual((body['count'], body['count_is_estimate'], len(body['results'])), (3, True, 5))
+
+
+class ListingTests(TestCase):
+    """Keyset pagination walks every row once; the filter backend applies query-parameter filters."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='lister', user_type='paid')
+        Wallet.objects.create(owner=cls.user, balance=Decimal('0.00'))
+        Account.objects.create(owner=cls.user, account_type='savings', currency='USD', tier='tier2')
+        for i in range(7):
+            Transaction.objects.create(performed_by=cls.user, transaction_type='credit', currency='USD',
+                                       category='deposits', amount=Decimal('1.00'), transaction_id=f'list-{i}')
+        start = datetime.datetime(2026, 3, 1, 12, tzinfo=datetime.timezone.utc)
+        # Two pairs share a timestamp, so pages must break ties on id.
+        for i, day in enumerate((0, 0, 1, 2, 2, 3, 4)):
+            Transaction.objects.filter(transaction_id=f'list-{i}').update(date_created=start + datetime.timedelta(days=day))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def ids(self, **params):
+        response = self.client.get('/api/transactions/', params)
+        self.assertEqual(response.status_code, 200)
+        return [row['transaction_id'] for row in response.json()['results']]
+
+    def test_keyset_pages(self):
+        seen = []
+        body = self.client.get('/api/transactions/', {'page_size': 2}).json()
+        self.assertIsNone(body['previous'])
+        while True:
+            self.assertLessEqual(len(body['results']), 2)
+            seen += [row['transaction_id'] for row in body['results']]
+            if body['next'] is None:
+                break
+            with CaptureQueriesContext(connection) as captured:
+                body = self.client.get(body['next']).json()
+            # Later pages seek past the last (date_created, id) key.
+            self.assertTrue(any('"date_created" <' in query['sql'] for query in captured.captured_queries))
+        self.assertEqual(seen, ['list-6', 'list-5', 'list-4', 'list-3', 'list-2', 'list-1', 'list-0'])
+        self.assertEqual(self.ids(), seen)
+
+        back = self.client.get(self.client.get(self.client.get('/api/transactions/', {'page_size': 3})
+                                               .json()['next']).json()['previous']).json()
+        self.assertEqual([row['transaction_id'] for row in back['results']], seen[:3])
+
+    def test_tied_timestamps_seek_without_offset(self):
+        moment = datetime.datetime(2026, 4, 1, 12, tzinfo=datetime.timezone.utc)
+        for i in range(25):
+            Transaction.objects.create(performed_by=self.user, transaction_type='credit', currency='USD',
+                                       category='payments', amount=Decimal('1.00'), transaction_id=f'tied-{i}')
+        Transaction.objects.filter(category='payments').update(date_created=moment)
+        seen = []
+        url, params = '/api/transactions/', {'category': 'payments', 'page_size': 4}
+        while url is not None:
+            with CaptureQueriesContext(connection) as captured:
+                body = self.client.get(url, params).json()
+            self.assertFalse([query['sql'] for query in captured.captured_queries if 'OFFSET' in query['sql']])
+            seen += [row['transaction_id'] for row in body['results']]
+            url, params = body['next'], None
+        self.assertEqual(seen, [f'tied-{i}' for i in reversed(range(25))])
+
+        # Walking back from the last page returns the same rows.
+        previous = self.client.get(body['previous']).json()
+        self.assertEqual([row['transaction_id'] for row in previous['results']], seen[-5:-1])
+        self.assertEqual(self.client.get('/api/transactions/', {'cursor': 'cD1ub3QtanNvbg=='}).status_code, 404)
+
+    def test_filters(self):
+        self.assertEqual(self.ids(date_from='2026-03-03', date_to='2026-03-04'), ['list-5', 'list-4', 'list-3'])
+        self.assertEqual(self.ids(date_to='2026-03-01T12:00:00Z'), ['list-1', 'list-0'])
+        self.assertEqual(self.ids(category='payments'), [])
+        self.assertEqual(len(self.ids(performed_by=self.user.pk, currency='USD')), 7)
+        for params in ({'date_from': 'yesterday'}, {'performed_by': 'me'}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/transactions/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(next(iter(params)), response.json())
+
+    def test_values_serializer_matches_model_serializer(self):
+        Transaction.objects.filter(transaction_id='list-0').update(
+            amount=Decimal('12345.60'), date_created=datetime.datetime(2026, 3, 1, 12, 0, 0, 1, tzinfo=datetime.timezone.utc))
+        Transaction.objects.filter(transaction_id='list-1').update(amount=Decimal('-0.05'))
+        Wallet.objects.filter(owner=self.user).update(is_closed=True, date_closed=timezone.now())
+        renderer = JSONRenderer()
+        for serializer_class, queryset in ((TransactionSerializer, Transaction.objects.order_by('id')),
+                                           (WalletSerializer, Wallet.objects.order_by('id')),
+                                           (AccountSerializer, Account.objects.order_by('id'))):
+            for zone in ('UTC', 'Africa/Johannesburg'):
+                with self.subTest(serializer=serializer_class.__name__, zone=zone), timezone.override(zone):
+                    fast = ValuesSerializer.for_serializer(serializer_class)
+                    self.assertEqual(renderer.render(fast.to_representation(fast.values(queryset))),
+                                     renderer.render(serializer_class(queryset, many=True).data))
+
+
+@override_settings(FX_RATES=fx_settings())
+class LedgerCurrencyTests(TestCase):
+    """Wallets move by the amounts actually stored, and only in the account currency."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='ledger', user_type='paid')
+        Wallet.objects.create(owner=cls.user, balance=Decimal('0.00'))
+        Account.objects.create(owner=cls.user, account_type='savings', currency='ZAR', tier='tier2')
+
+    def setUp(self):
+        cache.clear()
+        get_rate_provider().clear()
+
+    def create(self, transaction_id, amount, currency='ZAR'):
+        return Transaction.objects.create(performed_by=self.user, transaction_type='credit', currency=currency,
+                                          category='deposits', amount=amount, transaction_id=transaction_id)
+
+    def balance(self):
+        return Wallet.objects.get(owner=self.user).balance
+
+    def test_unrounded_amounts(self):
+        for i, amount in enumerate((Decimal('1.005'), Decimal('1.015'), 1.015, '0.333333')):
+            txn = self.create(f'round-{i}', amount)
+            stored = Transaction.objects.get(pk=txn.pk).amount
+            self.assertEqual(txn.amount, stored)
+        self.assertEqual(self.balance(), Decimal('3.37'))
+        self.assertEqual(list(reconcile()), [])
+
+    def test_cross_currency_api_writes(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for i, currency in enumerate(('EUR', 'USD', 'GBP')):
+            response = client.post('/api/transactions/', {
+                'transaction_type': 'credit', 'currency': currency, 'category': 'deposits', 'amount': '10.01',
+                'transaction_id': f'api-{i}', 'performed_by': self.user.pk,
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.balance(), sum(Transaction.objects.values_list('amount', flat=True)))
+        self.assertEqual(list(reconcile()), [])
+
+    def test_html_view_converts(self):
+        self.client.force_login(self.user)
+        for _ in range(2):
+            response = self.client.post('/transaction/', {
+                'transaction_type': 'credit', 'currency': 'EUR', 'category': 'deposits', 'amount': '10.00',
+            })
+            self.assertEqual(response.status_code, 302)
+        # Each row the form saves gets its own transaction id.
+        first, second = Transaction.objects.filter(performed_by=self.user)
+        self.assertNotEqual(first.transaction_id, second.transaction_id)
+        self.assertEqual((first.currency, first.amount), ('ZAR', convert_currency(Decimal('10.00'), 'EUR', 'ZAR')))
+        self.assertEqual(self.balance(), first.amount + second.amount)
+
+    def test_balance_is_read_only(self):
+        self.create('zar', Decimal('5.00'))
+        client = APIClient()
+        client.force_authenticate(self.user)
+        wallet = Wallet.objects.get(owner=self.user)
+        response = client.patch(f'/api/wallets/{wallet.pk}/', {'balance': '999.00'}, format='json')
+        self.assertEqual((response.status_code, response.json()['balance']), (200, '5.00'))
+        self.assertNotIn('balance', WalletForm.base_fields)
+        self.assertEqual(list(reconcile()), [])
+
+        other = CustomUser.objects.create(username='new-wallet', user_type='paid')
+        client.force_authenticate(other)
+        response = client.post('/api/wallets/', {'owner': other.pk, 'balance': '999.00'}, format='json')
+        self.assertEqual((response.status_code, response.json()['balance']), (201, '0.00'))
+
+    def test_unique_id_migration_fills_blank_ids(self):
+        migration = importlib.import_module('API.migrations.0003_transaction_indexes')
+        txn = self.create('blank', Decimal('1.00'))
+        Transaction.objects.filter(pk=txn.pk).update(transaction_id='')
+        migration.check_duplicate_transaction_ids(django_apps, mock.Mock(connection=connection))
+        self.assertRegex(Transaction.objects.get(pk=txn.pk).transaction_id, r'^[0-9a-f]{32}$')
+
+    def test_other_currencies_refused(self):
+        txn = self.create('zar', Decimal('5.00'))
+        # Transaction.save rolls back to its own savepoint, so the surrounding transaction carries on.
+        with self.assertRaises(CurrencyConversionException):
+            self.create('eur', Decimal('5.00'), currency='EUR')
+        self.assertFalse(Transaction.objects.filter(transaction_id='eur').exists())
+
+        # Edits through model forms (the edit page and the admin) are refused before saving.
+        form = TransactionForm({'transaction_type': 'credit', 'currency': 'EUR', 'category': 'deposits', 'amount': '5.00'},
+                               instance=txn)
+        self.assertIn('currency', form.errors)
+        with self.assertRaises(CurrencyConversionException):
+            convert_transactions([txn.pk], 'EUR')
+        self.assertEqual(self.balance(), Decimal('5.00'))
+        self.assertEqual(list(reconcile()), [])
+
+
+class RollupTests(TestCase):
+    """refresh_rollups recomputes exactly the days whose transactions changed, whenever they were dated."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='roller', user_type='paid')
+        Wallet.objects.create(owner=cls.user, balance=Decimal('0.00'))
+        Account.objects.create(owner=cls.user, account_type='savings', currency='USD', tier='tier2')
+
+    def create(self, transaction_id, amount='10.00', **fields):
+        return Transaction.objects.create(performed_by=self.user, transaction_type='credit', currency='USD',
+                                          category='deposits', amount=Decimal(amount), transaction_id=transaction_id,
+                                          **fields)
+
+    def totals(self, when):
+        return TransactionDailyRollup.objects.filter(day=when.astimezone(datetime.timezone.utc).date()) \
+            .values_list('credit_total', 'transaction_count').first()
+
+    def test_changes_are_refreshed(self):
+        today = timezone.now()
+        txn = self.create('roll-0')
+        self.assertEqual(refresh_rollups(), 1)
+        self.assertEqual(self.totals(today), (Decimal('10.00'), 1))
+        self.assertEqual(refresh_rollups(), 0)
+
+        # Backdated rows, like imported ones, land on days refreshed long ago.
+        past = today - datetime.timedelta(days=10)
+        self.create('roll-1', date_created=past)
+        self.create('roll-2', amount='5.00')
+        self.assertEqual(refresh_rollups(chunk_size=1), 2)
+        self.assertEqual(self.totals(past), (Decimal('10.00'), 1))
+        self.assertEqual(self.totals(today), (Decimal('15.00'), 2))
+
+        txn.amount = Decimal('20.00')
+        txn.save()
+        Transaction.objects.get(transaction_id='roll-1').delete()
+        self.assertEqual(refresh_rollups(), 2)
+        self.assertEqual(self.totals(today), (Decimal('25.00'), 2))
+        self.assertIsNone(self.totals(past))
+
+    def test_bulk_writes_and_archived_rows(self):
+        past = timezone.now() - datetime.timedelta(days=400)
+        self.create('roll-old', date_created=past)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/transactions/bulk/', [
+            {'transaction_type': 'credit', 'currency': 'USD', 'category': 'deposits', 'amount': '1.00',
+             'transaction_id': f'roll-bulk-{i}'} for i in range(3)
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(refresh_rollups(), 2)
+        self.assertEqual(self.totals(timezone.now()), (Decimal('3.00'), 3))
+
+        # Archived rows still count once their day is recomputed.
+        self.assertEqual(archive_transactions(), 1)
+        rebuild_rollups(past.date() - datetime.timedelta(days=1), past.date() + datetime.timedelta(days=1))
+        self.assertEqual(self.totals(past), (Decimal('10.00'), 1))
+
+
+@override_settings(FX_RATES=fx_settings())
+class AsyncTransactionCreateTests(TestCase):
+    """POST /api/async/transactions/ behaves exactly like POST /api/transactions/."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='async', user_type='paid')
+        Wallet.objects.create(owner=cls.user, balance=Decimal('0.00'))
+        Account.objects.create(owner=cls.user, account_type='savings', currency='ZAR', tier='tier2')
+
+    def setUp(self):
+        cache.clear()
+        get_rate_provider().clear()
+        token = ClaimsTokenObtainPairSerializer.get_token(self.user).access_token
+        self.auth = {'Authorization': f'Bearer {token}'}
+
+    def payload(self, transaction_id, currency='EUR'):
+        return {'transaction_type': 'credit', 'currency': currency, 'category': 'deposits', 'amount': '10.00',
+                'transaction_id': transaction_id, 'performed_by': self.user.pk}
+
+    async def post(self, data, headers=None):
+        return await self.async_client.post('/api/async/transactions/', data, content_type='application/json',
+                                            headers=headers)
+
+    async def test_create(self):
+        # The token is decoded and the principal loaded once, for both the rate prefetch and the view.
+        with mock.patch('API.authentication.get_principal', wraps=get_principal) as load, \
+                mock.patch('API.authentication.check_token', wraps=check_token) as decode:
+            response = await self.post(self.payload('async-0'), headers=self.auth)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((load.call_count, decode.call_count), (1, 1))
+        expected = await sync_to_async(convert_currency)(Decimal('10.00'), 'EUR', 'ZAR')
+        self.assertEqual((response.json()['currency'], Decimal(response.json()['amount'])), ('ZAR', expected))
+        wallet = await Wallet.objects.aget(owner=self.user)
+        self.assertEqual(wallet.balance, expected)
+
+        response = await self.post(self.payload('async-0'), headers=self.auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('transaction_id', response.json())
+
+    async def test_idempotency_and_authentication(self):
+        response = await self.post(self.payload('async-1'))
+        self.assertEqual(response.status_code, 401)
+
+        first = await self.post(self.payload('async-1'), headers={**self.auth, 'Idempotency-Key': 'key-1'})
+        again = await self.post(self.payload('async-1'), headers={**self.auth, 'Idempotency-Key': 'key-1'})
+        self.assertEqual((first.status_code, again.status_code), (201, 201))
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+        self.assertEqual(await Transaction.objects.filter(transaction_id='async-1').acount(), 1)
+
+    async def test_unknown_currency(self):
+        response = await self.post(self.payload('async-2', currency='XYZ'), headers=self.auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(await Transaction.objects.filter(transaction_id='async-2').aexists())
+
+
+@override_settings(FX_RATES=fx_settings())
+class AsyncMiddlewareTests(TestCase):
+    """The project's middleware runs natively on async requests, and the principal cache holds no user rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='async-mw', user_type='paid', password='secret-hash')
+        Wallet.objects.create(owner=cls.user, balance=Decimal('0.00'))
+        cls.account = Account.objects.create(owner=cls.user, account_type='savings', currency='USD', tier='tier2')
+
+    def setUp(self):
+        cache.clear()
+        caches['shared'].clear()
+
+    def test_middleware_is_async_capable(self):
+        async def view(request):
+            return HttpResponse()
+
+        for middleware in (InstrumentationMiddleware, ReplicaRoutingMiddleware, PrincipalMiddleware):
+            with self.subTest(middleware=middleware.__name__):
+                self.assertTrue(iscoroutinefunction(middleware(view)))
+                self.assertFalse(iscoroutinefunction(middleware(lambda request: HttpResponse())))
+
+    async def test_async_request(self):
+        get_registry().counters.clear()
+        token = await sync_to_async(lambda: str(ClaimsTokenObtainPairSerializer.get_token(self.user).access_token))()
+        response = await self.async_client.post('/api/async/transactions/', {
+            'transaction_type': 'credit', 'currency': 'USD', 'category': 'deposits', 'amount': '1.00',
+            'transaction_id': 'async-mw-0', 'performed_by': self.user.pk,
+        }, content_type='application/json', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 201)
+        # Queries made in the worker thread are counted against the async view.
+        labels = 'view="transaction_create_async",method="POST"'
+        self.assertGreater(get_registry().counters[('api_db_calls_total', labels)], 0)
+        self.assertIn('primary_pin', response.cookies)
+        self.assertTrue(await caches['shared'].aget(pin_key(self.user.pk)))
+
+    @override_settings(PRINCIPAL_CACHE={'ALIAS': 'default', 'TTL': 30})
+    def test_principal_cache_holds_claims_only(self):
+        claims = get_principal_claims(self.user.pk)
+        self.assertEqual(claims, (self.user.pk, 'paid', self.account.pk, 'tier2', 'USD'))
+        cached = cache.get(principal_cache_key(self.user.pk))
+        self.assertEqual(cached, claims)
+        self.assertNotIn('secret-hash', repr(cached))
+
+        self.account.tier = 'tier3'
+        self.account.save()
+        self.assertEqual(get_principal_claims(self.user.pk).tier, 'tier3')
+
+
+class TokenClaimsTests(TestCase):
+    """Token claims follow the database on refresh, demotion and revocation."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='claims', user_type='paid')
+        Wallet.objects.create(owner=cls.user, balance=Decimal('0.00'))
+        account = Account.objects.create(owner=cls.user, account_type='savings', currency='USD', tier='tier2')
+        cls.account_url = f'/api/accounts/{account.pk}/'
+
+    def setUp(self):
+        cache.clear()
+        self.refresh = ClaimsTokenObtainPairSerializer.get_token(self.user)
+
+    def client_for(self, token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def demote(self):
+        self.user.user_type = 'free'
+        self.user.save()
+
+    def refreshed(self, refresh=None):
+        response = self.client.post('/api/token/refresh/', {'refresh': str(refresh or self.refresh)})
+        self.assertEqual(response.status_code, 200)
+        return AccessToken(response.json()['access'])
+
+    def test_principal_authentication_is_the_default(self):
+        client = self.client_for(self.refresh.access_token)
+        self.assertEqual(client.get(self.account_url).status_code, 200)
+        self.demote()
+        self.assertEqual(client.get(self.account_url).status_code, 404)
+
+    @mock.patch.object(APIView, 'authentication_classes', [StatelessJWTAuthentication])
+    def test_demoted_user_loses_stateless_claims(self):
+        client = self.client_for(self.refresh.access_token)
+        # Only the account itself is read; the user comes from the token.
+        with self.assertNumQueries(1):
+            self.assertEqual(client.get(self.account_url).status_code, 200)
+        self.demote()
+        self.assertEqual(client.get(self.account_url).status_code, 404)
+
+        # Access tokens refreshed from the old refresh token carry the new claims and are trusted again.
+        access = self.refreshed()
+        self.assertEqual(access['user_type'], 'free')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client_for(access).get(self.account_url).status_code, 404)
+
+    def test_refresh_reads_claims_from_the_database(self):
+        Account.objects.filter(owner=self.user).update(tier='tier3', currency='EUR')
+        access = self.refreshed()
+        self.assertEqual((access['tier'], access['currency']), ('tier3', 'EUR'))
+        self.assertEqual(access['refresh_jti'], self.refresh['jti'])
+
+        with mock.patch('rest_framework_simplejwt.serializers.api_settings.ROTATE_REFRESH_TOKENS', True):
+            response = self.client.post('/api/token/refresh/', {'refresh': str(self.refresh)})
+        rotated = RefreshToken(response.json()['refresh'])
+        self.assertNotEqual(rotated['jti'], self.refresh['jti'])
+        self.assertEqual((rotated['tier'], rotated['refresh_jti']), ('tier3', rotated['jti']))
+        self.assertEqual(AccessToken(response.json()['access'])['refresh_jti'], rotated['jti'])
+
+    def test_revoking_an_access_token_revokes_its_refresh_token(self):
+        access, sibling = self.refresh.access_token, self.refreshed()
+        response = self.client_for(access).post('/api/token/revoke/')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.client_for(access).get('/api/wallets/').status_code, 401)
+        self.assertEqual(self.client_for(sibling).get('/api/wallets/').status_code, 401)
+        response = self.client.post('/api/token/refresh/', {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, 401)
+
+        other = ClaimsTokenObtainPairSerializer.get_token(self.user)
+        self.assertEqual(self.client_for(other.access_token).get('/api/wallets/').status_code, 200)
+
+
+@override_settings(FX_RATES=fx_settings())
+class IdempotencyTests(TestCase):
+    """Idempotency-Key replays successes and validation errors, never failed conversions."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='idempotent', user_type='paid')
+        Wallet.objects.create(owner=cls.user, balance=Decimal('0.00'))
+        Account.objects.create(owner=cls.user, account_type='savings', currency='ZAR', tier='tier2')
+
+    def setUp(self):
+        cache.clear()
+        get_rate_provider().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.unavailable = CurrencyConversionException('Rate service unavailable.')
+
+    def item(self, transaction_id, amount='10.00'):
+        return {'transaction_type': 'credit', 'currency': 'EUR', 'category': 'deposits', 'amount': amount,
+                'transaction_id': transaction_id, 'performed_by': self.user.pk}
+
+    def post(self, url, data, key):
+        return self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_validation_errors_are_replayed(self):
+        first = self.post('/api/transactions/', self.item('idem-0', amount='not money'), 'key-0')
+        again = self.post('/api/transactions/', self.item('idem-0', amount='not money'), 'key-0')
+        self.assertEqual((first.status_code, again.status_code), (400, 400))
+        self.assertEqual(again.json(), first.json())
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+
+    def test_failed_conversion_is_not_replayed(self):
+        with mock.patch.object(RateProvider, 'get_rate', side_effect=self.unavailable):
+            response = self.post('/api/transactions/', self.item('idem-1'), 'key-1')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.post('/api/transactions/', self.item('idem-1'), 'key-1')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(self.post('/api/transactions/', self.item('idem-1'), 'key-1')['Idempotent-Replayed'], 'true')
+
+    def test_bulk_refused_for_failed_rates_is_not_replayed(self):
+        with mock.patch.object(RateProvider, 'get_rate', side_effect=self.unavailable):
+            response = self.post('/api/transactions/bulk/', [self.item('idem-2')], 'key-2')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [{'index': 0, 'errors': {'currency': ['Rate service unavailable.']}}])
+
+        response = self.post('/api/transactions/bulk/', [self.item('idem-2')], 'key-2')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    async def test_async_create_goes_through_idempotency(self):
+        token = await sync_to_async(lambda: str(ClaimsTokenObtainPairSerializer.get_token(self.user).access_token))()
+
+        async def post(key):
+            return await self.async_client.post('/api/async/transactions/', self.item('idem-3'), content_type='application/json',
+                                                headers={'Authorization': f'Bearer {token}', 'Idempotency-Key': key})
+
+        with mock.patch.object(RateProvider, 'get_rate', side_effect=self.unavailable), \
+                mock.patch.object(RateProvider, 'aget_rate', side_effect=self.unavailable):
+            response = await post('key-3')
+        self.assertEqual(response.status_code, 400)
+
+        first, again = await post('key-3'), await post('key-3')
+        self.assertEqual((first.status_code, again.status_code), (201, 201))
+        self.assertNotIn('Idempotent-Replayed', first)
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+        self.assertEqual(again.json(), first.json())
+        self.assertEqual(await Transaction.objects.filter(transaction_id='idem-3').acount(), 1)
+
+
+class ConditionalGetTests(TestCase):
+    """ETags change with the caller's own data and authorization, and match with 304 otherwise."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {}
+        for username in ('reader', 'other'):
+            user = CustomUser.objects.create(username=username, user_type='paid')
+            Wallet.objects.create(owner=user, balance=Decimal('0.00'))
+            Account.objects.create(owner=user, account_type='savings', currency='USD', tier='tier2')
+            cls.users[username] = user
+        cls.wallet_url = f"/api/wallets/{Wallet.objects.get(owner=cls.users['reader']).pk}/"
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        token = ClaimsTokenObtainPairSerializer.get_token(self.users['reader']).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def post(self, username, transaction_id):
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(performed_by=self.users[username], transaction_type='credit', currency='USD',
+                                       category='deposits', amount=Decimal('1.00'), transaction_id=transaction_id)
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_wallet_versions_are_per_owner(self):
+        etag = self.client.get(self.wallet_url)['ETag']
+        response = self.revalidate(self.wallet_url, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # Another user's transactions leave the reader's wallet version alone.
+        self.post('other', 'cond-0')
+        self.assertEqual(self.revalidate(self.wallet_url, etag).status_code, 304)
+
+        self.post('reader', 'cond-1')
+        response = self.revalidate(self.wallet_url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['balance'], '1.00')
+
+    @mock.patch.object(APIView, 'authentication_classes', [StatelessJWTAuthentication])
+    def test_revalidation_makes_no_queries(self):
+        etag = self.client.get(self.wallet_url)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.revalidate(self.wallet_url, etag).status_code, 304)
+
+    def test_malformed_pk_is_not_found(self):
+        self.assertEqual(self.client.get('/api/wallets/abc/').status_code, 404)
+
+    def test_demotion_changes_the_etag(self):
+        response = self.client.get('/api/accounts/')
+        self.assertEqual(len(response.json()['results']), 2)
+        etag = response['ETag']
+
+        self.users['reader'].user_type = 'free'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users['reader'].save()
+        response = self.revalidate('/api/accounts/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_tier_change_changes_the_etag(self):
+        etag = self.client.get(self.wallet_url)['ETag']
+        account = Account.objects.get(owner=self.users['reader'])
+        account.tier = 'tier3'
+        with self.captureOnCommitCallbacks(execute=True):
+            account.save()
+        self.assertEqual(self.revalidate(self.wallet_url, etag).status_code, 200)
+
+
+class BenchmarkTests(TestCase):
+    """The benchmark seeds through the real write path and compares runs with tolerances."""
+
+    def test_seed_keeps_the_ledger_consistent(self):
+        benchmark.seed(users=10, transactions=50, batch_size=20)
+        self.assertEqual(Transaction.objects.count(), 50)
+        self.assertEqual(list(reconcile()), [])
+        self.assertEqual(WalletBalanceSnapshot.objects.count(), 10)
+        self.assertEqual(TransactionDailyRollup.objects.aggregate(count=Sum('transaction_count'))['count'], 50)
+
+    def test_compare_scales_latency_and_allows_memory_slack(self):
+        def run(calibration, p50, memory, queries=2):
+            return {'calibration_ms': calibration, 'scenarios': {
+                'list': {'p50_ms': p50, 'p90_ms': p50, 'peak_memory_kb': memory, 'queries': queries},
+            }}
+
+        baseline = run(10, 4.0, 100.0)
+        # Twice as slow a machine: 8 ms is the baseline's 4 ms.
+        self.assertEqual(benchmark.compare(run(20, 8.0, 110.0), baseline, 0.25), [])
+        self.assertEqual(len(benchmark.compare(run(10, 8.0, 100.0), baseline, 0.25)), 2)
+        self.assertEqual(benchmark.compare(run(10, 4.0, 140.0), baseline, 0.25),
+                         ['list peak_memory_kb: 140.0 vs baseline 100.0'])
+        self.assertEqual(benchmark.compare(run(10, 4.0, 100.0, queries=3), baseline, 0.25),
+                         ['list queries: 3 vs baseline 2'])
+
+
+class InstrumentationTests(TestCase):
+    """Spans don't overlap, streamed bodies are measured, and /metrics/ is not public."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create(username='ops', user_type='admin', is_staff=True)
+        cls.user = CustomUser.objects.create(username='metrics-user', user_type='paid')
+        Wallet.objects.create(owner=cls.user, balance=Decimal('0.00'))
+        Account.objects.create(owner=cls.user, account_type='savings', currency='USD', tier='tier2')
+        for i in range(3):
+            Transaction.objects.create(performed_by=cls.user, transaction_type='credit', currency='USD',
+                                       category='deposits', amount=Decimal('1.00'), transaction_id=f'metrics-{i}')
+
+    def setUp(self):
+        cache.clear()
+        get_registry().counters.clear()
+
+    def test_metrics_need_staff_or_token(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get('/metrics/').status_code, 200)
+        self.client.logout()
+
+        with override_settings(INSTRUMENTATION={**settings.INSTRUMENTATION, 'METRICS_TOKEN': 'scrape-token'}):
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer scrape-token').status_code, 200)
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer guess').status_code, 403)
+            self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+    def test_nested_spans_are_not_counted_twice(self):
+        spans = RequestSpans()
+        token = current_spans.set(spans)
+        try:
+            with span('fx'):
+                with span('http'):
+                    time.sleep(0.05)
+                CustomUser.objects.count()
+        finally:
+            current_spans.reset(token)
+        self.assertGreaterEqual(spans.times['http'], 0.05)
+        self.assertLess(spans.times['fx'], 0.05)
+        self.assertEqual((spans.counts['fx'], spans.counts['http'], spans.counts['db']), (1, 1, 1))
+
+    def test_streamed_queries_are_counted(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        labels = 'view="transaction-export",method="GET"'
+        with override_settings(EXPORT_CHUNK_SIZE=1), CaptureQueriesContext(connection) as captured:
+            response = client.get('/api/transactions/export/')
+            self.assertNotIn(('api_db_calls_total', labels), get_registry().counters)
+            self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 3)
+        self.assertEqual(get_registry().counters[('api_db_calls_total', labels)], len(captured.captured_queries))
+
+
+class DatabaseProfileTests(SimpleTestCase):
+    """DB_PROFILE and DB_* variables pick and configure the database settings."""
+
+    base_dir = Path('/srv/app')
+
+    def test_plain_sqlite_is_the_default(self):
+        self.assertEqual(database_from_env(self.base_dir, environ={}), {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': self.base_dir / 'db.sqlite3',
+        })
+        self.assertEqual(database_from_env(self.base_dir, environ={'DB_PROFILE': ''})['NAME'], self.base_dir / 'db.sqlite3')
+
+    def test_tuned_sqlite(self):
+        database = database_from_env(self.base_dir, environ={
+            'DB_PROFILE': 'sqlite', 'DB_NAME': '/data/app.sqlite3', 'DB_BUSY_TIMEOUT': '2.5', 'DB_CONN_MAX_AGE': '0',
+        })
+        self.assertEqual((database['NAME'], database['CONN_MAX_AGE']), ('/data/app.sqlite3', 0))
+        self.assertEqual(database['OPTIONS']['timeout'], 2.5)
+        self.assertEqual(database['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertIn('PRAGMA busy_timeout=2500', database['OPTIONS']['init_command'])
+        with mock.patch('django.VERSION', (5, 0, 0, 'final', 0)):
+            with self.assertRaises(ImproperlyConfigured):
+                database_from_env(self.base_dir, environ={'DB_PROFILE': 'sqlite'})
+
+    def test_postgres(self):
+        environ = {'DB_PROFILE': 'postgres', 'DB_HOST': 'db', 'DB_PORT': '5433', 'DB_USER': 'api'}
+        database = database_from_env(self.base_dir, environ=environ)
+        self.assertEqual((database['ENGINE'], database['NAME'], database['HOST'], database['PORT'], database['USER']),
+                         ('django.db.backends.postgresql', 'jonproject', 'db', '5433', 'api'))
+        self.assertEqual((database['CONN_MAX_AGE'], database['OPTIONS']), (600, {'connect_timeout': 5}))
+        pooled = database_from_env(self.base_dir, environ={**environ, 'DB_POOL_MAX_SIZE': '8'})
+        self.assertEqual((pooled['CONN_MAX_AGE'], pooled['OPTIONS']['pool']['max_size']), (0, 8))
+
+        replicas = replicas_from_env(database, environ={'DB_REPLICAS': 'replica-a, replica-b:6432'})
+        self.assertEqual([(alias, replica['HOST'], replica['PORT']) for alias, replica in replicas.items()],
+                         [('replica1', 'replica-a', '5433'), ('replica2', 'replica-b', '6432')])
+
+    def test_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            database_from_env(self.base_dir, environ={'DB_PROFILE': 'mysql'})
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Safe requests read from a replica (a second SQLite file here) unless their
+    user just wrote or there is none; writes always go to the primary.
+    """
+    databases = {'default'}
+
+    def setUp(self):
+        caches['shared'].clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # A connection of its own rather than a test mirror of default, so the replica keeps its own rows.
+        database = connections.configure_settings({'default': {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(directory.name, 'replica.sqlite3'),
+        }})['default']
+        connections['replica'] = load_backend(database['ENGINE']).DatabaseWrapper(database, 'replica')
+        self.addCleanup(self.remove_replica)
+        with connections['replica'].schema_editor() as editor:
+            editor.create_model(CustomUser)
+        CustomUser.objects.using('replica').create(username='replica-only', user_type='paid')
+        self.user = CustomUser.objects.create(username='primary-only', user_type='paid')
+
+    def remove_replica(self):
+        connections['replica'].close()
+        del connections['replica']
+
+    def read(self, routing):
+        token = current_read_routing.set(routing)
+        try:
+            return sorted(CustomUser.objects.values_list('username', flat=True))
+        finally:
+            current_read_routing.reset(token)
+
+    @override_settings(REPLICA_ROUTING={**settings.REPLICA_ROUTING, 'REPLICAS': ['replica']})
+    def test_reads_use_the_replica_until_the_user_writes(self):
+        self.assertEqual(self.read(ReadRouting(self.user.pk)), ['replica-only'])
+        self.assertEqual(self.read(None), ['primary-only'])
+        self.assertEqual(self.read(ReadRouting(pinned=True)), ['primary-only'])
+
+        # A write by the user, answered through the middleware, pins their reads to the primary.
+        token = ClaimsTokenObtainPairSerializer.get_token(self.user).access_token
+        request = RequestFactory().post('/api/transactions/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = ReplicaRoutingMiddleware(lambda request: HttpResponse(status=201))(request)
+        self.assertIn('primary_pin', response.cookies)
+        self.assertTrue(caches['shared'].get(pin_key(self.user.pk)))
+        self.assertEqual(self.read(ReadRouting(self.user.pk)), ['primary-only'])
+        self.assertEqual(self.read(ReadRouting(self.user.pk + 1)), ['replica-only'])
+
+        # Writes made during a safe request still go to the primary.
+        token = current_read_routing.set(ReadRouting())
+        try:
+            CustomUser.objects.create(username='written', user_type='paid')
+        finally:
+            current_read_routing.reset(token)
+        self.assertTrue(CustomUser.objects.using('default').filter(username='written').exists())
+        self.assertFalse(CustomUser.objects.using('replica').filter(username='written').exists())
+
+    @override_settings(REPLICA_ROUTING={**settings.REPLICA_ROUTING, 'REPLICAS': ['replica']})
+    def test_streamed_bodies_read_from_the_replica(self):
+        def usernames():
+            yield from CustomUser.objects.values_list('username', flat=True).iterator()
+
+        async def ausernames():
+            for username in await sync_to_async(list)(CustomUser.objects.values_list('username', flat=True)):
+                yield username
+
+        request = RequestFactory().get('/api/transactions/export/')
+        response = ReplicaRoutingMiddleware(lambda request: StreamingHttpResponse(usernames()))(request)
+        self.assertEqual(b''.join(response.streaming_content), b'replica-only')
+
+        async def view(request):
+            return StreamingHttpResponse(ausernames())
+        response = async_to_sync(ReplicaRoutingMiddleware(view))(request)
+
+        async def consume():
+            return b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(async_to_sync(consume)(), b'replica-only')
+
+    @override_settings(REPLICA_ROUTING={**settings.REPLICA_ROUTING, 'REPLICAS': []})
+    def test_without_replicas_reads_use_the_primary(self):
+        self.assertEqual(self.read(ReadRouting(self.user.pk)), ['primary-only'])
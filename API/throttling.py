@@ -0,0 +1,130 @@
+import asyncio
+import functools
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+from .authentication import ClaimsUser
+from .principal import get_principal_claims
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+def throttle_cache():
+    return caches[settings.THROTTLING['CACHE']]
+
+@functools.lru_cache(maxsize=None)
+def parse_rate(rate, multiplier=1):
+    """
+    (capacity, microseconds per token) for a DRF-style 'count/period' rate
+    scaled by ``multiplier``: the bucket holds that many requests and refills
+    completely over the period.
+    """
+    count, period = rate.split('/')
+    capacity = int(count) * multiplier
+    return capacity, PERIODS[period[0]] * 1_000_000 // capacity
+
+def bucket_for(scope, request, user):
+    """
+    (cache key, rate) of the bucket ``request`` by ``user`` draws from in
+    ``scope``, or None if that user is not throttled there. Rates are looked
+    up by user type and scaled by the primary account's tier.
+    """
+    rates = settings.THROTTLING['RATES'].get(scope, {})
+    if user is None or not user.is_authenticated:
+        rate = rates.get('anon')
+        return (f'throttle:{scope}:ip:{BaseThrottle().get_ident(request)}', parse_rate(rate)) if rate else None
+    rate = rates.get(user.user_type)
+    if not rate:
+        return None
+    if isinstance(user, ClaimsUser):
+        tier = user.tier
+    else:
+        # Users authenticated by JWT come with their principal already loaded.
+        principal = getattr(user, 'principal', None)
+        tier = (principal if principal is not None else get_principal_claims(user.pk)).tier
+    return f'throttle:{scope}:user:{user.pk}', parse_rate(rate, settings.THROTTLING['TIER_MULTIPLIERS'].get(tier, 1))
+
+def take_token(scope, request, user=None):
+    """
+    Take a token from the caller's bucket in ``scope``. Returns 0 if the
+    request may proceed, else the seconds until the bucket holds a token again.
+
+    The bucket is kept as its theoretical arrival time (GCRA): the time, in
+    microseconds, at which it would be full again. Each request adds one
+    token's worth with an atomic incr, and is refused (and undone) if that
+    takes it more than a full bucket ahead of now. The key expires once the
+    bucket has refilled, so an idle caller starts over with a full bucket.
+    """
+    bucket = bucket_for(scope, request, request.user if user is None else user)
+    if bucket is None:
+        return 0
+    key, (capacity, interval) = bucket
+    cache = throttle_cache()
+    now = time.time_ns() // 1000
+    try:
+        arrival = cache.incr(key, interval)
+    except ValueError:
+        if cache.add(key, now + interval, math.ceil(interval / 1_000_000)):
+            return 0
+        arrival = cache.incr(key, interval)
+    if arrival - now > capacity * interval:
+        cache.decr(key, interval)
+        return (arrival - capacity * interval - now) / 1_000_000
+    cache.touch(key, math.ceil((arrival - now) / 1_000_000))
+    return 0
+
+def throttled_response(wait):
+    # The body DRF sends for a Throttled exception.
+    return JsonResponse({'detail': f'Request was throttled. Expected available in {math.ceil(wait)} seconds.'},
+                        status=429, headers={'Retry-After': str(math.ceil(wait))})
+
+def throttle(scope, methods=None):
+    """
+    Throttle a plain Django view (sync or async) in ``scope``, optionally
+    only for ``methods``, answering 429 with Retry-After when the bucket is empty.
+    """
+
+    def decorator(view):
+        def wait_for(request):
+            return take_token(scope, request) if methods is None or request.method in methods else 0
+
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                # request.user may still have to be loaded from the session.
+                wait = await sync_to_async(wait_for)(request)
+                return throttled_response(wait) if wait else await view(request, *args, **kwargs)
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                wait = wait_for(request)
+                return throttled_response(wait) if wait else view(request, *args, **kwargs)
+        return wrapper
+
+    return decorator
+
+class TokenBucketThrottle(BaseThrottle):
+    """Every API request draws from the caller's 'api' bucket."""
+    scope = 'api'
+
+    def get_scope(self, view):
+        return self.scope
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(view)
+        self.wait_seconds = take_token(scope, request) if scope else 0
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+class ScopedTokenBucketThrottle(TokenBucketThrottle):
+    """Expensive views and actions also draw from the bucket named by their ``throttle_scope``."""
+
+    def get_scope(self, view):
+        return getattr(view, 'throttle_scope', None)
@@ -1,31 +1,23 @@
-import requests
-from decimal import Decimal, InvalidOperation
-from rest_framework.exceptions import APIException
+from decimal import Decimal, ROUND_HALF_EVEN
 
-class CurrencyConversionException(APIException):
-    status_code = 400
-    default_detail = 'Currency conversion failed.'
-    default_code = 'currency_conversion_failed'
+from .exceptions import CurrencyConversionException
+from .instrumentation import span
+from .rates import get_rate_provider
+
+CENT = Decimal('0.01')
+# Transaction.amount holds ten digits, two of them decimal.
+MAX_AMOUNT = Decimal('99999999.99')
+
+def quantize_money(amount):
+    """``amount`` rounded half-even to cents, the precision every amount in this project is stored at."""
+    return amount.quantize(CENT, rounding=ROUND_HALF_EVEN)
 
 def convert_currency(amount, from_currency, to_currency):
-    api_key = 'cur_live_xq6rcxM9mxOAD0TsRifsOiqnbzpR8CsFt4WCtT9G'  
-    url = f"https://api.currencyapi.com/v3/latest?apikey={api_key}&base_currency={from_currency}&currencies={to_currency}"
-    try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an error for bad status codes
-        data = response.json()
-        
-        # Check if the response structure is as expected
-        if 'data' not in data or to_currency not in data['data']:
-            raise ValueError(f"Unexpected response structure: {data}")
-        
-        conversion_rate = Decimal(data['data'][to_currency]['value'])
-        return amount * conversion_rate
-    except requests.exceptions.RequestException as e:
-        raise CurrencyConversionException(detail=f"Request failed: {e}")
-    except KeyError as e:
-        raise CurrencyConversionException(detail=f"Key error in response data: {e}")
-    except InvalidOperation as e:
-        raise CurrencyConversionException(detail=f"Decimal conversion error: {e}")
-    except ValueError as e:
-        raise CurrencyConversionException(detail=f"Value error: {e}")
+    with span('fx'):
+        conversion_rate = get_rate_provider().get_rate(from_currency, to_currency)
+    return quantize_money(amount * conversion_rate)
+
+async def aconvert_currency(amount, from_currency, to_currency):
+    with span('fx'):
+        conversion_rate = await get_rate_provider().aget_rate(from_currency, to_currency)
+    return quantize_money(amount * conversion_rate)
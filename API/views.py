@@ -1,23 +1,44 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
-from rest_framework import viewsets, serializers
+from rest_framework import viewsets, serializers, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from rest_framework.permissions import IsAuthenticated
-from .models import Wallet, Account, Transaction
-from .serializers import WalletSerializer, AccountSerializer, TransactionSerializer
+from .models import Wallet, Account, Transaction, TransactionDailyRollup, AllTransaction
+from .serializers import WalletSerializer, AccountSerializer, TransactionSerializer, TransactionBulkSerializer, TransactionDailyRollupSerializer, ClaimsTokenObtainPairSerializer, ClaimsTokenRefreshSerializer, ValuesSerializer
 from .permissions import IsAdminUser, IsPaidUser, IsFreeUser, IsAccountant
-from .utils import convert_currency, CurrencyConversionException
+from .utils import convert_currency, aconvert_currency, CurrencyConversionException
 from .forms import CurrencyConversionForm, WalletForm, AccountForm, TransactionForm
+from .ingest import TIER1_TRANSACTION_LIMIT, prepare_transactions, insert_prepared
+from .parsers import NDJSONParser
+from .filters import TRANSACTION_FILTER_FIELDS
+from .archive import reaches_archive
+from .exports import EXPORT_FORMATS
+from .rates import get_rate_provider
+from .idempotency import idempotent
+from .conditional import conditional, detail
+from .throttling import throttle
 from django.utils import timezone
-from decimal import Decimal
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import AuthenticationFailed
+from .authentication import PreauthenticatedJWTAuthentication, PrincipalJWTAuthentication, revoke_token
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+import json
+from decimal import Decimal
+from uuid import uuid4
 
 # API Views
 class APIRootView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional()
     def get(self, request, *args, **kwargs):
         endpoints = {
             'Token Obtain Pair': reverse('token_obtain_pair', request=request),
@@ -25,18 +46,50 @@ class APIRootView(APIView):
             'Wallets': reverse('wallet-list', request=request),
             'Accounts': reverse('account-list', request=request),
             'Transactions': reverse('transaction-list', request=request),
+            'Daily rollups': reverse('transactiondailyrollup-list', request=request),
         }
         return render(request, 'api_root.html', {'endpoints': endpoints})
 
-class WalletViewSet(viewsets.ModelViewSet):
+class ClaimsTokenObtainPairView(TokenObtainPairView):
+    serializer_class = ClaimsTokenObtainPairSerializer
+
+class ClaimsTokenRefreshView(TokenRefreshView):
+    serializer_class = ClaimsTokenRefreshSerializer
+
+class TokenRevokeView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        revoke_token(request.auth)
+        return Response({'status': 'token revoked'})
+
+class ValuesListMixin:
+    """List from .values() rows through ValuesSerializer instead of building model instances."""
+
+    def list(self, request, *args, **kwargs):
+        fast = ValuesSerializer.for_serializer(self.get_serializer_class())
+        queryset = fast.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(fast.to_representation(page))
+        return Response(fast.to_representation(queryset))
+
+class WalletViewSet(ValuesListMixin, viewsets.ModelViewSet):
     queryset = Wallet.objects.all()
     serializer_class = WalletSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-date_opened', '-id')
+    filter_fields = ('owner',)
+    date_filter_field = 'date_opened'
+
+    @conditional(detail('wallet'))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         if Wallet.objects.filter(owner=self.request.user).exists():
             raise serializers.ValidationError("User already has a wallet.")
-        serializer.save(owner=self.request.user)
+        serializer.save(owner=self.request.user, balance=Decimal('0.00'))
 
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
     def close_wallet(self, request, pk=None):
@@ -46,10 +99,17 @@ class WalletViewSet(viewsets.ModelViewSet):
         wallet.save()
         return Response({'status': 'wallet closed'})
 
-class AccountViewSet(viewsets.ModelViewSet):
+class AccountViewSet(ValuesListMixin, viewsets.ModelViewSet):
     queryset = Account.objects.all()
     serializer_class = AccountSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-date_created', '-id')
+    filter_fields = ('owner', 'accountant', 'account_type', 'currency', 'tier')
+    date_filter_field = 'date_created'
+
+    @conditional('account')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         if not self.request.user.user_type == 'accountant':
@@ -61,25 +121,95 @@ class AccountViewSet(viewsets.ModelViewSet):
             return Account.objects.none()
         return super().get_queryset()
 
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(ValuesListMixin, viewsets.ModelViewSet):
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-date_created', '-id')
+    filter_fields = TRANSACTION_FILTER_FIELDS
+    date_filter_field = 'date_created'
+    # Set per action for API.throttling.ScopedTokenBucketThrottle.
+    throttle_scope = None
+
+    def get_queryset(self):
+        # Listings whose date range starts before the archive cutoff read through the hot+archive view.
+        if self.action in ('list', 'export') and reaches_archive(self.request.query_params):
+            return AllTransaction.objects.all()
+        return super().get_queryset()
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         amount = serializer.validated_data['amount']
         currency = serializer.validated_data['currency']
         user = self.request.user
+        if user.account is None:
+            raise serializers.ValidationError("User has no account to post transactions to.")
 
         if currency != user.account.currency:
             amount = convert_currency(amount, currency, user.account.currency)
             currency = user.account.currency
 
-        if user.account.tier == 'tier1' and amount > Decimal('10000.00'):
+        if user.account.tier == 'tier1' and amount > TIER1_TRANSACTION_LIMIT:
             raise serializers.ValidationError("Tier1 users can't make transactions more than 10000.")
 
         serializer.save(performed_by=user, amount=amount, currency=currency)
 
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser], throttle_scope='bulk')
+    @idempotent
+    def bulk(self, request):
+        account = request.user.account
+        if account is None:
+            raise serializers.ValidationError("User has no account to post transactions to.")
+
+        serializer = TransactionBulkSerializer(data=request.data, max_length=settings.BULK_TRANSACTION_MAX_ITEMS)
+        serializer.is_valid(raise_exception=True)
+        prepared, errors = prepare_transactions(serializer.validated_data, request.user, account)
+        errors.update(serializer.item_errors)
+
+        created = insert_prepared(prepared, errors)
+        response = Response({
+            'created': [{'index': index, 'id': txn.pk} for index, txn in created],
+            'errors': [{'index': index, 'errors': errors[index]} for index in sorted(errors)],
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+        # Items refused because a rate could not be fetched may succeed when retried.
+        response.transient = any(
+            getattr(error, 'code', None) == CurrencyConversionException.default_code
+            for item_errors in errors.values() for error in item_errors.get('currency', ())
+        )
+        return response
+
+    @action(detail=False, methods=['get'], throttle_scope='export')
+    def export(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            raise serializers.ValidationError({'output': [f"Choose one of: {', '.join(EXPORT_FORMATS)}."]})
+        content_type, stream = EXPORT_FORMATS[output]
+        queryset = self.filter_queryset(self.get_queryset()).order_by('date_created', 'id')
+        response = StreamingHttpResponse(stream(queryset), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="transactions.{output}"'
+        return response
+
+class TransactionDailyRollupViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = TransactionDailyRollup.objects.all()
+    serializer_class = TransactionDailyRollupSerializer
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-day', '-id')
+    filter_fields = ('performed_by', 'category', 'currency')
+    date_filter_field = 'day'
+
+    def get_serializer(self, *args, **kwargs):
+        normalize_to = self.request.query_params.get('normalize_to')
+        if normalize_to and args:
+            # One rate lookup per distinct currency on the page, not per row.
+            rollups = args[0] if isinstance(args[0], list) else [args[0]]
+            rates = get_rate_provider().get_rates((rollup.currency, normalize_to) for rollup in rollups)
+            kwargs['context'] = {**self.get_serializer_context(), 'normalize_to': normalize_to, 'rates': rates}
+        return super().get_serializer(*args, **kwargs)
+
+@throttle('conversion', methods=('POST',))
 def currency_conversion_view(request):
     form = CurrencyConversionForm(request.POST or None)
     
@@ -111,34 +241,75 @@ def currency_conversion_result_view(request):
         'converted_amount': converted_amount
     })
 
+# Async views. Under ASGI these wait on FX lookups without holding a worker thread.
+@throttle('conversion', methods=('POST',))
+async def currency_conversion_async_view(request):
+    form = CurrencyConversionForm(request.POST or None)
+
+    if request.method == 'POST' and form.is_valid():
+        amount = form.cleaned_data['amount']
+        from_currency = form.cleaned_data['from_currency']
+        to_currency = form.cleaned_data['to_currency']
+        try:
+            converted_amount = await aconvert_currency(amount, from_currency, to_currency)
+            return redirect(reverse('currency_conversion_result') + f'?amount={amount}&from_currency={from_currency}&to_currency={to_currency}&converted_amount={converted_amount}')
+        except CurrencyConversionException as e:
+            return render(request, 'currency_conversion.html', {
+                'form': form,
+                'error': str(e.detail)
+            })
+
+    return render(request, 'currency_conversion.html', {'form': form})
+
+# Reuses the authentication prefetch_rate already did.
+transaction_create_view = TransactionViewSet.as_view(
+    {'post': 'create'}, authentication_classes=[PreauthenticatedJWTAuthentication])
+
+async def prefetch_rate(request):
+    # The user and token are kept as request.jwt_auth for the view; errors are
+    # left for the view to report in its usual format.
+    try:
+        request.jwt_auth = await sync_to_async(PrincipalJWTAuthentication().authenticate)(request)
+        currency = json.loads(request.body).get('currency')
+    except (AuthenticationFailed, ValueError, AttributeError):
+        return
+    account = request.jwt_auth[0].principal.account if request.jwt_auth is not None else None
+    if account is not None and isinstance(currency, str) and currency != account.currency:
+        try:
+            await get_rate_provider().aget_rate(currency, account.currency)
+        except CurrencyConversionException:
+            pass
+
+@csrf_exempt
+@require_POST
+async def transaction_create_async_view(request):
+    """
+    POST /api/transactions/ for ASGI deployments. The exchange rate a
+    cross-currency create needs is fetched on the event loop; the create
+    itself then runs TransactionViewSet in a worker thread, with the same
+    authentication, permissions, throttling and idempotency.
+    """
+    await prefetch_rate(request)
+    return await sync_to_async(transaction_create_view)(request)
+
 # Front-end Views
 def home_view(request):
     return render(request, 'home.html')
 
 def wallet_view(request):
-    wallets = Wallet.objects.all()
+    wallets = Wallet.objects.select_related('owner').only('balance', 'date_opened', 'owner__username')
     if request.method == 'POST':
         form = WalletForm(request.POST)
         if form.is_valid():
             wallet = form.save(commit=False)
             wallet.owner = request.user
+            wallet.balance = Decimal('0.00')
             wallet.save()
             return redirect('wallet')
     else:
         form = WalletForm()
     return render(request, 'wallet.html', {'wallets': wallets, 'form': form})
 
-def wallet_edit_view(request, pk):
-    wallet = get_object_or_404(Wallet, pk=pk)
-    if request.method == 'POST':
-        form = WalletForm(request.POST, instance=wallet)
-        if form.is_valid():
-            form.save()
-            return redirect('wallet')
-    else:
-        form = WalletForm(instance=wallet)
-    return render(request, 'wallet_edit.html', {'form': form, 'wallet': wallet})
-
 def wallet_delete_view(request, pk):
     wallet = get_object_or_404(Wallet, pk=pk)
     if request.method == 'POST':
@@ -147,7 +318,7 @@ def wallet_delete_view(request, pk):
     return render(request, 'wallet_delete.html', {'wallet': wallet})
 
 def account_view(request):
-    accounts = Account.objects.all()
+    accounts = Account.objects.select_related('owner').only('account_type', 'currency', 'tier', 'owner__username')
     if request.method == 'POST':
         form = AccountForm(request.POST)
         if form.is_valid():
@@ -178,14 +349,29 @@ def account_delete_view(request, pk):
     return render(request, 'account_delete.html', {'account': account})
 
 def transaction_view(request):
-    transactions = Transaction.objects.all()
+    transactions = Transaction.objects.select_related('performed_by').only(
+        'transaction_type', 'currency', 'category', 'amount', 'date_created', 'performed_by__username',
+    )
     if request.method == 'POST':
         form = TransactionForm(request.POST)
         if form.is_valid():
             transaction = form.save(commit=False)
             transaction.performed_by = request.user
-            transaction.save()
-            return redirect('transaction')
+            # The form doesn't ask for a transaction id; the column is unique.
+            transaction.transaction_id = uuid4().hex
+            # Posted to the wallet in the account currency, as the API does.
+            account = request.user.account
+            if account is None:
+                form.add_error(None, "User has no account to post transactions to.")
+            elif transaction.currency != account.currency:
+                try:
+                    transaction.amount = convert_currency(transaction.amount, transaction.currency, account.currency)
+                    transaction.currency = account.currency
+                except CurrencyConversionException as e:
+                    form.add_error('currency', str(e.detail))
+            if form.is_valid():
+                transaction.save()
+                return redirect('transaction')
     else:
         form = TransactionForm()
     return render(request, 'transaction.html', {'transactions': transactions, 'form': form})
@@ -0,0 +1,133 @@
+"""
+Database profiles for settings.DATABASES, chosen with the DB_PROFILE
+environment variable:
+
+- ``sqlite-default`` (default): the project's SQLite file with SQLite's and
+  Django's defaults.
+- ``sqlite``: the same file tuned for several workers. WAL journal,
+  synchronous=NORMAL, a busy timeout, memory-mapped reads, IMMEDIATE write
+  transactions and persistent connections. Needs Django 5.1+ for
+  ``init_command`` and ``transaction_mode``.
+- ``postgres``: PostgreSQL with persistent, health-checked connections, or
+  a psycopg connection pool when DB_POOL_MAX_SIZE is set.
+
+DB_REPLICAS lists read replicas, comma-separated: SQLite file paths (``self``
+opens the primary file read-only, for trying the routing locally) or
+PostgreSQL hosts as host[:port].
+"""
+import os
+
+import django
+from django.core.exceptions import ImproperlyConfigured
+
+PROFILES = ('sqlite-default', 'sqlite', 'postgres')
+
+def env(name, default=None, cast=str, environ=None):
+    value = (os.environ if environ is None else environ).get(name)
+    return default if value in (None, '') else cast(value)
+
+def sqlite_default_profile(name):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+    }
+
+def sqlite_profile(name, conn_max_age=600, busy_timeout=20, mmap_size=256 * 1024 * 1024):
+    if django.VERSION < (5, 1):
+        raise ImproperlyConfigured("DB_PROFILE 'sqlite' needs Django 5.1 or later; use 'sqlite-default'.")
+    pragmas = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(busy_timeout * 1000),
+        'mmap_size': mmap_size,
+        'temp_store': 'MEMORY',
+    }
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'CONN_MAX_AGE': conn_max_age,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': busy_timeout,
+            # Take the write lock when the transaction starts: a deferred transaction
+            # that later writes can fail with "database is locked" without waiting.
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(f'PRAGMA {pragma}={value}' for pragma, value in pragmas.items()),
+        },
+    }
+
+def sqlite_replica_profile(name, conn_max_age=600, busy_timeout=20, mmap_size=256 * 1024 * 1024):
+    # Opened read-only, so a write routed here by mistake fails loudly.
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{name}?mode=ro',
+        'CONN_MAX_AGE': conn_max_age,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': busy_timeout,
+            'init_command': f'PRAGMA mmap_size={mmap_size}',
+        },
+    }
+
+def postgres_profile(name, user='', password='', host='', port='', conn_max_age=600, connect_timeout=5,
+                     pool_max_size=None):
+    options = {'connect_timeout': connect_timeout}
+    if pool_max_size:
+        # The pool owns connection reuse, so Django must not keep its own.
+        options['pool'] = {'min_size': 1, 'max_size': pool_max_size}
+        conn_max_age = 0
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': name,
+        'USER': user,
+        'PASSWORD': password,
+        'HOST': host,
+        'PORT': port,
+        'CONN_MAX_AGE': conn_max_age,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': options,
+    }
+
+def database_from_env(base_dir, profile=None, environ=None):
+    """The ``default`` database settings for DB_PROFILE (or ``profile``), configured from DB_* variables."""
+    profile = profile or env('DB_PROFILE', 'sqlite-default', environ=environ)
+    conn_max_age = env('DB_CONN_MAX_AGE', 600, int, environ)
+    if profile == 'sqlite':
+        return sqlite_profile(
+            env('DB_NAME', base_dir / 'db.sqlite3', environ=environ),
+            conn_max_age=conn_max_age,
+            busy_timeout=env('DB_BUSY_TIMEOUT', 20, float, environ),
+            mmap_size=env('DB_MMAP_SIZE', 256 * 1024 * 1024, int, environ),
+        )
+    if profile == 'sqlite-default':
+        return sqlite_default_profile(env('DB_NAME', base_dir / 'db.sqlite3', environ=environ))
+    if profile == 'postgres':
+        return postgres_profile(
+            env('DB_NAME', 'jonproject', environ=environ),
+            user=env('DB_USER', '', environ=environ),
+            password=env('DB_PASSWORD', '', environ=environ),
+            host=env('DB_HOST', '', environ=environ),
+            port=env('DB_PORT', '', environ=environ),
+            conn_max_age=conn_max_age,
+            connect_timeout=env('DB_CONNECT_TIMEOUT', 5, int, environ),
+            pool_max_size=env('DB_POOL_MAX_SIZE', None, int, environ),
+        )
+    raise ValueError(f"Unknown DB_PROFILE {profile!r}; choose one of {', '.join(PROFILES)}.")
+
+def replicas_from_env(default, environ=None):
+    """
+    {alias: settings} for the DB_REPLICAS of the ``default`` database, named
+    replica1, replica2, ... Tests run them as mirrors of ``default``.
+    """
+    replicas = {}
+    entries = [entry.strip() for entry in env('DB_REPLICAS', '', environ=environ).split(',') if entry.strip()]
+    for index, entry in enumerate(entries, start=1):
+        if default['ENGINE'].endswith('sqlite3'):
+            name = default['NAME'] if entry == 'self' else entry
+            replica = sqlite_replica_profile(name, conn_max_age=default.get('CONN_MAX_AGE', 0))
+        else:
+            host, _, port = entry.partition(':')
+            replica = {**default, 'HOST': host, 'PORT': port or default['PORT']}
+        replica['TEST'] = {'MIRROR': 'default'}
+        replicas[f'replica{index}'] = replica
+    return replicas
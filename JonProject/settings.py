@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 import os
 from pathlib import Path
 
+from .databases import database_from_env, replicas_from_env
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,11 +46,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'API.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'API.middleware.ReplicaRoutingMiddleware',
+    'API.middleware.PrincipalMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -77,11 +82,46 @@ WSGI_APPLICATION = 'JonProject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Pick a profile with DB_PROFILE (sqlite-default, the default, sqlite or
+# postgres) and configure it with DB_* variables; see JonProject/databases.py.
+
 DATABASES = {
+    'default': database_from_env(BASE_DIR),
+}
+DATABASES.update(replicas_from_env(DATABASES['default']))
+
+DATABASE_ROUTERS = ['API.routers.ReplicaRouter']
+
+# Caches
+# https://docs.djangoproject.com/en/5.0/ref/settings/#caches
+
+# 'shared' holds state every worker must see (replica pins, throttling
+# buckets): Redis at CACHE_REDIS_URL. Without it a local memory cache stands
+# in, which is only correct with a single worker process.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['CACHE_REDIS_URL'],
+    } if os.environ.get('CACHE_REDIS_URL') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared',
+    },
+}
+
+# Reads of safe requests go to a random replica. After a write the client
+# reads from the primary for STICKY_SECONDS so it sees its own writes: browsers
+# through the PIN_COOKIE cookie, token clients through the CACHE alias, which
+# must be shared by all workers.
+
+REPLICA_ROUTING = {
+    'REPLICAS': [alias for alias in DATABASES if alias != 'default'],
+    'STICKY_SECONDS': 10,
+    'PIN_COOKIE': 'primary_pin',
+    'CACHE': 'shared',
 }
 
 
@@ -128,16 +168,181 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'API.authentication.PrincipalJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'API.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'API.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
+    'DEFAULT_FILTER_BACKENDS': (
+        'API.filters.QueryParamFilterBackend',
+    ),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'API.throttling.TokenBucketThrottle',
+        'API.throttling.ScopedTokenBucketThrottle',
+    ),
 }
 
+# List responses report an exact count only up to this many rows (PostgreSQL
+# uses the planner estimate instead).
+
+APPROXIMATE_COUNT_CAP = 10000
+
 SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Authenticated requests load the user and their primary account once (see
+# API.principal). Set ALIAS to a CACHES alias to share the user type, tier and
+# account ids that throttling reads between requests for TTL seconds; they are
+# invalidated when the user or an account is saved. User rows are never cached.
+
+PRINCIPAL_CACHE = {
+    'ALIAS': None,
+    'TTL': 30,
+}
+
+# Revoked token ids and claim changes are kept in this cache; use a shared
+# backend when running several workers. Setting DEFAULT_AUTHENTICATION_CLASSES
+# to API.authentication.StatelessJWTAuthentication serves read requests from
+# the user_type, tier and currency claims issued by /api/token/ without loading
+# the user; tokens issued before the user's account last changed fall back to
+# loading it.
+
+JWT_REVOCATION_CACHE = 'default'
+
 AUTH_USER_MODEL = 'API.CustomUser'
 
+
+# Currency conversion rates
+# Request handlers read rates from the ExchangeRate snapshot table, which the
+# `refresh_rates` management command keeps current from the upstream
+# (run it with --interval as a background worker).
+# TTL is how long a loaded rate is served from memory; MAX_STALE is how long
+# an expired rate may still be served while its source is failing.
+# SHARED_CACHE names a CACHES alias used to share loaded rates between workers.
+# refresh_rates deletes snapshots older than SNAPSHOT_RETENTION_DAYS (None keeps
+# them all), except the latest one of each base.
+# Set FX_FIXTURE to a {base: {quote: rate}} JSON file to use it as the upstream
+# instead of calling currencyapi.com (e.g. for load tests); otherwise the
+# currencyapi.com key is read from CURRENCY_API_KEY.
+
+if os.environ.get('FX_FIXTURE'):
+    FX_UPSTREAM = 'API.rate_clients.FixtureBackend'
+    FX_UPSTREAM_OPTIONS = {'path': os.environ['FX_FIXTURE']}
+else:
+    FX_UPSTREAM = 'API.rate_clients.CurrencyAPIBackend'
+    FX_UPSTREAM_OPTIONS = {
+        'api_key': os.environ.get('CURRENCY_API_KEY', ''),
+        'pool_size': 10,
+        'connect_timeout': 3.05,
+        'read_timeout': 5,
+        'max_retries': 2,
+        'backoff_factor': 0.2,
+        'failure_threshold': 5,
+        'reset_timeout': 30,
+    }
+
+FX_RATES = {
+    'BACKEND': 'API.rate_clients.SnapshotBackend',
+    'BACKEND_OPTIONS': {'fallback_to_upstream': True},
+    'UPSTREAM': FX_UPSTREAM,
+    'UPSTREAM_OPTIONS': FX_UPSTREAM_OPTIONS,
+    'REFRESH_BASES': ['USD'],
+    'SNAPSHOT_RETENTION_DAYS': 90,
+    'TTL': 300,
+    'MAX_STALE': 3600,
+    'MAX_ENTRIES': 4096,
+    'PIVOT_CURRENCY': 'USD',
+    'SHARED_CACHE': None,
+}
+
+# Bulk transaction ingestion (POST /api/transactions/bulk/)
+
+BULK_TRANSACTION_MAX_ITEMS = 10000
+BULK_CREATE_BATCH_SIZE = 500
+
+# Rows fetched per round trip when streaming transaction exports
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Records validated and written per checkpointed chunk by import_transactions
+
+IMPORT_CHUNK_SIZE = 5000
+
+# Daily transaction rollups (see the refresh_rollups command). Days marked by
+# transaction writes are recomputed ROLLUP_CHUNK_SIZE days per database transaction.
+
+ROLLUP_CHUNK_SIZE = 31
+
+# Transaction archive (see the archive_transactions command). Transactions
+# older than HORIZON_DAYS move to the archive table CHUNK_SIZE at a time;
+# transaction listings read it only when date_from/date_to reach past the cutoff.
+
+TRANSACTION_ARCHIVE = {
+    'HORIZON_DAYS': 365,
+    'CHUNK_SIZE': 1000,
+}
+
+# Admin "Convert selected transactions" action (API.conversions). Rows are
+# converted CONVERSION_CHUNK_SIZE at a time; selections larger than
+# CONVERSION_SYNC_LIMIT are queued for the run_conversion_jobs worker.
+
+CONVERSION_CHUNK_SIZE = 500
+CONVERSION_SYNC_LIMIT = 1000
+
+# Idempotency-Key handling for transaction submission. Stored responses are
+# replayed for TTL seconds; use a shared CACHES alias with several workers.
+
+IDEMPOTENCY = {
+    'CACHE': 'default',
+    'TTL': 24 * 60 * 60,
+    'LOCK_TIMEOUT': 30,
+}
+
+# Token-bucket request throttling (API.throttling). Every API request draws
+# from the caller's 'api' bucket; currency conversion, bulk submission and
+# export also draw from their own. RATES are 'count/period' per user type
+# ('anon' for unauthenticated callers): the bucket holds count requests and
+# refills over the period. A missing or None rate is unthrottled.
+# TIER_MULTIPLIERS scale a user's buckets by their primary account's tier.
+# CACHE must support atomic incr and be shared by all workers; check --deploy
+# fails while it is a local memory cache, which only throttles per process.
+
+THROTTLING = {
+    'CACHE': 'shared',
+    'RATES': {
+        'api': {'anon': '60/min', 'free': '120/min', 'paid': '600/min', 'accountant': '1200/min', 'admin': None},
+        'conversion': {'anon': '10/min', 'free': '20/min', 'paid': '120/min', 'accountant': '240/min', 'admin': None},
+        'bulk': {'free': '5/min', 'paid': '30/min', 'accountant': '60/min', 'admin': None},
+        'export': {'free': '2/min', 'paid': '10/min', 'accountant': '30/min', 'admin': None},
+    },
+    'TIER_MULTIPLIERS': {'tier1': 1, 'tier2': 2, 'tier3': 4},
+}
+
+# Cached payloads and resource version counters for conditional GETs
+# (API.conditional). Versions must live in a cache shared by all workers.
+
+CONDITIONAL_CACHE = {
+    'ALIAS': 'default',
+    'TTL': 300,
+}
+
+# Per-request DB/HTTP/FX/serializer timing (API.instrumentation), served in
+# Prometheus format at /metrics/. Requests slower than SLOW_REQUEST_SECONDS
+# are logged with their slowest queries, sampled at SLOW_REQUEST_SAMPLE_RATE.
+# Staff users can read them; scrapers send "Authorization: Bearer <METRICS_TOKEN>".
+# With no METRICS_TOKEN only staff can.
+
+INSTRUMENTATION = {
+    'ENABLED': True,
+    'SLOW_REQUEST_SECONDS': 1.0,
+    'SLOW_REQUEST_SAMPLE_RATE': 0.1,
+    'SLOW_REQUEST_TOP_QUERIES': 5,
+    'METRICS_TOKEN': os.environ.get('METRICS_TOKEN'),
+}
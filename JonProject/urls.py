@@ -1,23 +1,26 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from API.views import WalletViewSet, AccountViewSet, TransactionViewSet, APIRootView, currency_conversion_view, currency_conversion_result_view, home_view, wallet_view, wallet_edit_view, wallet_delete_view, account_view, account_edit_view, account_delete_view, transaction_view, transaction_edit_view, transaction_delete_view
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from API.views import ClaimsTokenObtainPairView, ClaimsTokenRefreshView, TokenRevokeView, WalletViewSet, AccountViewSet, TransactionViewSet, TransactionDailyRollupViewSet, APIRootView, currency_conversion_view, currency_conversion_result_view, currency_conversion_async_view, transaction_create_async_view, home_view, wallet_view, wallet_delete_view, account_view, account_edit_view, account_delete_view, transaction_view, transaction_edit_view, transaction_delete_view
+from API.instrumentation import metrics_view
 
 router = DefaultRouter()
 router.register(r'wallets', WalletViewSet)
 router.register(r'accounts', AccountViewSet)
 router.register(r'transactions', TransactionViewSet)
+router.register(r'rollups', TransactionDailyRollupViewSet)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics/', metrics_view, name='metrics'),
     path('api/', include(router.urls)),
     path('api/auth/', include('rest_framework.urls')),
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/', ClaimsTokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/refresh/', ClaimsTokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/revoke/', TokenRevokeView.as_view(), name='token_revoke'),
+    path('api/async/transactions/', transaction_create_async_view, name='transaction_create_async'),
     path('', home_view, name='home'),
     path('wallet/', wallet_view, name='wallet'),
-    path('wallet/edit/<int:pk>/', wallet_edit_view, name='wallet_edit'),
     path('wallet/delete/<int:pk>/', wallet_delete_view, name='wallet_delete'),
     path('account/', account_view, name='account'),
     path('account/edit/<int:pk>/', account_edit_view, name='account_edit'),
@@ -26,5 +29,6 @@ urlpatterns = [
     path('transaction/edit/<int:pk>/', transaction_edit_view, name='transaction_edit'),
     path('transaction/delete/<int:pk>/', transaction_delete_view, name='transaction_delete'),
     path('currency-conversion/', currency_conversion_view, name='currency_conversion'),
+    path('async/currency-conversion/', currency_conversion_async_view, name='currency_conversion_async'),
     path('currency-conversion-result/', currency_conversion_result_view, name='currency_conversion_result'),
 ]